@@ -0,0 +1,115 @@
+""" Panoptes - Benchmarks - Startup
+
+Measures how long importing the CLI takes and checks that no heavy
+dependency is loaded before Click parses the command line. Exits with a
+non-zero status when the startup budget is exceeded.
+
+Usage:
+    python benchmarks/startup.py [--runs N] [--budget-ms MS]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+DEFAULT_RUNS = 15
+DEFAULT_BUDGET_MS = 100.0
+LAZY_MODULES = [
+    'boto3',
+    'botocore',
+    'colorama',
+    'dateutil',
+    'jinja2',
+    'pkg_resources',
+    'yaml',
+]
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = """
+import sys, time
+started_at = time.perf_counter()
+import panoptes.panoptesctl
+elapsed = time.perf_counter() - started_at
+print(elapsed)
+print(",".join(name for name in sys.argv[1:] if name in sys.modules))
+"""
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    """
+    Runs a fresh interpreter from the repository root
+    """
+    environment = dict(os.environ, PYTHONPATH=REPOSITORY_ROOT)
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=REPOSITORY_ROOT,
+        env=environment,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+
+def measure_import(runs: int) -> tuple:
+    """
+    Returns the import times in milliseconds of panoptes.panoptesctl and the
+    heavy modules loaded by it
+    """
+    timings = []
+    loaded_modules = set()
+    for _ in range(runs):
+        elapsed, modules = run_python("-c", IMPORT_PROBE, *LAZY_MODULES).stdout.splitlines()
+        timings.append(float(elapsed) * 1000)
+        loaded_modules.update(filter(None, modules.split(",")))
+    return timings, sorted(loaded_modules)
+
+
+def profile_import() -> list:
+    """
+    Returns the 10 slowest imports reported by python -X importtime as
+    (cumulative microseconds, module) tuples
+    """
+    report = run_python("-X", "importtime", "-c", "import panoptes.panoptesctl").stderr
+    imports = []
+    for line in report.splitlines():
+        fields = line.split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        imports.append((int(fields[1]), fields[2].strip()))
+    return sorted(imports, reverse=True)[:10]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS)
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    arguments = parser.parse_args()
+
+    timings, loaded_modules = measure_import(arguments.runs)
+    median = statistics.median(timings)
+
+    print("Slowest imports (cumulative):")
+    for cumulative, module in profile_import():
+        print(f"    {cumulative / 1000:8.1f} ms  {module}")
+    print(f"import panoptes.panoptesctl: median {median:.1f} ms, "
+          f"min {min(timings):.1f} ms, max {max(timings):.1f} ms "
+          f"over {arguments.runs} runs (budget {arguments.budget_ms:.0f} ms)")
+
+    failed = False
+    if loaded_modules:
+        print(f"FAIL: loaded at startup: {', '.join(loaded_modules)}")
+        failed = True
+    if median > arguments.budget_ms:
+        print("FAIL: startup budget exceeded")
+        failed = True
+    if failed:
+        raise SystemExit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+""" Panoptes - Benchmarks - Synthetic Account
+
+Runs analyze_security_groups end to end against a fabricated AWS account,
+without any network access. Every API call is answered from memory by a
+botocore before-call handler, the same hook botocore's Stubber uses, so
+the real clients, paginators, collectors and analysis are exercised.
+
+Reports the end-to-end runtime, the time of every stage from
+Metadata.Timings and the peak memory traced by tracemalloc. Results can be
+saved as a baseline, and a later run exits with a non-zero status when it
+is slower or uses more memory than the baseline by more than the
+threshold.
+
+Usage:
+    python benchmarks/synthetic_account.py [--scale F] [--groups N] [--rules-per-group N]
+        [--enis N] [--instances N] [--whitelist N] [--fast] [--runs N]
+        [--save PATH] [--baseline PATH] [--threshold F]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boto3
+import botocore.awsrequest
+import panoptes
+
+
+DEFAULT_SIZES = {
+    'groups': 10000,
+    'rules_per_group': 10,
+    'enis': 200000,
+    'instances': 20000,
+    'whitelist': 50000,
+}
+DEFAULT_RUNS = 5
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_PAGE_SIZE = 1000
+MIN_STAGE_SECONDS = 0.2
+MAX_STAGE_DEPTH = 3
+SEED = 42
+
+ACCOUNT_ID = '123456789012'
+REGION = 'us-east-1'
+VPCS = 50
+SUBNETS_PER_VPC = 4
+ADDRESSES = 2000
+SERVICE_RESOURCES = 500
+ECS_CLUSTERS = 20
+ECS_SERVICES_PER_CLUSTER = 50
+UNUSED_GROUPS_RATIO = 0.2
+GROUP_REFERENCES_RATIO = 0.1
+PORTS = [22, 80, 443, 3306, 3389, 5432, 6379, 8080, 9200, 27017]
+
+INPUT_TOKENS = ['NextToken', 'nextToken', 'Marker']
+OUTPUT_TOKENS = ['NextToken', 'nextToken', 'NextMarker', 'Marker']
+PAGE_SIZE_PARAMETERS = ['MaxResults', 'maxResults', 'MaxRecords', 'MaxItems', 'PageSize']
+
+
+def generate_account(groups: int, rules_per_group: int, enis: int, instances: int, whitelist: int) -> tuple:
+    """
+    Generates the API responses of a synthetic account and a user whitelist
+    of the given sizes. Returns (responses, whitelist), where responses maps
+    (service, operation) to (result key, items) for paginated operations or
+    to a function of the request parameters
+    """
+    generator = random.Random(SEED)
+    vpc_ids = [f"vpc-{vpc:08x}" for vpc in range(VPCS)]
+    group_ids = [f"sg-{group:017x}" for group in range(groups)]
+    used_group_ids = group_ids[:int(groups * (1 - UNUSED_GROUPS_RATIO))] or group_ids
+
+    user_whitelist = [
+        f"{100 + entry // 65536 % 100}.{entry // 256 % 256}.{entry % 256}.0/24"
+        for entry in range(whitelist)
+    ]
+
+    def generate_cidr() -> str:
+        kind = generator.random()
+        if kind < 0.05:
+            return "0.0.0.0/0"
+        if kind < 0.35 and user_whitelist:
+            return generator.choice(user_whitelist)
+        if kind < 0.65:
+            return f"10.{generator.randrange(VPCS)}.{generator.randrange(256)}.0/24"
+        return f"{generator.randrange(1, 99)}.{generator.randrange(256)}.{generator.randrange(256)}.{generator.randrange(256)}/32"
+
+    def generate_rule() -> dict:
+        port = generator.choice(PORTS)
+        return {
+            'IpProtocol': 'tcp',
+            'FromPort': port,
+            'ToPort': port,
+            'IpRanges': [{'CidrIp': generate_cidr()}],
+            'Ipv6Ranges': [],
+            'PrefixListIds': [],
+            'UserIdGroupPairs': [
+                {'GroupId': generator.choice(group_ids), 'UserId': ACCOUNT_ID}
+            ] if generator.random() < GROUP_REFERENCES_RATIO else [],
+        }
+
+    security_groups = [
+        {
+            'GroupId': group_id,
+            'GroupName': f"group-{group}",
+            'Description': f"Synthetic group {group}",
+            'VpcId': vpc_ids[group % VPCS],
+            'OwnerId': ACCOUNT_ID,
+            'IpPermissions': [generate_rule() for _ in range(rules_per_group)],
+        }
+        for group, group_id in enumerate(group_ids)
+    ]
+    network_interfaces = [
+        {
+            'NetworkInterfaceId': f"eni-{eni:017x}",
+            'VpcId': vpc_ids[eni % VPCS],
+            'Groups': [
+                {'GroupId': group_id}
+                for group_id in generator.sample(used_group_ids, min(len(used_group_ids), 1 + eni % 3))
+            ],
+        }
+        for eni in range(enis)
+    ]
+    reservations = [
+        {'Instances': [
+            {
+                'InstanceId': f"i-{instance:017x}",
+                'SecurityGroups': [{'GroupId': generator.choice(used_group_ids)}],
+                'NetworkInterfaces': [{
+                    'PrivateIpAddress': f"10.{instance % VPCS}.{instance // 256 % 256}.{instance % 256}",
+                    'Association': {'PublicIp': f"54.{instance // 65536 % 256}.{instance // 256 % 256}.{instance % 256}"},
+                }],
+            }
+            for instance in range(reservation, min(instances, reservation + 10))
+        ]}
+        for reservation in range(0, instances, 10)
+    ]
+
+    def describe_ecs_services(params: dict) -> dict:
+        return {'services': [
+            {'serviceArn': service, 'networkConfiguration': {'awsvpcConfiguration': {
+                'securityGroups': [used_group_ids[zlib.crc32(service.encode()) % len(used_group_ids)]],
+            }}}
+            for service in params['services']
+        ]}
+
+    responses = {
+        ('sts', 'GetCallerIdentity'): lambda params: {
+            'Arn': f"arn:aws:iam::{ACCOUNT_ID}:user/benchmark",
+            'Account': ACCOUNT_ID,
+            'UserId': 'benchmark',
+        },
+        ('ec2', 'DescribeSecurityGroups'): ('SecurityGroups', security_groups),
+        ('ec2', 'DescribeNetworkInterfaces'): ('NetworkInterfaces', network_interfaces),
+        ('ec2', 'DescribeInstances'): ('Reservations', reservations),
+        ('ec2', 'DescribeVpcs'): ('Vpcs', [
+            {'VpcId': vpc_id, 'CidrBlock': f"10.{vpc}.0.0/16"}
+            for vpc, vpc_id in enumerate(vpc_ids)
+        ]),
+        ('ec2', 'DescribeSubnets'): ('Subnets', [
+            {'SubnetId': f"subnet-{vpc}-{subnet}", 'CidrBlock': f"172.{16 + vpc % 16}.{subnet}.0/24"}
+            for vpc in range(VPCS)
+            for subnet in range(SUBNETS_PER_VPC)
+        ]),
+        ('ec2', 'DescribeAddresses'): lambda params: {'Addresses': [
+            {'PublicIp': f"52.0.{address // 256}.{address % 256}"}
+            for address in range(ADDRESSES)
+        ]},
+        ('rds', 'DescribeDBInstances'): ('DBInstances', [
+            {'VpcSecurityGroups': [{'VpcSecurityGroupId': generator.choice(used_group_ids)}]}
+            for _ in range(SERVICE_RESOURCES)
+        ]),
+        ('elb', 'DescribeLoadBalancers'): ('LoadBalancerDescriptions', [
+            {'SecurityGroups': [generator.choice(used_group_ids)]}
+            for _ in range(SERVICE_RESOURCES)
+        ]),
+        ('elbv2', 'DescribeLoadBalancers'): ('LoadBalancers', [
+            {'SecurityGroups': [generator.choice(used_group_ids)]}
+            for _ in range(SERVICE_RESOURCES)
+        ]),
+        ('lambda', 'ListFunctions'): ('Functions', [
+            {'VpcConfig': {'SecurityGroupIds': [generator.choice(used_group_ids)]}}
+            for _ in range(SERVICE_RESOURCES)
+        ]),
+        ('elasticache', 'DescribeCacheClusters'): ('CacheClusters', [
+            {'SecurityGroups': [{'SecurityGroupId': generator.choice(used_group_ids)}]}
+            for _ in range(SERVICE_RESOURCES)
+        ]),
+        ('elasticache', 'DescribeCacheSecurityGroups'): ('CacheSecurityGroups', []),
+        ('ecs', 'ListClusters'): ('clusterArns', [f"cluster-{cluster}" for cluster in range(ECS_CLUSTERS)]),
+        ('ecs', 'ListServices'): lambda params: {'serviceArns': [
+            f"{params['cluster']}/service-{service}"
+            for service in range(ECS_SERVICES_PER_CLUSTER)
+        ]},
+        ('ecs', 'DescribeServices'): describe_ecs_services,
+    }
+    return responses, user_whitelist
+
+
+def create_session(responses: dict) -> boto3.session.Session:
+    """
+    Creates a session whose API calls are answered from responses, paging
+    the items like AWS does
+    """
+    session = boto3.session.Session(
+        aws_access_key_id='benchmark',
+        aws_secret_access_key='benchmark',
+        region_name=REGION,
+    )
+
+    def keep_params(params, context, **kwargs):
+        context['benchmark_params'] = dict(params)
+
+    def respond(model, context, **kwargs):
+        params = context.get('benchmark_params', {})
+        response = responses[(model.service_model.service_name, model.name)]
+        if callable(response):
+            parsed = response(params)
+        else:
+            parsed = generate_page(model, params, *response)
+        parsed.setdefault('ResponseMetadata', {'HTTPStatusCode': 200})
+        return botocore.awsrequest.AWSResponse('https://benchmark', 200, {}, None), parsed
+
+    session.events.register('before-parameter-build.*.*', keep_params)
+    session.events.register('before-call.*.*', respond)
+    return session
+
+
+def generate_page(model, params: dict, result_key: str, items: list) -> dict:
+    """
+    Returns the page of items requested by params, with the next token of
+    the operation when there are more
+    """
+    input_members = model.input_shape.members if model.input_shape else {}
+    output_members = model.output_shape.members if model.output_shape else {}
+    start = next(
+        (int(params[token]) for token in INPUT_TOKENS if params.get(token)),
+        0,
+    )
+    page_size = next(
+        (params[parameter] for parameter in PAGE_SIZE_PARAMETERS if params.get(parameter)),
+        DEFAULT_PAGE_SIZE,
+    )
+
+    page = {result_key: items[start:start + page_size]}
+    if start + page_size < len(items):
+        output_token = next(token for token in OUTPUT_TOKENS if token in output_members)
+        if not any(token in input_members for token in INPUT_TOKENS):
+            raise ValueError(f"{model.name} can not be paginated")
+        page[output_token] = str(start + page_size)
+    return page
+
+
+def run_analysis(responses: dict, whitelist: list, fast: bool) -> tuple:
+    """
+    Returns the seconds spent by a full analysis of the synthetic account
+    and the analysis
+    """
+    session = create_session(responses)
+    started_at = time.perf_counter()
+    analysis = panoptes.aws.analysis.analyze_security_groups(
+        session, whitelist=whitelist, fast=fast
+    )
+    return time.perf_counter() - started_at, analysis
+
+
+def get_stage_durations(analysis: dict) -> dict:
+    """
+    Returns the duration of the stages and collectors, up to
+    MAX_STAGE_DEPTH levels deep, from Metadata.Timings
+    """
+    return {
+        timing['Path']: timing['Duration']
+        for timing in analysis['Metadata']['Timings']
+        if timing['Path'].count('/') < MAX_STAGE_DEPTH
+        and not timing['Name'].startswith('create_client')
+    }
+
+
+def measure(responses: dict, whitelist: list, fast: bool, runs: int) -> dict:
+    """
+    Returns the peak memory of a first traced run, which also warms up the
+    botocore caches, the median runtime and stage durations over the next
+    runs and the number of findings
+    """
+    tracemalloc.start()
+    run_analysis(responses, whitelist, fast)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    runtimes = []
+    stages = {}
+    for _ in range(runs):
+        runtime, analysis = run_analysis(responses, whitelist, fast)
+        runtimes.append(runtime)
+        for path, duration in get_stage_durations(analysis).items():
+            stages.setdefault(path, []).append(duration)
+
+    return {
+        'Runtime': statistics.median(runtimes),
+        'Stages': {path: statistics.median(durations) for path, durations in stages.items()},
+        'PeakMemory': peak_memory,
+        'Findings': {
+            section: len(findings)
+            for section, findings in analysis['SecurityGroups'].items()
+        },
+    }
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> list:
+    """
+    Lists the metrics of result worse than the baseline by more than the
+    threshold. Stages shorter than MIN_STAGE_SECONDS are too noisy to be
+    compared
+    """
+    regressions = []
+    metrics = [('Runtime', result['Runtime'], baseline['Runtime']),
+               ('PeakMemory', result['PeakMemory'], baseline['PeakMemory'])]
+    metrics += [
+        (path, duration, baseline['Stages'][path])
+        for path, duration in result['Stages'].items()
+        if baseline['Stages'].get(path, 0) >= MIN_STAGE_SECONDS
+    ]
+    for name, current, previous in metrics:
+        if current > previous * (1 + threshold):
+            regressions.append(f"{name}: {previous:.3f} -> {current:.3f} (+{current / previous - 1:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiplies every default size, e.g. 0.1 for a quick run')
+    for size in DEFAULT_SIZES:
+        parser.add_argument(f"--{size.replace('_', '-')}", type=int)
+    parser.add_argument('--fast', action='store_true')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS)
+    parser.add_argument('--save', metavar='PATH', help='store the results as a baseline')
+    parser.add_argument('--baseline', metavar='PATH', help='fail on regressions against this baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    arguments = parser.parse_args()
+
+    sizes = {
+        size: getattr(arguments, size) or max(1, int(default * arguments.scale))
+        for size, default in DEFAULT_SIZES.items()
+    }
+    sizes['rules_per_group'] = arguments.rules_per_group or DEFAULT_SIZES['rules_per_group']
+    print("Synthetic account: " + ", ".join(f"{size} {value}" for size, value in sizes.items())
+          + (", fast mode" if arguments.fast else ""))
+
+    responses, whitelist = generate_account(**sizes)
+    result = measure(responses, whitelist, arguments.fast, arguments.runs)
+    result['Sizes'] = dict(sizes, fast=arguments.fast)
+
+    print(f"    end to end:  {result['Runtime']:8.3f} s (median of {arguments.runs})")
+    print(f"    peak memory: {result['PeakMemory'] / 2 ** 20:8.1f} MiB")
+    for path, duration in sorted(result['Stages'].items()):
+        print(f"    {duration:8.3f} s  {path}")
+    print("    findings: " + ", ".join(f"{section} {count}" for section, count in result['Findings'].items()))
+
+    if arguments.save:
+        with open(arguments.save, 'w') as baseline_file:
+            json.dump(result, baseline_file, indent=2)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['Sizes'] != result['Sizes']:
+            print(f"FAIL: the baseline was measured with different sizes: {baseline['Sizes']}")
+            raise SystemExit(1)
+        regressions = compare(result, baseline, arguments.threshold)
+        if regressions:
+            print(f"FAIL: regressions over {arguments.threshold:.0%}:")
+            for regression in regressions:
+                print(f"    {regression}")
+            raise SystemExit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
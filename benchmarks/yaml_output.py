@@ -0,0 +1,146 @@
+""" Panoptes - Benchmarks - YAML Output
+
+Compares the YML output backend against the previous one (pure Python
+yaml.dump of the whole analysis) on a synthetic report. Exits with a
+non-zero status if the current backend is not faster.
+
+Usage:
+    python benchmarks/yaml_output.py [--rules N]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yaml
+import panoptes
+
+
+DEFAULT_RULES = 50000
+RULES_PER_GROUP = 10
+ACCOUNTS = ['111111111111', '222222222222']
+REGIONS = ['us-east-1', 'us-east-2', 'us-west-2', 'eu-west-1', 'sa-east-1']
+
+
+def generate_analysis(rules: int) -> dict:
+    """
+    Generates an analysis with the given number of unsafe rules, spread over
+    every account and region, and one unused group for every 4 groups
+    """
+    targets = [(account_id, region) for account_id in ACCOUNTS for region in REGIONS]
+    unused_groups = []
+    unsafe_groups = []
+    for group_number in range(rules // RULES_PER_GROUP):
+        account_id, region = targets[group_number % len(targets)]
+        group = {
+            'GroupName': f"group-{group_number}",
+            'GroupId': f"sg-{group_number:017x}",
+            'Description': f"Synthetic group {group_number}",
+            'AccountId': account_id,
+            'Region': region,
+        }
+        if group_number % 4 == 0:
+            unused_groups.append(dict(group, VpcId=f"vpc-{group_number % 50:08x}"))
+        unsafe_groups.append(dict(group, UnsafePorts=[
+            {
+                'IpProtocol': 'tcp',
+                'FromPort': 1000 + rule_number,
+                'ToPort': 1000 + rule_number,
+                'CidrIp': f"10.{group_number % 256}.{rule_number}.0/24",
+                'Status': 'warning',
+            }
+            for rule_number in range(RULES_PER_GROUP)
+        ]))
+
+    return {
+        'Metadata': {
+            'StartedAt': '2020-01-01T00:00:00',
+            'FinishedAt': '2020-01-01T00:05:00',
+            'CloudProvider': {'Name': 'aws', 'Auth': 'arn:aws:iam::111111111111:user/benchmark'},
+            'Accounts': ACCOUNTS,
+            'Regions': REGIONS,
+            'Errors': [],
+        },
+        'SecurityGroups': {
+            'UnusedGroups': unused_groups,
+            'UnsafeGroups': unsafe_groups,
+        },
+    }
+
+
+def dump_previous(analysis: dict) -> str:
+    """
+    The YML output before the libyaml emitter and per account/region
+    documents
+    """
+    return yaml.dump(
+        analysis,
+        allow_unicode=True,
+        default_flow_style=False,
+    )
+
+
+def dump_current(analysis: dict) -> str:
+    """
+    The current YML output of panoptesctl aws analyze
+    """
+    stream = io.StringIO()
+    panoptes.generic.output.write_yml_documents(
+        documents=panoptes.aws.analysis.split_analysis_documents(analysis),
+        stream=stream,
+    )
+    return stream.getvalue()
+
+
+def measure(function, analysis: dict) -> tuple:
+    """
+    Returns the seconds spent by function and its output
+    """
+    started_at = time.perf_counter()
+    output = function(analysis)
+    return time.perf_counter() - started_at, output
+
+
+def count_rules(output: str) -> int:
+    """
+    Counts the unsafe rules from every document of a YML output
+    """
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return sum(
+        len(group['UnsafePorts'])
+        for document in yaml.load_all(output, Loader=loader)
+        for group in document.get('SecurityGroups', {}).get('UnsafeGroups', [])
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rules', type=int, default=DEFAULT_RULES)
+    arguments = parser.parse_args()
+
+    analysis = generate_analysis(arguments.rules)
+    dumper = panoptes.generic.output.get_yaml_dumper()
+    print(f"Synthetic report: {arguments.rules} unsafe rules, "
+          f"{len(ACCOUNTS) * len(REGIONS)} accounts/regions, dumper {dumper.__name__}")
+
+    previous_time, _ = measure(dump_previous, analysis)
+    current_time, output = measure(dump_current, analysis)
+    print(f"    previous yaml.dump:      {previous_time:8.2f} s")
+    print(f"    write_yml_documents:     {current_time:8.2f} s ({previous_time / current_time:.1f}x)")
+
+    rules = count_rules(output)
+    if rules != arguments.rules:
+        print(f"FAIL: output holds {rules} rules instead of {arguments.rules}")
+        raise SystemExit(1)
+    if current_time >= previous_time:
+        print("FAIL: the YML output is not faster than the previous one")
+        raise SystemExit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
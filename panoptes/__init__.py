@@ -1,13 +1,28 @@
 """ Panoptes - Main Module
 
 Responsible only to import the cloud respective folders, which were created to
-organize the project properly.
+organize the project properly. Subpackages are imported on first access, so
+starting the CLI does not load boto3, jinja2 or PyYAML.
 """
 
-from panoptes import aws
-from panoptes import cli
-from panoptes import generic
-from panoptes import panoptesctl
+import importlib
+
+
+SUBMODULES = [
+    'aws',
+    'cli',
+    'generic',
+    'panoptesctl',
+]
+
+
+def __getattr__(name: str):
+    """
+    Imports the submodule on its first access
+    """
+    if name in SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
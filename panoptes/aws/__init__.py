@@ -1,13 +1,40 @@
 """ Panoptes - AWS
-Responsible to import analysis functions from AWS.
+Responsible to import analysis functions from AWS. Modules are imported on
+first access.
 """
 
-from panoptes.aws import analysis
-from panoptes.aws import attached
-from panoptes.aws import authentication
-from panoptes.aws import exceptions
-from panoptes.aws import output
-from panoptes.aws import whitelist
+import importlib
+
+
+SUBMODULES = [
+    'analysis',
+    'attached',
+    'authentication',
+    'exceptions',
+    'exposure',
+    'history',
+    'incremental',
+    'inventory',
+    'matrix',
+    'output',
+    'pagination',
+    'records',
+    'redundancy',
+    'scope',
+    'snapshot',
+    'throttling',
+    'tracing',
+    'whitelist',
+]
+
+
+def __getattr__(name: str):
+    """
+    Imports the submodule on its first access
+    """
+    if name in SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
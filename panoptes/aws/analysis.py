@@ -4,79 +4,298 @@ Responsible to the entire AWS analysis. Here the dynamic whitelist,
 the logic behind unknown ingress rules and unused security groups are created.
 """
 
-import boto3
+import concurrent.futures
+import itertools
+import queue
+import threading
+import typing
 import panoptes
 
 
+if typing.TYPE_CHECKING:
+    import boto3
+
+
 CLOUD_PROVIDER = "aws"
+DEFAULT_MAX_WORKERS = 8
+ALL_TRAFFIC_PROTOCOL = "-1"
+INGRESS_SOURCE_FIELDS = ['CidrIp', 'CidrIpv6', 'PrefixListId']
+FINDINGS_QUEUE_SIZE = 1024
+FINDINGS_QUEUE_TIMEOUT = 0.1
+FINDING_RECORD_TYPES = {
+    'UnusedGroupFinding': 'UnusedGroup',
+    'UnsafeIngressFinding': 'UnsafeIngress',
+    'RedundantRuleFinding': 'RedundantRule',
+    'ExposedGroupFinding': 'ExposedGroup',
+    'TargetSummary': 'Target',
+    'TargetError': 'Error',
+}
 
 
-def generate_unused_secgroup_entry(security_group: dict) -> dict:
+def generate_unused_secgroup_entry(finding: "panoptes.aws.records.UnusedGroupFinding") -> dict:
     """
     Generates a dictionary from an unused security group to the analysis
     response
     """
     unused_group = {
-        'GroupName': security_group['GroupName'],
-        'GroupId': security_group['GroupId'],
-        'Description': security_group['Description'],
-        'VpcId': security_group.get('VpcId') or 'no-vpc',
+        'GroupName': finding.GroupName,
+        'GroupId': finding.GroupId,
+        'Description': finding.Description,
+        'VpcId': finding.VpcId,
+        'AccountId': finding.AccountId,
+        'Region': finding.Region,
     }
     return unused_group
 
 
-def generate_unsafe_secgroup_entry(security_group: dict, unsafe_ingress_entries: list) -> dict:
+def generate_unsafe_secgroup_entry(findings: list) -> dict:
     """
     Generates a dictionary from an unsafe security group, receiving all
-    unsafe ingress entries related to this security group to the analysis
+    unsafe ingress findings related to this security group to the analysis
     response
     """
+    finding = findings[0]
     unsafe_group = {
-        "GroupName": security_group['GroupName'],
-        "GroupId": security_group['GroupId'],
-        "Description": security_group['Description'],
-        "UnsafePorts": unsafe_ingress_entries,
+        "GroupName": finding.GroupName,
+        "GroupId": finding.GroupId,
+        "Description": finding.Description,
+        "AccountId": finding.AccountId,
+        "Region": finding.Region,
+        "UnsafePorts": [
+            generate_unsafe_ingress_entry(unsafe_ingress)
+            for unsafe_ingress in findings
+        ],
     }
     return unsafe_group
 
 
-def generate_unsafe_ingress_entry(ingress_entry: dict, unsafe_ip: str) -> dict:
+def generate_unsafe_ingress_entry(finding: "panoptes.aws.records.UnsafeIngressFinding") -> dict:
     """
     Generates a dictionary from an unsafe ingress entry to the analysis
     response
     """
-    unsafe_ingress = {
-        "IpProtocol": ingress_entry["IpProtocol"],
-        "CidrIp": unsafe_ip,
-        "Status": "warning",
-    }
-    if "FromPort" in ingress_entry:
-        unsafe_ingress["FromPort"] = ingress_entry["FromPort"]
-    if "ToPort" in ingress_entry:
-        unsafe_ingress["ToPort"] = ingress_entry["ToPort"]
+    unsafe_ingress = {"IpProtocol": finding.IpProtocol}
+    for source_field in INGRESS_SOURCE_FIELDS:
+        if getattr(finding, source_field) is not None:
+            unsafe_ingress[source_field] = getattr(finding, source_field)
+    unsafe_ingress["Status"] = finding.Status
+    if finding.FromPort is not None:
+        unsafe_ingress["FromPort"] = finding.FromPort
+    if finding.ToPort is not None:
+        unsafe_ingress["ToPort"] = finding.ToPort
     return unsafe_ingress
 
 
-def analyze_unsafe_ingress(unsafe_ingress: dict) -> dict:
+def generate_redundant_secgroup_entry(findings: list) -> dict:
     """
-    Receives an unsafe ingress and changes "Status" following some rules
+    Generates a dictionary from a security group with redundant ingress
+    rules, receiving all redundant rule findings related to this security
+    group to the analysis response
     """
-    def is_all_traffic(protocol: str) -> bool:
-        ALL_TRAFFIC_PROTOCOL = "-1"
-        return protocol == ALL_TRAFFIC_PROTOCOL
-    def is_anywhere(cidr: str) -> bool:
-        ANYWHERE_CIDR = "0.0.0.0/0"
-        return cidr == ANYWHERE_CIDR
+    finding = findings[0]
+    redundant_group = {
+        "GroupName": finding.GroupName,
+        "GroupId": finding.GroupId,
+        "Description": finding.Description,
+        "AccountId": finding.AccountId,
+        "Region": finding.Region,
+        "RedundantRules": [
+            generate_redundant_rule_entry(redundant_rule)
+            for redundant_rule in findings
+        ],
+    }
+    return redundant_group
 
-    if is_all_traffic(unsafe_ingress["IpProtocol"]):
-        unsafe_ingress["Status"] = "alert"
-    if is_anywhere(unsafe_ingress["CidrIp"]):
-        unsafe_ingress["Status"] = "alert"
 
-    return unsafe_ingress
+def generate_redundant_rule_entry(finding: "panoptes.aws.records.RedundantRuleFinding") -> dict:
+    """
+    Generates a dictionary from a redundant rule entry to the analysis
+    response
+    """
+    redundant_rule = {"IpProtocol": finding.IpProtocol}
+    if finding.CidrIp is not None:
+        redundant_rule["CidrIp"] = finding.CidrIp
+    if finding.CidrIpv6 is not None:
+        redundant_rule["CidrIpv6"] = finding.CidrIpv6
+    if finding.FromPort is not None:
+        redundant_rule["FromPort"] = finding.FromPort
+    if finding.ToPort is not None:
+        redundant_rule["ToPort"] = finding.ToPort
+    redundant_rule["CoveredBy"] = finding.CoveredBy
+    return redundant_rule
+
+
+def generate_exposed_secgroup_entry(finding: "panoptes.aws.records.ExposedGroupFinding") -> dict:
+    """
+    Generates a dictionary from a security group reachable from an
+    internet-facing group to the analysis response
+    """
+    exposed_group = {
+        'GroupName': finding.GroupName,
+        'GroupId': finding.GroupId,
+        'Description': finding.Description,
+        'AccountId': finding.AccountId,
+        'Region': finding.Region,
+        'Path': list(finding.Path),
+    }
+    return exposed_group
+
+
+def generate_group_entries(findings: list) -> tuple:
+    """
+    Generates the unused, unsafe and redundant entries of a single security
+    group from its findings, or None for each one that does not apply
+    """
+    unused_entry = None
+    unsafe_findings = []
+    redundant_findings = []
+    for finding in findings:
+        if isinstance(finding, panoptes.aws.records.UnusedGroupFinding):
+            unused_entry = generate_unused_secgroup_entry(finding)
+        elif isinstance(finding, panoptes.aws.records.RedundantRuleFinding):
+            redundant_findings.append(finding)
+        else:
+            unsafe_findings.append(finding)
+    unsafe_entry = generate_unsafe_secgroup_entry(unsafe_findings) if unsafe_findings else None
+    redundant_entry = generate_redundant_secgroup_entry(redundant_findings) if redundant_findings else None
+    return unused_entry, unsafe_entry, redundant_entry
+
+
+def load_group_findings(unused_entry: dict, unsafe_entry: dict, redundant_entry: dict = None) -> list:
+    """
+    Rebuilds the findings of a security group from its stored entries
+    """
+    findings = []
+    if unused_entry is not None:
+        findings.append(panoptes.aws.records.UnusedGroupFinding(**unused_entry))
+    if unsafe_entry is not None:
+        for unsafe_ingress in unsafe_entry['UnsafePorts']:
+            findings.append(panoptes.aws.records.UnsafeIngressFinding(
+                GroupName=unsafe_entry['GroupName'],
+                GroupId=unsafe_entry['GroupId'],
+                Description=unsafe_entry['Description'],
+                AccountId=unsafe_entry['AccountId'],
+                Region=unsafe_entry['Region'],
+                IpProtocol=unsafe_ingress['IpProtocol'],
+                FromPort=unsafe_ingress.get('FromPort'),
+                ToPort=unsafe_ingress.get('ToPort'),
+                CidrIp=unsafe_ingress.get('CidrIp'),
+                CidrIpv6=unsafe_ingress.get('CidrIpv6'),
+                PrefixListId=unsafe_ingress.get('PrefixListId'),
+                Status=unsafe_ingress['Status'],
+            ))
+    if redundant_entry is not None:
+        for redundant_rule in redundant_entry['RedundantRules']:
+            findings.append(panoptes.aws.records.RedundantRuleFinding(
+                GroupName=redundant_entry['GroupName'],
+                GroupId=redundant_entry['GroupId'],
+                Description=redundant_entry['Description'],
+                AccountId=redundant_entry['AccountId'],
+                Region=redundant_entry['Region'],
+                IpProtocol=redundant_rule['IpProtocol'],
+                FromPort=redundant_rule.get('FromPort'),
+                ToPort=redundant_rule.get('ToPort'),
+                CidrIp=redundant_rule.get('CidrIp'),
+                CidrIpv6=redundant_rule.get('CidrIpv6'),
+                CoveredBy=redundant_rule['CoveredBy'],
+            ))
+    return findings
+
+
+def get_unsafe_ingress_status(ip_protocol: str, intervals: list) -> str:
+    """
+    Classifies an unsafe ingress: "alert" when it allows all traffic or
+    its source intervals cover every IPv4 or IPv6 address, "warning"
+    otherwise
+    """
+    if ip_protocol == ALL_TRAFFIC_PROTOCOL or (
+            intervals is not None and panoptes.generic.whitelist.is_anywhere(intervals)):
+        return "alert"
+    return "warning"
+
+
+def iter_ingress_sources(ingress_entry: "panoptes.aws.records.IngressRule", prefix_lists: dict = None):
+    """
+    Normalizes every IP source of an ingress rule into address intervals,
+    yielding (field, source, intervals) tuples, where field names the
+    source in the unsafe ingress entry. The intervals of prefix lists that
+    could not be resolved are None
+    """
+    for cidr_ip in ingress_entry.CidrIps:
+        yield 'CidrIp', cidr_ip, [panoptes.generic.whitelist.cidr_to_interval(cidr_ip)]
+    for cidr_ipv6 in ingress_entry.CidrIpv6s:
+        yield 'CidrIpv6', cidr_ipv6, [panoptes.generic.whitelist.cidr_to_interval(cidr_ipv6)]
+    for prefix_list_id in ingress_entry.PrefixListIds:
+        yield 'PrefixListId', prefix_list_id, get_source_intervals('PrefixListId', prefix_list_id, prefix_lists)
+
+
+def get_source_intervals(source_field: str, source: str, prefix_lists: dict = None) -> list:
+    """
+    Returns the address intervals of an ingress source, or None for
+    a prefix list missing from prefix_lists
+    """
+    if source_field != 'PrefixListId':
+        return [panoptes.generic.whitelist.cidr_to_interval(source)]
+    cidrs = (prefix_lists or {}).get(source)
+    if cidrs is None:
+        return None
+    return [panoptes.generic.whitelist.cidr_to_interval(cidr) for cidr in cidrs]
+
+
+def is_internet_facing(findings: list, prefix_lists: dict = None) -> bool:
+    """
+    Checks if the findings of a security group include an unsafe ingress
+    open to every IPv4 or IPv6 address. Only alerts can be
+    """
+    for finding in findings:
+        if getattr(finding, 'Status', None) != "alert":
+            continue
+        source_field = next(field for field in INGRESS_SOURCE_FIELDS if getattr(finding, field) is not None)
+        intervals = get_source_intervals(source_field, getattr(finding, source_field), prefix_lists)
+        if intervals is not None and panoptes.generic.whitelist.is_anywhere(intervals):
+            return True
+    return False
+
+
+def has_changed_sources(
+        security_group: "panoptes.aws.records.SecurityGroup",
+        changed_safe_ips: "panoptes.generic.whitelist.WhitelistIndex",
+        prefix_lists: dict = None) -> bool:
+    """
+    Checks if any IP source of the security group overlaps the safe IPs
+    that changed, which may change whether it is whitelisted. Without the
+    previous safe IPs, every group may have changed
+    """
+    if changed_safe_ips is None:
+        return True
+    if not changed_safe_ips:
+        return False
+    for ingress_entry in security_group.IpPermissions:
+        for _, _, intervals in iter_ingress_sources(ingress_entry, prefix_lists):
+            if intervals is not None and any(
+                    changed_safe_ips.overlaps_interval(start, end) for start, end in intervals):
+                return True
+    return False
+
+
+def compile_whitelist(whitelist) -> "panoptes.generic.whitelist.WhitelistIndex":
+    """
+    Builds a new whitelist index from a list of CIDRs or an existing index,
+    never modifying the one received
+    """
+    if isinstance(whitelist, panoptes.generic.whitelist.WhitelistIndex):
+        return whitelist.copy()
+    return panoptes.generic.whitelist.WhitelistIndex(whitelist or [])
 
 
-def analyze_security_groups(session: boto3.session.Session, whitelist: list = []) -> dict:
+def analyze_security_groups(
+        session: "boto3.session.Session",
+        whitelist: list = None,
+        fast: bool = False,
+        cache_ttl: int = 0,
+        cache_dir: str = None,
+        scope: "panoptes.aws.scope.Scope" = None,
+        baseline: dict = None) -> dict:
     """
     The main analysis function
 
@@ -86,9 +305,29 @@ def analyze_security_groups(session: boto3.session.Session, whitelist: list = []
             Description: Client object from panoptes.aws.authentication.create_session() modules
 
         - whitelist:
-            Type: list
+            Type: list or panoptes.generic.whitelist.WhitelistIndex
             Description: List of whitelisted CIDR from optional input file
 
+        - fast:
+            Type: bool
+            Description: Decide if groups are used only from Elastic Network Interfaces
+
+        - cache_ttl:
+            Type: int
+            Description: Seconds a cached snapshot of the account and region is reused. 0 disables the cache
+
+        - cache_dir:
+            Type: str
+            Description: Directory of the cached snapshots
+
+        - baseline:
+            Type: dict
+            Description: State of a previous analysis from panoptes.aws.incremental.load_state(), enabling incremental analysis
+
+        - scope:
+            Type: panoptes.aws.scope.Scope
+            Description: VPCs, security groups and tags the analysis is restricted to, applied as server-side filters
+
     DesiredReturn:
         {
             "Metadata": {
@@ -98,6 +337,32 @@ def analyze_security_groups(session: boto3.session.Session, whitelist: list = []
                     "Name": str,
                     "Auth": str,
                 },
+                "Accounts": [str],
+                "Regions": [str],
+                "UnusedGroupsSkipped": bool,
+                "CollectionErrors": [
+                    {
+                        "Collector": str,
+                        "Message": str,
+                        "AccountId": str,
+                        "Region": str,
+                    },
+                ],
+                "Timings": [
+                    {
+                        "Name": str,
+                        "Path": str,
+                        "AccountId": str,
+                        "Region": str,
+                        "Thread": str,
+                        "Start": float[Unix time],
+                        "Duration": float[seconds],
+                        "Calls": int,
+                        "Retries": int,
+                        "Pages": int,
+                        "Bytes": int,
+                    },
+                ],
             },
             "SecurityGroups": {
                 "UnusedGroups": [
@@ -106,6 +371,8 @@ def analyze_security_groups(session: boto3.session.Session, whitelist: list = []
                         "GroupId": str,
                         "Description": str,
                         "VpcId": str,
+                        "AccountId": str,
+                        "Region": str,
                     }
                 ],
                 "UnsafeGroups": [
@@ -113,79 +380,664 @@ def analyze_security_groups(session: boto3.session.Session, whitelist: list = []
                         "GroupName": str,
                         "GroupId": str,
                         "Description": str,
+                        "AccountId": str,
+                        "Region": str,
                         "UnsafePorts": [
                             {
                                 "FromPort": int,
                                 "ToPort": int,
                                 "IpProtocol": str,
                                 "CidrIp": str,
+                                "CidrIpv6": str,
+                                "PrefixListId": str,
                                 "Status": str,
                             },
                         ]
                     },
                 ],
+                "RedundantGroups": [
+                    {
+                        "GroupName": str,
+                        "GroupId": str,
+                        "Description": str,
+                        "AccountId": str,
+                        "Region": str,
+                        "RedundantRules": [
+                            {
+                                "FromPort": int,
+                                "ToPort": int,
+                                "IpProtocol": str,
+                                "CidrIp": str,
+                                "CidrIpv6": str,
+                                "CoveredBy": {
+                                    "FromPort": int,
+                                    "ToPort": int,
+                                    "IpProtocol": str,
+                                    "CidrIp": str,
+                                    "CidrIpv6": str,
+                                },
+                            },
+                        ]
+                    },
+                ],
+                "ExposedGroups": [
+                    {
+                        "GroupName": str,
+                        "GroupId": str,
+                        "Description": str,
+                        "AccountId": str,
+                        "Region": str,
+                        "Path": [str],
+                    },
+                ],
             },
         }
     """
+    with panoptes.aws.tracing.start_trace('analyze_security_groups') as trace:
+        with panoptes.aws.tracing.span('collect_snapshot'):
+            snapshot = collect_target_snapshot(
+                session=session,
+                fast=fast,
+                cache_ttl=cache_ttl,
+                cache_dir=cache_dir,
+                scope=scope,
+            )
+        with panoptes.aws.tracing.span('analyze_snapshot'):
+            response = analyze_snapshot(
+                snapshot=snapshot,
+                whitelist=whitelist,
+                baseline=baseline,
+            )
+    response['Metadata']['FinishedAt'] = panoptes.generic.helpers.get_current_time()
+    response['Metadata']['Timings'] = trace.generate_timings(
+        AccountId=snapshot.AccountId,
+        Region=snapshot.Region,
+    )
+    return response
+
+
+def collect_target_snapshot(
+        session: "boto3.session.Session",
+        fast: bool = False,
+        cache_ttl: int = 0,
+        cache_dir: str = None,
+        scope: "panoptes.aws.scope.Scope" = None) -> "panoptes.aws.records.Snapshot":
+    """
+    Collects the snapshot of the session, reusing the cached one when
+    cache_ttl is set
+    """
+    if cache_ttl:
+        return panoptes.aws.snapshot.collect_cached_snapshot(
+            session=session,
+            fast=fast,
+            cache_ttl=cache_ttl,
+            cache_dir=cache_dir,
+            scope=scope,
+        )
+    return panoptes.aws.snapshot.collect_snapshot(session, fast=fast, scope=scope)
+
+
+def compile_snapshot_whitelist(snapshot: "panoptes.aws.records.Snapshot", whitelist=None) -> "panoptes.generic.whitelist.WhitelistIndex":
+    """
+    Builds the whitelist index of a snapshot, adding its safe IPs to the
+    user whitelist
+    """
+    return compile_whitelist(whitelist).update(snapshot.SafeIps)
+
+
+def analyze_snapshot(
+        snapshot: "panoptes.aws.records.Snapshot",
+        whitelist: list = None,
+        baseline: dict = None) -> dict:
+    """
+    Analyzes a collected snapshot without calling AWS. The analysis keeps
+    the snapshot's collection time, so the same snapshot always generates
+    the same analysis.
+
+    With a baseline state from panoptes.aws.incremental, groups whose
+    fingerprint did not change since that analysis reuse its findings
+    instead of being evaluated again
+    """
     response = {
         'SecurityGroups': {
             'UnusedGroups': [],
             'UnsafeGroups': [],
+            'RedundantGroups': [],
+            'ExposedGroups': [],
         },
         'Metadata': {
-            'StartedAt': '',
-            'FinishedAt': '',
+            'StartedAt': snapshot.StartedAt,
+            'FinishedAt': snapshot.FinishedAt,
             'CloudProvider': {
-                'Name': '',
-                'Auth': '',
+                'Name': CLOUD_PROVIDER,
+                'Auth': snapshot.Auth,
             },
+            'Accounts': [snapshot.AccountId],
+            'Regions': [snapshot.Region],
+            'CollectionErrors': [],
+            'UnusedGroupsSkipped': snapshot.AttachedGroups is None,
         },
     }
-    response['Metadata']['StartedAt'] = panoptes.generic.helpers.get_current_time()
-
-    whitelist += panoptes.aws.whitelist.list_all_safe_ips(session)
-    all_security_groups = session.client('ec2').describe_security_groups()['SecurityGroups']
-    all_attached_groups = panoptes.aws.attached.list_all_attached_secgroups(session)
-
-    for security_group in all_security_groups:
-        # Validating if group is unused
-        if (
-                security_group['GroupName'] not in all_attached_groups and
-                security_group['GroupId'] not in all_attached_groups
-        ):
-            response['SecurityGroups']['UnusedGroups'].append(
-                generate_unused_secgroup_entry(
-                    security_group=security_group
+
+    user_whitelist_index = compile_whitelist(whitelist)
+    whitelist_index = compile_snapshot_whitelist(snapshot, user_whitelist_index)
+    fingerprints = None
+    if baseline is not None:
+        target_key = panoptes.aws.incremental.generate_target_key(
+            snapshot.AccountId, snapshot.Region
+        )
+        response['Incremental'] = panoptes.aws.incremental.create_empty_incremental()
+        response['Incremental']['WhitelistDigests'][target_key] = user_whitelist_index.digest()
+        response['Incremental']['SafeIps'][target_key] = sorted(set(snapshot.SafeIps))
+        fingerprints = response['Incremental']['Fingerprints']
+
+    findings = iter_snapshot_findings(
+        snapshot=snapshot,
+        whitelist_index=whitelist_index,
+        baseline=baseline,
+        fingerprints=fingerprints,
+        whitelist_digest=user_whitelist_index.digest() if baseline is not None else None,
+    )
+    # Exposures follow every group, so the last group may share its GroupId
+    # with the first exposure
+    batches = itertools.groupby(findings, key=lambda finding: (
+        isinstance(finding, panoptes.aws.records.ExposedGroupFinding), finding.GroupId
+    ))
+    for (exposed, _), group_findings in batches:
+        if exposed:
+            response['SecurityGroups']['ExposedGroups'] += map(generate_exposed_secgroup_entry, group_findings)
+            continue
+        group_findings = list(group_findings)
+        unused_entry, unsafe_entry, redundant_entry = generate_group_entries(group_findings)
+        if unused_entry is not None:
+            response['SecurityGroups']['UnusedGroups'].append(unused_entry)
+        if unsafe_entry is not None:
+            response['SecurityGroups']['UnsafeGroups'].append(unsafe_entry)
+        if redundant_entry is not None:
+            response['SecurityGroups']['RedundantGroups'].append(redundant_entry)
+
+    # Prefix lists are resolved while the security groups are consumed
+    response['Metadata']['CollectionErrors'] = generate_collection_error_entries(snapshot)
+    return response
+
+
+def iter_findings(
+        session: "boto3.session.Session",
+        whitelist: list = None,
+        fast: bool = False,
+        cache_ttl: int = 0,
+        cache_dir: str = None,
+        scope: "panoptes.aws.scope.Scope" = None):
+    """
+    Yields the typed findings of the session's account and region as soon
+    as each security group is evaluated: an UnusedGroupFinding for unused
+    groups, an UnsafeIngressFinding for every non whitelisted source and a
+    RedundantRuleFinding for every CIDR source already allowed by another
+    rule of the group. Once every group is evaluated, an
+    ExposedGroupFinding follows for each group reachable from an
+    internet-facing group through references.
+
+    The unused, unsafe and redundant findings of a group are always yielded
+    together. Nothing is kept between calls and the whitelist received is
+    never modified, so it is safe to call from long-running and concurrent
+    processes
+    """
+    snapshot = collect_target_snapshot(
+        session=session,
+        fast=fast,
+        cache_ttl=cache_ttl,
+        cache_dir=cache_dir,
+        scope=scope,
+    )
+    yield from iter_snapshot_findings(
+        snapshot=snapshot,
+        whitelist_index=compile_snapshot_whitelist(snapshot, whitelist),
+    )
+
+
+def iter_snapshot_findings(
+        snapshot: "panoptes.aws.records.Snapshot",
+        whitelist_index: "panoptes.generic.whitelist.WhitelistIndex",
+        baseline: dict = None,
+        fingerprints: dict = None,
+        whitelist_digest: str = None):
+    """
+    Yields the typed findings of a snapshot, group by group. whitelist_index
+    must already hold the snapshot's safe IPs.
+
+    With a baseline and the whitelist_digest of the user whitelist,
+    unchanged groups yield their previous findings, unless one of their
+    sources overlaps safe IPs added or removed since the baseline, and the
+    fingerprint of every group is stored in fingerprints. Exposure depends
+    on the whole reference graph, so it is always computed again
+    """
+    all_attached_groups = snapshot.AttachedGroups
+    exposure_graph = panoptes.aws.exposure.ExposureGraph()
+    if baseline is not None:
+        target_key = panoptes.aws.incremental.generate_target_key(
+            snapshot.AccountId, snapshot.Region
+        )
+        changed_safe_ips = panoptes.aws.incremental.get_changed_safe_ips(
+            baseline, target_key, snapshot.SafeIps
+        )
+
+    for security_group in snapshot.SecurityGroups:
+        if baseline is not None:
+            group_key = panoptes.aws.incremental.generate_group_key(
+                snapshot.AccountId, snapshot.Region, security_group.GroupId
+            )
+            fingerprint = panoptes.aws.incremental.fingerprint_security_group(
+                security_group, all_attached_groups, snapshot.PrefixLists
+            )
+            fingerprints[group_key] = fingerprint
+            previous_findings = panoptes.aws.incremental.get_unchanged_findings(
+                baseline, target_key, whitelist_digest, group_key, fingerprint
+            )
+            if previous_findings is not None and not has_changed_sources(
+                    security_group, changed_safe_ips, snapshot.PrefixLists):
+                group_findings = load_group_findings(*previous_findings)
+                exposure_graph.add_security_group(
+                    security_group, is_internet_facing(group_findings, snapshot.PrefixLists)
                 )
+                yield from group_findings
+                continue
+
+        group_findings = list(iter_security_group_findings(
+            security_group=security_group,
+            attached_groups=all_attached_groups,
+            whitelist_index=whitelist_index,
+            account_id=snapshot.AccountId,
+            region=snapshot.Region,
+            prefix_lists=snapshot.PrefixLists,
+        ))
+        exposure_graph.add_security_group(
+            security_group, is_internet_facing(group_findings, snapshot.PrefixLists)
+        )
+        yield from group_findings
+
+    for group_id, group_name, description, path in exposure_graph.iter_exposed_groups():
+        yield panoptes.aws.records.ExposedGroupFinding(
+            GroupName=group_name,
+            GroupId=group_id,
+            Description=description,
+            AccountId=snapshot.AccountId,
+            Region=snapshot.Region,
+            Path=path,
+        )
+
+
+def iter_security_group_findings(
+        security_group: "panoptes.aws.records.SecurityGroup",
+        attached_groups: "panoptes.aws.records.AttachedGroups",
+        whitelist_index: "panoptes.generic.whitelist.WhitelistIndex",
+        account_id: str,
+        region: str,
+        prefix_lists: dict = None):
+    """
+    Evaluates a single security group, yielding its typed findings. Every
+    IPv4 CIDR, IPv6 CIDR and prefix list not fully covered by the whitelist
+    is unsafe, as well as prefix lists missing from prefix_lists. CIDR
+    sources covered by another rule of the group are redundant
+    """
+    # Validating if group is unused, unless attachments were not collected
+    if attached_groups is not None and (
+            security_group.GroupName not in attached_groups.GroupNames and
+            security_group.GroupId not in attached_groups.GroupIds
+    ):
+        yield panoptes.aws.records.UnusedGroupFinding(
+            GroupName=security_group.GroupName,
+            GroupId=security_group.GroupId,
+            Description=security_group.Description,
+            VpcId=security_group.VpcId or 'no-vpc',
+            AccountId=account_id,
+            Region=region,
+        )
+
+    # Validating if group is unsafe
+    cidr_sources = []
+    for ingress_entry in security_group.IpPermissions:
+        for source_field, source, intervals in iter_ingress_sources(ingress_entry, prefix_lists):
+            if source_field != 'PrefixListId':
+                cidr_sources.append((ingress_entry, source_field, source, intervals[0]))
+            if intervals is not None and all(
+                    whitelist_index.covers_interval(start, end) for start, end in intervals):
+                continue
+            sources = dict.fromkeys(INGRESS_SOURCE_FIELDS)
+            sources[source_field] = source
+            yield panoptes.aws.records.UnsafeIngressFinding(
+                GroupName=security_group.GroupName,
+                GroupId=security_group.GroupId,
+                Description=security_group.Description,
+                AccountId=account_id,
+                Region=region,
+                IpProtocol=ingress_entry.IpProtocol,
+                FromPort=ingress_entry.FromPort,
+                ToPort=ingress_entry.ToPort,
+                Status=get_unsafe_ingress_status(ingress_entry.IpProtocol, intervals),
+                **sources,
             )
 
-        # Validating if group is unsafe
-        unsafe_ingress_entries = []
-        for ingress_entry in security_group['IpPermissions']:
-            for allowed_ip in ingress_entry['IpRanges']:
-                if allowed_ip['CidrIp'] not in whitelist:
-                    unsafe_ingress = generate_unsafe_ingress_entry(
-                        ingress_entry=ingress_entry,
-                        unsafe_ip=allowed_ip['CidrIp'],
-                    )
-                    unsafe_ingress = analyze_unsafe_ingress(unsafe_ingress)
-                    unsafe_ingress_entries.append(unsafe_ingress)
-
-        if unsafe_ingress_entries:
-            response['SecurityGroups']['UnsafeGroups'].append(
-                generate_unsafe_secgroup_entry(
-                    security_group=security_group,
-                    unsafe_ingress_entries=unsafe_ingress_entries,
+    # Validating if group has redundant rules
+    for redundant_rule in panoptes.aws.redundancy.iter_redundant_rules(cidr_sources):
+        ingress_entry, source_field, source, covering_entry, covering_field, covering_source = redundant_rule
+        sources = {'CidrIp': None, 'CidrIpv6': None, source_field: source}
+        yield panoptes.aws.records.RedundantRuleFinding(
+            GroupName=security_group.GroupName,
+            GroupId=security_group.GroupId,
+            Description=security_group.Description,
+            AccountId=account_id,
+            Region=region,
+            IpProtocol=ingress_entry.IpProtocol,
+            FromPort=ingress_entry.FromPort,
+            ToPort=ingress_entry.ToPort,
+            CoveredBy=generate_covering_rule_entry(covering_entry, covering_field, covering_source),
+            **sources,
+        )
+
+
+def generate_covering_rule_entry(
+        ingress_entry: "panoptes.aws.records.IngressRule",
+        source_field: str,
+        source: str) -> dict:
+    """
+    Generates the dictionary of the rule covering a redundant one
+    """
+    covering_rule = {"IpProtocol": ingress_entry.IpProtocol, source_field: source}
+    if ingress_entry.FromPort is not None:
+        covering_rule["FromPort"] = ingress_entry.FromPort
+    if ingress_entry.ToPort is not None:
+        covering_rule["ToPort"] = ingress_entry.ToPort
+    return covering_rule
+
+
+def analyze_targets(
+        targets: list,
+        whitelist: list = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        fast: bool = False,
+        cache_ttl: int = 0,
+        cache_dir: str = None,
+        scope: "panoptes.aws.scope.Scope" = None,
+        baseline: dict = None) -> dict:
+    """
+    Runs analyze_security_groups for every AnalysisTarget (account or
+    profile, and region) concurrently, with at most max_workers analyses in
+    flight, and merges them into a single analysis. Targets that fail are
+    reported in Metadata.Errors instead of aborting the others
+    """
+    def analyze_target(target):
+        return analyze_security_groups(
+            session=target.create_session(),
+            whitelist=whitelist_index,
+            fast=fast,
+            cache_ttl=cache_ttl,
+            cache_dir=cache_dir,
+            scope=scope,
+            baseline=baseline,
+        )
+
+    whitelist_index = compile_whitelist(whitelist)
+    analyses = []
+    errors = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running_workers = [
+            (target, executor.submit(analyze_target, target))
+            for target in targets
+        ]
+        for target, future in running_workers:
+            try:
+                analyses.append(future.result())
+            except Exception as e:
+                errors.append(
+                    dict(generate_target_error(target=target, error=e)._asdict())
                 )
+
+    response = merge_analyses(analyses)
+    response['Metadata']['Errors'] = errors
+    return response
+
+
+def analyze_snapshots(snapshots: list, whitelist: list = None, baseline: dict = None) -> dict:
+    """
+    Analyzes stored snapshots offline and merges them into a single analysis
+    """
+    whitelist_index = compile_whitelist(whitelist)
+    response = merge_analyses([
+        analyze_snapshot(
+            snapshot=snapshot,
+            whitelist=whitelist_index,
+            baseline=baseline,
+        )
+        for snapshot in snapshots
+    ])
+    response['Metadata']['Errors'] = []
+    return response
+
+
+def iter_targets_findings(
+        targets: list,
+        whitelist: list = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        fast: bool = False,
+        cache_ttl: int = 0,
+        cache_dir: str = None,
+        scope: "panoptes.aws.scope.Scope" = None):
+    """
+    Streaming version of analyze_targets. Yields the typed findings as they
+    are produced by up to max_workers concurrent targets, without building
+    the analysis. Besides the findings, every target yields a TargetSummary
+    when it finishes or a TargetError when it fails. Producers block once
+    FINDINGS_QUEUE_SIZE findings are waiting, so memory does not grow with
+    the size of the accounts
+    """
+    whitelist_index = compile_whitelist(whitelist)
+    buffer = queue.Queue(maxsize=FINDINGS_QUEUE_SIZE)
+    stopped = threading.Event()
+    finished = object()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=FINDINGS_QUEUE_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def analyze_target(target):
+        try:
+            if stopped.is_set():
+                return
+            snapshot = collect_target_snapshot(
+                session=target.create_session(),
+                fast=fast,
+                cache_ttl=cache_ttl,
+                cache_dir=cache_dir,
+                scope=scope,
             )
+            for finding in iter_snapshot_findings(
+                    snapshot=snapshot,
+                    whitelist_index=compile_snapshot_whitelist(snapshot, whitelist_index)):
+                if not put(finding):
+                    return
+            put(generate_target_summary(
+                snapshot=snapshot,
+                finished_at=panoptes.generic.helpers.get_current_time(),
+            ))
+        except Exception as e:
+            put(generate_target_error(target=target, error=e))
+        finally:
+            put(finished)
 
-    response['Metadata']['FinishedAt'] = panoptes.generic.helpers.get_current_time()
-    response['Metadata']['CloudProvider']['Name'] = CLOUD_PROVIDER
-    response['Metadata']['CloudProvider']['Auth'] = (
-        panoptes.aws.authentication.get_session_info(session)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for target in targets:
+            executor.submit(analyze_target, target)
+        try:
+            running_targets = len(targets)
+            while running_targets:
+                item = buffer.get()
+                if item is finished:
+                    running_targets -= 1
+                    continue
+                yield item
+        finally:
+            stopped.set()
+
+
+def iter_snapshots_findings(snapshots, whitelist: list = None):
+    """
+    Streaming version of analyze_snapshots, yielding typed findings and a
+    TargetSummary per snapshot like iter_targets_findings
+    """
+    whitelist_index = compile_whitelist(whitelist)
+    for snapshot in snapshots:
+        yield from iter_snapshot_findings(
+            snapshot=snapshot,
+            whitelist_index=compile_snapshot_whitelist(snapshot, whitelist_index),
+        )
+        yield generate_target_summary(snapshot=snapshot)
+
+
+def generate_target_summary(snapshot: "panoptes.aws.records.Snapshot", finished_at: str = None) -> "panoptes.aws.records.TargetSummary":
+    """
+    Generates the summary of an account and region whose analysis finished
+    """
+    return panoptes.aws.records.TargetSummary(
+        AccountId=snapshot.AccountId,
+        Region=snapshot.Region,
+        Auth=snapshot.Auth,
+        StartedAt=snapshot.StartedAt,
+        FinishedAt=finished_at or snapshot.FinishedAt,
+        CollectionErrors=generate_collection_error_entries(snapshot),
+    )
+
+
+def generate_collection_error_entries(snapshot: "panoptes.aws.records.Snapshot") -> list:
+    """
+    Generates a dictionary from every collector that failed in the snapshot
+    """
+    return [
+        {
+            'Collector': collection_error.Collector,
+            'Message': collection_error.Message,
+            'AccountId': snapshot.AccountId,
+            'Region': snapshot.Region,
+        }
+        for collection_error in snapshot.CollectionErrors
+    ]
+
+
+def generate_target_error(target, error: Exception) -> "panoptes.aws.records.TargetError":
+    """
+    Generates the error of a target whose analysis failed
+    """
+    return panoptes.aws.records.TargetError(
+        Target=target.Name,
+        Region=target.Region,
+        Message=str(error),
     )
+
+
+def generate_finding_records(findings):
+    """
+    Converts typed findings into self-contained dictionaries, one per
+    unused group, unsafe ingress rule, finished target or error. Each record
+    carries its Type and the account, region and group it belongs to
+    """
+    for finding in findings:
+        yield dict(
+            {'Type': FINDING_RECORD_TYPES[type(finding).__name__]},
+            **finding._asdict()
+        )
+
+
+def merge_analyses(analyses: list) -> dict:
+    """
+    Merges analyses from different accounts and regions into one, keeping
+    the account and region on every finding and the time window covering
+    all of them
+    """
+    current_time = panoptes.generic.helpers.get_current_time()
+    response = {
+        'SecurityGroups': {
+            'UnusedGroups': [],
+            'UnsafeGroups': [],
+            'RedundantGroups': [],
+            'ExposedGroups': [],
+        },
+        'Metadata': {
+            'StartedAt': min(
+                (a['Metadata']['StartedAt'] for a in analyses),
+                default=current_time,
+            ),
+            'FinishedAt': max(
+                (a['Metadata']['FinishedAt'] for a in analyses),
+                default=current_time,
+            ),
+            'CloudProvider': {
+                'Name': CLOUD_PROVIDER,
+                'Auth': ', '.join(sorted(set(
+                    a['Metadata']['CloudProvider']['Auth'] for a in analyses
+                ))),
+            },
+            'Accounts': [],
+            'Regions': [],
+            'CollectionErrors': [],
+            'UnusedGroupsSkipped': any(
+                a['Metadata']['UnusedGroupsSkipped'] for a in analyses
+            ),
+            'Timings': [],
+        },
+    }
+    for analysis in analyses:
+        for section, findings in analysis['SecurityGroups'].items():
+            response['SecurityGroups'][section] += findings
+        response['Metadata']['Accounts'] += analysis['Metadata']['Accounts']
+        response['Metadata']['Regions'] += analysis['Metadata']['Regions']
+        response['Metadata']['CollectionErrors'] += analysis['Metadata']['CollectionErrors']
+        response['Metadata']['Timings'] += analysis['Metadata'].get('Timings', [])
+        if 'Incremental' in analysis:
+            incremental = response.setdefault(
+                'Incremental', panoptes.aws.incremental.create_empty_incremental()
+            )
+            for key, values in analysis['Incremental'].items():
+                incremental[key].update(values)
+
+    for key in ('Accounts', 'Regions'):
+        response['Metadata'][key] = list(dict.fromkeys(response['Metadata'][key]))
     return response
 
 
+def split_analysis_documents(analysis: dict):
+    """
+    Splits an analysis into smaller documents to be serialized one at a
+    time: the first one holds everything but the security groups, followed
+    by one document per account and region with its security groups
+    """
+    yield {
+        key: value
+        for key, value in analysis.items()
+        if key != 'SecurityGroups'
+    }
+    if 'SecurityGroups' not in analysis:
+        return
+
+    targets = {}
+    for section, entries in analysis['SecurityGroups'].items():
+        for entry in entries:
+            security_groups = targets.setdefault(
+                (entry['AccountId'], entry['Region']),
+                {target_section: [] for target_section in analysis['SecurityGroups']},
+            )
+            security_groups[section].append(entry)
+
+    for (account_id, region), security_groups in targets.items():
+        yield {
+            'AccountId': account_id,
+            'Region': region,
+            'SecurityGroups': security_groups,
+        }
+
+
 if __name__ == "__main__":
     pass
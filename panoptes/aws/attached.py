@@ -5,201 +5,277 @@ groups within AWS resources.
 """
 
 import concurrent.futures
-import boto3
+import typing
+import botocore.exceptions
 import panoptes
 
 
-def list_all_attached_secgroups(session: boto3.session.Session) -> list:
+if typing.TYPE_CHECKING:
+    import boto3
+
+
+CACHE_SECURITY_GROUPS_UNSUPPORTED_CODE = "InvalidParameterValue"
+ECS_LIST_SERVICES_PAGE_SIZE = 100
+ECS_DESCRIBE_SERVICES_LIMIT = 10
+
+
+def list_all_attached_secgroups(
+        session: "boto3.session.Session",
+        inventory: "panoptes.aws.inventory.Inventory" = None,
+        fast: bool = False,
+        errors: list = None) -> "panoptes.aws.records.AttachedGroups":
     """
-    Lists and groups all attached security groups within AWS resources
+    Lists and groups all attached security groups within AWS resources,
+    keeping group IDs and EC2-Classic group names in separate sets.
+    When an errors list is received, collectors that fail are recorded in
+    it as panoptes.aws.records.CollectionError instead of raising.
+
+    Every VPC resource using a security group does it through an Elastic
+    Network Interface, so the fast mode decides usage from the ENI sweep
+    and only asks ElastiCache for the EC2-Classic names ENIs cannot show
     """
-    all_attached_groups = []
-    boto_clients = panoptes.aws.authentication.get_boto_clients(session)
+    all_attached_groups = panoptes.aws.records.AttachedGroups(
+        GroupIds=set(),
+        GroupNames=set(),
+    )
+    if inventory is None:
+        inventory = panoptes.aws.inventory.Inventory(session)
 
-    services_with_security_groups = [
-        (list_ec2_attached_secgroups, boto_clients['ec2']),
-        (list_eni_attached_secgroups, boto_clients['ec2']),
-        (list_rds_attached_secgroups, boto_clients['rds']),
-        (list_elb_attached_secgroups, boto_clients['elb']),
-        (list_elbv2_attached_secgroups, boto_clients['elbv2']),
-        (list_lambda_attached_secgroups, boto_clients['lambda']),
-        (list_elasticache_attached_secgroups, boto_clients['elasticache']),
-        (list_ecs_attached_secgroups, boto_clients['ecs']),
-    ]
+    if fast:
+        elasticache = panoptes.aws.authentication.get_client(session, 'elasticache')
+        services_with_security_groups = [
+            (all_attached_groups.GroupIds, list_eni_attached_secgroups, inventory),
+            (all_attached_groups.GroupNames, list_elasticache_attached_secgroup_names, elasticache),
+        ]
+    else:
+        boto_clients = panoptes.aws.authentication.get_boto_clients(session)
+        services_with_security_groups = [
+            (all_attached_groups.GroupIds, list_ec2_attached_secgroups, inventory),
+            (all_attached_groups.GroupIds, list_eni_attached_secgroups, inventory),
+            (all_attached_groups.GroupIds, list_rds_attached_secgroups, boto_clients['rds']),
+            (all_attached_groups.GroupIds, list_elb_attached_secgroups, boto_clients['elb']),
+            (all_attached_groups.GroupIds, list_elbv2_attached_secgroups, boto_clients['elbv2']),
+            (all_attached_groups.GroupIds, list_lambda_attached_secgroups, boto_clients['lambda']),
+            (all_attached_groups.GroupIds, list_elasticache_attached_secgroups, boto_clients['elasticache']),
+            (all_attached_groups.GroupNames, list_elasticache_attached_secgroup_names, boto_clients['elasticache']),
+            (all_attached_groups.GroupIds, list_ecs_attached_secgroups, boto_clients['ecs']),
+        ]
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        running_workers = []
-        for list_attached_function in services_with_security_groups:
-            running_workers.append(executor.submit(*list_attached_function))
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=panoptes.aws.authentication.MAX_POOL_CONNECTIONS
+    ) as executor:
+        running_workers = {}
+        for attached_groups, list_attached_function, client in services_with_security_groups:
+            running_workers[executor.submit(
+                panoptes.aws.tracing.traced(list_attached_function), client
+            )] = (
+                attached_groups, list_attached_function
+            )
 
         for future in concurrent.futures.as_completed(running_workers):
-            all_attached_groups += future.result()
+            attached_groups, list_attached_function = running_workers[future]
+            try:
+                attached_groups.update(future.result())
+            except Exception as e:
+                if errors is None:
+                    raise
+                errors.append(
+                    panoptes.aws.records.generate_collection_error(list_attached_function, e)
+                )
     return all_attached_groups
 
 
-def list_ec2_attached_secgroups(ec2) -> list:
+def list_ec2_attached_secgroups(inventory) -> set:
     """
     List security groups attached to EC2 instances
     """
-    ec2_attached_groups = []
-    boto_ec2_instances = ec2.describe_instances()
-    for instance_obj in boto_ec2_instances['Reservations']:
-        for instance in instance_obj['Instances']:
-            for security_group in instance['SecurityGroups']:
-                ec2_attached_groups.append(
-                    security_group['GroupId']
-                )
+    ec2_attached_groups = {group_id
+                           for instance in inventory.instances()
+                           for group_id in instance.GroupIds}
     return ec2_attached_groups
 
 
-def list_eni_attached_secgroups(ec2) -> list:
+def list_eni_attached_secgroups(inventory) -> set:
     """
     List security groups attached to Elastic Network Interfaces
     """
-    network_interfaces = []
-    next_token = None
-    has_next = True
-    while has_next:
-        args = {'MaxResults': 1000}
-        if next_token is not None:
-            args['NextToken'] = next_token
-
-        network_interfaces_result = ec2.describe_network_interfaces(**args)
-
-        network_interfaces += network_interfaces_result['NetworkInterfaces']
-
-        next_token = network_interfaces_result.get('NextToken')
-        has_next = next_token is not None
-
-    eni_attached_groups = [security_group['GroupId']
-                           for network_interface in network_interfaces
-                           for security_group in network_interface['Groups']]
+    eni_attached_groups = {group_id
+                           for network_interface in inventory.network_interfaces()
+                           for group_id in network_interface.GroupIds}
 
     return eni_attached_groups
 
 
-def list_rds_attached_secgroups(rds) -> list:
+def list_rds_attached_secgroups(rds) -> set:
     """
     List security groups attached to RDS instances
     """
-    rds_attached_groups = []
-    boto_rds_instances = rds.describe_db_instances()
-    for db_instance_obj in boto_rds_instances['DBInstances']:
+    rds_attached_groups = set()
+    db_instances = panoptes.aws.pagination.paginate(
+        rds, 'describe_db_instances', 'DBInstances'
+    )
+    for db_instance_obj in db_instances:
         for security_group in db_instance_obj['VpcSecurityGroups']:
-            rds_attached_groups.append(
+            rds_attached_groups.add(
                 security_group['VpcSecurityGroupId']
             )
     return rds_attached_groups
 
 
-def list_elb_attached_secgroups(elb) -> list:
+def list_elb_attached_secgroups(elb) -> set:
     """
     List security groups attached to Elastic Load Balancers
     """
-    elb_attached_groups = []
-    boto_load_balancers = elb.describe_load_balancers()
-    for elb_obj in boto_load_balancers['LoadBalancerDescriptions']:
+    elb_attached_groups = set()
+    load_balancers = panoptes.aws.pagination.paginate(
+        elb, 'describe_load_balancers', 'LoadBalancerDescriptions'
+    )
+    for elb_obj in load_balancers:
         for security_group in elb_obj['SecurityGroups']:
-            elb_attached_groups.append(
+            elb_attached_groups.add(
                 security_group
             )
     return elb_attached_groups
 
 
-def list_elbv2_attached_secgroups(elbv2) -> list:
+def list_elbv2_attached_secgroups(elbv2) -> set:
     """
     List security groups attached to Elastic Load Balancers V2
     """
-    elbv2_attached_groups = []
-    boto_load_balancers = elbv2.describe_load_balancers()
-    for elbv2_obj in boto_load_balancers['LoadBalancers']:
+    elbv2_attached_groups = set()
+    load_balancers = panoptes.aws.pagination.paginate(
+        elbv2, 'describe_load_balancers', 'LoadBalancers'
+    )
+    for elbv2_obj in load_balancers:
         if 'SecurityGroups' in elbv2_obj:
             for security_group in elbv2_obj['SecurityGroups']:
-                elbv2_attached_groups.append(
+                elbv2_attached_groups.add(
                     security_group
                 )
     return elbv2_attached_groups
 
 
-def list_lambda_attached_secgroups(lambda_aws) -> list:
+def list_lambda_attached_secgroups(lambda_aws) -> set:
     """
     List security groups attached to Lambda functions
     """
-    lambda_attached_groups = []
-    boto_lambda = lambda_aws.list_functions()
-    for lambda_obj in boto_lambda['Functions']:
+    lambda_attached_groups = set()
+    functions = panoptes.aws.pagination.paginate(
+        lambda_aws, 'list_functions', 'Functions'
+    )
+    for lambda_obj in functions:
         if 'VpcConfig' in lambda_obj:
             for security_group in (
                     lambda_obj['VpcConfig']['SecurityGroupIds']
             ):
-                lambda_attached_groups.append(
+                lambda_attached_groups.add(
                     security_group
                 )
     return lambda_attached_groups
 
 
-def list_elasticache_attached_secgroups(ecache) -> list:
+def list_elasticache_attached_secgroups(ecache) -> set:
     """
-    List security groups attached to ElastiCache
+    List VPC security groups attached to ElastiCache
     """
-    elasticache_attached_groups = []
-    boto_elasticache = ecache.describe_cache_clusters()
-    for elasticache_obj in boto_elasticache['CacheClusters']:
-        for security_group in elasticache_obj['CacheSecurityGroups']:
-            elasticache_attached_groups.append(
-                security_group['CacheSecurityGroupName']
-            )
+    elasticache_attached_groups = set()
+    cache_clusters = panoptes.aws.pagination.paginate(
+        ecache, 'describe_cache_clusters', 'CacheClusters'
+    )
+    for elasticache_obj in cache_clusters:
         if 'SecurityGroups' in elasticache_obj:
             for security_group in elasticache_obj['SecurityGroups']:
-                elasticache_attached_groups.append(
+                elasticache_attached_groups.add(
                     security_group['SecurityGroupId']
                 )
+    return elasticache_attached_groups
+
+
+def list_elasticache_attached_secgroup_names(ecache) -> set:
+    """
+    List security group names attached to ElastiCache through EC2-Classic
+    cache security groups. Accounts and regions without EC2-Classic reject
+    the call, which means no group is attached this way
+    """
+    elasticache_attached_groups = set()
     try:
-        boto_elasticache = ecache.describe_cache_security_groups()
-        for elasticache_obj in boto_elasticache['CacheSecurityGroups']:
+        cache_security_groups = panoptes.aws.pagination.paginate(
+            ecache, 'describe_cache_security_groups', 'CacheSecurityGroups'
+        )
+        for elasticache_obj in cache_security_groups:
             for security_group in elasticache_obj['EC2SecurityGroups']:
-                elasticache_attached_groups.append(
+                elasticache_attached_groups.add(
                     security_group['EC2SecurityGroupName']
                 )
-    except Exception as e:
-        pass
+    except botocore.exceptions.ClientError as e:
+        if e.response.get('Error', {}).get('Code') != CACHE_SECURITY_GROUPS_UNSUPPORTED_CODE:
+            raise
     return elasticache_attached_groups
 
 
-def list_ecs_attached_secgroups(ecs) -> list:
+def list_ecs_attached_secgroups(ecs) -> set:
     """
-    List security groups attached to ECS Services
+    List security groups attached to ECS Services. Clusters are listed in
+    parallel and their services are described, in batches, as soon as each
+    cluster is listed, so ECS takes about as long as its largest cluster
     """
-    ecs_attached_groups = []
+    ecs_attached_groups = set()
 
-    ecs_clusters = [
-        ecs_clusters for ecs_clusters in ecs.list_clusters()['clusterArns']
-    ]
+    ecs_clusters = panoptes.aws.pagination.paginate(
+        ecs, 'list_clusters', 'clusterArns'
+    )
 
-    ecs_cluster_services = []
-    for cluster in ecs_clusters:
-        boto_services = ecs.list_services(cluster=cluster)
-        if boto_services['serviceArns']:
-            ecs_cluster_services.append(
-                {
-                    'ClusterName': cluster,
-                    'Services': boto_services['serviceArns'],
-                }
-            )
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=panoptes.aws.authentication.MAX_POOL_CONNECTIONS
+    ) as executor:
+        listing_workers = {
+            executor.submit(
+                panoptes.aws.tracing.bind(list_ecs_cluster_services), ecs, cluster
+            ): cluster
+            for cluster in ecs_clusters
+        }
 
-    ECS_SERVICE_API_LIMIT = 10
-    for cluster in ecs_cluster_services:
-        for i in range(0, len(cluster['Services']), ECS_SERVICE_API_LIMIT):
-            boto_ecs = ecs.describe_services(
-                cluster=cluster['ClusterName'],
-                services=cluster['Services'][i:i+ECS_SERVICE_API_LIMIT]
-            )
-            for ecs_obj in boto_ecs['services']:
-                if 'networkConfiguration' in ecs_obj:
-                    for security_group in (
-                        ecs_obj['networkConfiguration']['awsvpcConfiguration']['securityGroups']
-                    ):
-                        ecs_attached_groups.append(
-                            security_group
-                        )
+        describing_workers = []
+        for future in concurrent.futures.as_completed(listing_workers):
+            cluster = listing_workers[future]
+            cluster_services = future.result()
+            for i in range(0, len(cluster_services), ECS_DESCRIBE_SERVICES_LIMIT):
+                describing_workers.append(executor.submit(
+                    panoptes.aws.tracing.bind(list_ecs_services_secgroups),
+                    ecs, cluster, cluster_services[i:i+ECS_DESCRIBE_SERVICES_LIMIT],
+                ))
+
+        for future in describing_workers:
+            ecs_attached_groups.update(future.result())
     return ecs_attached_groups
+
+
+def list_ecs_cluster_services(ecs, cluster: str) -> list:
+    """
+    List the ARNs of every service in an ECS cluster
+    """
+    return list(
+        panoptes.aws.pagination.paginate(
+            ecs, 'list_services', 'serviceArns',
+            page_size=ECS_LIST_SERVICES_PAGE_SIZE,
+            cluster=cluster,
+        )
+    )
+
+
+def list_ecs_services_secgroups(ecs, cluster: str, services: list) -> set:
+    """
+    List security groups attached to a batch of at most 10 ECS services
+    """
+    boto_ecs = ecs.describe_services(
+        cluster=cluster,
+        services=services,
+    )
+    return {
+        security_group
+        for ecs_obj in boto_ecs['services']
+        if 'networkConfiguration' in ecs_obj
+        for security_group in (
+            ecs_obj['networkConfiguration']['awsvpcConfiguration']['securityGroups']
+        )
+    }
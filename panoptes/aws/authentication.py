@@ -4,10 +4,43 @@ Using AWS best practices forcing the user to write Named Profiles instead of
 direct IAM credentials through CLI.
 """
 
+import collections
+import datetime
+import functools
+import threading
+import weakref
 import boto3
+import botocore.config
+import botocore.exceptions
 import panoptes
 
 
+ALL_REGIONS = "all"
+DEFAULT_REGION = "us-east-1"
+ASSUME_ROLE_SESSION_NAME = "panoptes"
+CREDENTIALS_EXPIRATION_MARGIN = 300
+MAX_POOL_CONNECTIONS = 16
+PANOPTES_SERVICES = [
+    'ec2',
+    'rds',
+    'elb',
+    'elbv2',
+    'lambda',
+    'elasticache',
+    'ecs',
+]
+
+AnalysisTarget = collections.namedtuple(
+    'AnalysisTarget', ['Name', 'Region', 'create_session']
+)
+
+_ASSUMED_ROLE_CACHE = {}
+_ASSUMED_ROLE_KEY_LOCKS = {}
+_ASSUMED_ROLE_LOCK = threading.Lock()
+_CLIENT_REGISTRY = weakref.WeakKeyDictionary()
+_CLIENT_REGISTRY_LOCK = threading.Lock()
+
+
 def create_session(
         region: str,
         profile: str = None,
@@ -28,11 +61,137 @@ def create_session(
     return session
 
 
+def list_analysis_targets(
+        regions: list,
+        profiles: list = None,
+        accounts: list = None,
+        role_name: str = None,
+        session_token: str = None) -> list:
+    """
+    Generates one AnalysisTarget per account/profile and region. When
+    accounts are given, sessions come from assuming role_name in each of
+    them with the first profile as source credentials. The "all" region
+    expands to every region enabled in the account
+    """
+    profiles = profiles or [None]
+    base_session = create_session(
+        region=DEFAULT_REGION if ALL_REGIONS in regions else regions[0],
+        profile=profiles[0],
+        session_token=session_token,
+    )
+    if ALL_REGIONS in regions:
+        regions = list_enabled_regions(base_session)
+
+    targets = []
+    if accounts:
+        if not role_name:
+            raise panoptes.aws.exceptions.PanoptesAWSAssumeRoleError(
+                "A role name is required to analyze other accounts."
+            )
+        for account_id in accounts:
+            for region in regions:
+                targets.append(AnalysisTarget(
+                    Name=account_id,
+                    Region=region,
+                    create_session=functools.partial(
+                        assume_role_session,
+                        base_session=base_session,
+                        account_id=account_id,
+                        role_name=role_name,
+                        region=region,
+                    ),
+                ))
+    else:
+        for profile in profiles:
+            for region in regions:
+                targets.append(AnalysisTarget(
+                    Name=profile or 'default',
+                    Region=region,
+                    create_session=functools.partial(
+                        create_session,
+                        region=region,
+                        profile=profile,
+                        session_token=session_token,
+                    ),
+                ))
+    return targets
+
+
+def assume_role_session(
+        base_session: boto3.session.Session,
+        account_id: str,
+        role_name: str,
+        region: str) -> boto3.session.Session:
+    """
+    Generates a Boto3 session for another account by assuming role_name in
+    it. STS credentials are cached and reused until they are about to expire
+    """
+    credentials = get_assumed_role_credentials(
+        base_session=base_session,
+        account_id=account_id,
+        role_name=role_name,
+    )
+    return boto3.Session(
+        aws_access_key_id=credentials['AccessKeyId'],
+        aws_secret_access_key=credentials['SecretAccessKey'],
+        aws_session_token=credentials['SessionToken'],
+        region_name=region,
+    )
+
+
+def get_assumed_role_credentials(
+        base_session: boto3.session.Session,
+        account_id: str,
+        role_name: str) -> dict:
+    """
+    Returns cached STS credentials for the account role, assuming it again
+    only when they are missing or expiring. Concurrent callers for the same
+    role wait for a single AssumeRole call
+    """
+    cache_key = (account_id, role_name)
+    with _ASSUMED_ROLE_LOCK:
+        role_lock = _ASSUMED_ROLE_KEY_LOCKS.setdefault(cache_key, threading.Lock())
+
+    with role_lock:
+        credentials = _ASSUMED_ROLE_CACHE.get(cache_key)
+        expiration_limit = (
+            datetime.datetime.now(datetime.timezone.utc)
+            + datetime.timedelta(seconds=CREDENTIALS_EXPIRATION_MARGIN)
+        )
+        if credentials is None or credentials['Expiration'] <= expiration_limit:
+            try:
+                credentials = get_client(base_session, 'sts').assume_role(
+                    RoleArn=f"arn:aws:iam::{account_id}:role/{role_name}",
+                    RoleSessionName=ASSUME_ROLE_SESSION_NAME,
+                )['Credentials']
+            except botocore.exceptions.ClientError as e:
+                raise panoptes.aws.exceptions.PanoptesAWSAssumeRoleError(
+                    f"Panoptes could not assume {role_name} in {account_id}: {e}"
+                )
+            _ASSUMED_ROLE_CACHE[cache_key] = credentials
+    return credentials
+
+
+def list_enabled_regions(session: boto3.session.Session) -> list:
+    """
+    List every region enabled for the account
+    """
+    boto_regions = get_client(session, 'ec2').describe_regions()
+    return sorted(region['RegionName'] for region in boto_regions['Regions'])
+
+
 def get_session_info(session: boto3.session.Session) -> str:
     """
     Get ARN from the current session
     """
-    return session.client('sts').get_caller_identity()['Arn']
+    return get_client(session, 'sts').get_caller_identity()['Arn']
+
+
+def get_account_id(arn: str) -> str:
+    """
+    Extracts the account ID from an IAM/STS ARN
+    """
+    return arn.split(':')[4]
 
 
 def get_boto_clients(session: boto3.session.Session) -> dict:
@@ -40,15 +199,39 @@ def get_boto_clients(session: boto3.session.Session) -> dict:
     Receives the session, and return all Panoptes used Boto3 Clients
     """
     return {
-        'ec2': session.client('ec2'),
-        'rds': session.client('rds'),
-        'elb': session.client('elb'),
-        'elbv2': session.client('elbv2'),
-        'lambda': session.client('lambda'),
-        'elasticache': session.client('elasticache'),
-        'ecs': session.client('ecs'),
+        service: get_client(session, service)
+        for service in PANOPTES_SERVICES
     }
 
 
+def get_client(session: boto3.session.Session, service: str):
+    """
+    Returns the session's Boto3 client for the service, building it only the
+    first time it is requested. Clients are shared by every worker thread
+    using the session, so their connection pool matches the thread pools.
+    Their request rate and retries are controlled by panoptes.aws.throttling
+    and their calls are counted by panoptes.aws.tracing
+    """
+    with _CLIENT_REGISTRY_LOCK:
+        registry = _CLIENT_REGISTRY.setdefault(
+            session, {'lock': threading.Lock(), 'clients': {}}
+        )
+
+    with registry['lock']:
+        if service not in registry['clients']:
+            with panoptes.aws.tracing.span(f"create_client:{service}"):
+                client = session.client(
+                    service,
+                    config=botocore.config.Config(
+                        max_pool_connections=MAX_POOL_CONNECTIONS,
+                        retries={'max_attempts': 0},
+                    ),
+                )
+            panoptes.aws.throttling.register_client(client)
+            panoptes.aws.tracing.register_client(client)
+            registry['clients'][service] = client
+        return registry['clients'][service]
+
+
 if __name__ == "__main__":
     pass
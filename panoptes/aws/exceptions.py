@@ -7,3 +7,18 @@ Collection of custom exceptions used to handle AWS errors
 class PanoptesAWSCreateSessionError(Exception):
     def __init__(self, message):
         super().__init__(message)
+
+
+class PanoptesAWSAssumeRoleError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class PanoptesAWSSnapshotError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class PanoptesAWSHistoryError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
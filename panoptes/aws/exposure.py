@@ -0,0 +1,78 @@
+""" Panoptes - AWS - Exposure
+
+Security group reference graph. A rule allowing traffic from another
+security group (UserIdGroupPairs) is an edge from the referenced group to
+the group owning the rule: whatever reaches the first one can reach the
+second. Groups open to every address are internet-facing, and every group
+reachable from them through references is transitively exposed.
+"""
+
+import collections
+import typing
+
+
+if typing.TYPE_CHECKING:
+    import panoptes
+
+
+class ExposureGraph:
+    """
+    Reference graph of the security groups of an account and region, built
+    while the groups are evaluated. Only names and edges are kept, not the
+    groups themselves
+    """
+
+    def __init__(self):
+        self.groups = {}
+        self.references = collections.defaultdict(list)
+        self.internet_facing = []
+
+    def add_security_group(self, security_group: "panoptes.aws.records.SecurityGroup", internet_facing: bool):
+        """
+        Adds a security group and the references of its ingress rules
+        """
+        self.groups[security_group.GroupId] = (security_group.GroupName, security_group.Description)
+        source_group_ids = {
+            source_group_id
+            for ingress_rule in security_group.IpPermissions
+            for source_group_id in ingress_rule.SourceGroupIds
+            if source_group_id != security_group.GroupId
+        }
+        for source_group_id in source_group_ids:
+            self.references[source_group_id].append(security_group.GroupId)
+        if internet_facing:
+            self.internet_facing.append(security_group.GroupId)
+
+    def iter_exposed_groups(self):
+        """
+        Yields (GroupId, GroupName, Description, Path) for every group
+        reachable from an internet-facing group, but not internet-facing
+        itself. Path holds the group IDs from the closest internet-facing
+        group to the exposed one.
+
+        A single breadth-first search starting from every internet-facing
+        group at once visits each group and reference once, so the pass is
+        linear in the size of the graph, cycles included, and every path is
+        one of the shortest
+        """
+        parents = dict.fromkeys(self.internet_facing)
+        pending = collections.deque(self.internet_facing)
+        exposed_group_ids = []
+        while pending:
+            group_id = pending.popleft()
+            for referencing_group_id in self.references.get(group_id, ()):
+                if referencing_group_id not in parents:
+                    parents[referencing_group_id] = group_id
+                    pending.append(referencing_group_id)
+                    exposed_group_ids.append(referencing_group_id)
+
+        for group_id in exposed_group_ids:
+            path = [group_id]
+            while parents[path[-1]] is not None:
+                path.append(parents[path[-1]])
+            group_name, description = self.groups[group_id]
+            yield group_id, group_name, description, tuple(reversed(path))
+
+
+if __name__ == "__main__":
+    pass
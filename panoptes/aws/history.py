@@ -0,0 +1,276 @@
+""" Panoptes - AWS - History
+
+Local analysis history. Every run stores its Metadata block and its
+findings, one row per unused group, unsafe or redundant rule and exposed
+group, in a SQLite database, so past runs can be queried by account,
+region, group, CIDR or status without keeping every output around.
+"""
+
+import datetime
+import json
+import os
+import re
+import sqlite3
+import panoptes
+
+
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    finished_at TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS findings (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    type TEXT NOT NULL,
+    account_id TEXT,
+    region TEXT,
+    group_id TEXT,
+    group_name TEXT,
+    ip_protocol TEXT,
+    from_port INTEGER,
+    to_port INTEGER,
+    cidr TEXT,
+    status TEXT,
+    finding TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_started_at ON runs (started_at);
+CREATE INDEX IF NOT EXISTS findings_run_id ON findings (run_id);
+CREATE INDEX IF NOT EXISTS findings_account_id ON findings (account_id);
+CREATE INDEX IF NOT EXISTS findings_region ON findings (region);
+CREATE INDEX IF NOT EXISTS findings_group_id ON findings (group_id);
+CREATE INDEX IF NOT EXISTS findings_cidr ON findings (cidr);
+CREATE INDEX IF NOT EXISTS findings_status ON findings (status);
+"""
+INSERT_RUN = "INSERT INTO runs (started_at, finished_at, metadata) VALUES (?, ?, ?)"
+INSERT_FINDING = """
+INSERT INTO findings (
+    run_id, type, account_id, region, group_id, group_name,
+    ip_protocol, from_port, to_port, cidr, status, finding
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+FINDING_TYPES = {
+    'UnusedGroups': ('UnusedGroup', None),
+    'UnsafeGroups': ('UnsafeIngress', 'UnsafePorts'),
+    'RedundantGroups': ('RedundantRule', 'RedundantRules'),
+    'ExposedGroups': ('ExposedGroup', None),
+}
+CIDR_FIELDS = ['CidrIp', 'CidrIpv6', 'PrefixListId']
+FILTER_COLUMNS = {
+    'finding_type': 'findings.type',
+    'account_id': 'findings.account_id',
+    'region': 'findings.region',
+    'group_id': 'findings.group_id',
+    'cidr': 'findings.cidr',
+    'status': 'findings.status',
+}
+SELECT_FINDINGS = """
+SELECT runs.run_id AS RunId, runs.started_at AS StartedAt, findings.finding AS Finding
+FROM findings JOIN runs ON runs.run_id = findings.run_id
+{where}
+ORDER BY runs.started_at, findings.rowid
+"""
+SELECT_GROUP_FINDINGS = """
+SELECT
+    findings.type AS Type,
+    findings.account_id AS AccountId,
+    findings.region AS Region,
+    findings.group_id AS GroupId,
+    MIN(findings.group_name) AS GroupName,
+    MIN(runs.started_at) AS FirstSeenAt,
+    MAX(runs.started_at) AS LastSeenAt,
+    COUNT(DISTINCT runs.run_id) AS Runs
+FROM findings JOIN runs ON runs.run_id = findings.run_id
+{where}
+GROUP BY findings.type, findings.account_id, findings.region, findings.group_id
+ORDER BY FirstSeenAt, findings.account_id, findings.region, findings.group_id
+"""
+SINCE_UNITS = {
+    'm': 'minutes',
+    'h': 'hours',
+    'd': 'days',
+    'w': 'weeks',
+}
+SINCE_PATTERN = re.compile(r"^(\d+)([mhdw])$")
+
+
+def open_history(history_path: str) -> sqlite3.Connection:
+    """
+    Opens the history database, creating it and its indexes when missing
+    """
+    directory = os.path.dirname(history_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    connection = sqlite3.connect(history_path)
+    connection.row_factory = sqlite3.Row
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version not in (0, SCHEMA_VERSION):
+        connection.close()
+        raise panoptes.aws.exceptions.PanoptesAWSHistoryError(
+            f"History {history_path} has schema version {version}, expected {SCHEMA_VERSION}"
+        )
+    with connection:
+        connection.executescript(SCHEMA)
+        connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return connection
+
+
+def iter_finding_rows(analysis: dict):
+    """
+    Yields the (type, account ID, region, group ID, group name, protocol,
+    from port, to port, CIDR, status, finding) row of every finding of the
+    analysis. Unsafe and redundant groups become one row per rule, with
+    the group fields copied into the finding
+    """
+    for section, (finding_type, rules_field) in FINDING_TYPES.items():
+        for entry in analysis['SecurityGroups'].get(section, ()):
+            if rules_field is None:
+                yield generate_finding_row(finding_type, entry)
+                continue
+            group = {key: value for key, value in entry.items() if key != rules_field}
+            for rule in entry[rules_field]:
+                yield generate_finding_row(finding_type, {**group, **rule})
+
+
+def generate_finding_row(finding_type: str, finding: dict) -> tuple:
+    """
+    Extracts the indexed columns of a finding, keeping the whole finding
+    as JSON
+    """
+    cidr = next(
+        (finding[cidr_field] for cidr_field in CIDR_FIELDS if finding.get(cidr_field) is not None),
+        None,
+    )
+    ip_protocol = finding.get('IpProtocol')
+    return (
+        finding_type,
+        finding['AccountId'],
+        finding['Region'],
+        finding['GroupId'],
+        finding['GroupName'],
+        str(ip_protocol) if ip_protocol is not None else None,
+        finding.get('FromPort'),
+        finding.get('ToPort'),
+        cidr,
+        finding.get('Status'),
+        json.dumps({'Type': finding_type, **finding}, separators=(',', ':')),
+    )
+
+
+def record_analysis(connection: sqlite3.Connection, analysis: dict) -> int:
+    """
+    Stores the Metadata and findings of an analysis as a new run, in a
+    single transaction, and returns its run ID
+    """
+    metadata = analysis['Metadata']
+    with connection:
+        run_id = connection.execute(
+            INSERT_RUN,
+            (
+                metadata['StartedAt'],
+                metadata['FinishedAt'],
+                json.dumps(metadata, separators=(',', ':')),
+            ),
+        ).lastrowid
+        connection.executemany(
+            INSERT_FINDING,
+            ((run_id,) + row for row in iter_finding_rows(analysis)),
+        )
+    return run_id
+
+
+def parse_since(since: str, now: datetime.datetime = None) -> str:
+    """
+    Converts a relative age like "30m", "12h", "7d" or "2w", or an ISO 8601
+    date or time, into the ISO 8601 time runs are compared against
+    """
+    match = SINCE_PATTERN.match(since.strip().lower())
+    if match:
+        delta = datetime.timedelta(**{SINCE_UNITS[match.group(2)]: int(match.group(1))})
+        return ((now or datetime.datetime.now()) - delta).isoformat()
+    try:
+        return datetime.datetime.fromisoformat(since.strip()).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid time {since!r}, expected an age like 7d or an ISO 8601 date") from None
+
+
+def generate_where_clause(since: str = None, **filters) -> tuple:
+    """
+    Generates the WHERE clause and parameters matching every given filter
+    """
+    conditions = []
+    parameters = []
+    for name, value in filters.items():
+        if value is not None:
+            conditions.append(f"{FILTER_COLUMNS[name]} = ?")
+            parameters.append(value)
+    if since is not None:
+        conditions.append("runs.started_at >= ?")
+        parameters.append(since)
+    if not conditions:
+        return "", parameters
+    return "WHERE " + " AND ".join(conditions), parameters
+
+
+def query_findings(
+        connection: sqlite3.Connection,
+        finding_type: str = None,
+        account_id: str = None,
+        region: str = None,
+        group_id: str = None,
+        cidr: str = None,
+        status: str = None,
+        since: str = None) -> list:
+    """
+    Returns every stored finding matching the filters, oldest run first,
+    with the RunId and StartedAt of its run. since is an ISO 8601 time
+    """
+    where, parameters = generate_where_clause(
+        since=since,
+        finding_type=finding_type,
+        account_id=account_id,
+        region=region,
+        group_id=group_id,
+        cidr=cidr,
+        status=status,
+    )
+    return [
+        {'RunId': row['RunId'], 'StartedAt': row['StartedAt'], **json.loads(row['Finding'])}
+        for row in connection.execute(SELECT_FINDINGS.format(where=where), parameters)
+    ]
+
+
+def query_group_findings(
+        connection: sqlite3.Connection,
+        finding_type: str = None,
+        account_id: str = None,
+        region: str = None,
+        group_id: str = None,
+        cidr: str = None,
+        status: str = None,
+        since: str = None) -> list:
+    """
+    Summarizes the stored findings matching the filters per finding type
+    and security group: the first and last runs it was found in and how
+    many runs found it, answering when a group first became unsafe
+    """
+    where, parameters = generate_where_clause(
+        since=since,
+        finding_type=finding_type,
+        account_id=account_id,
+        region=region,
+        group_id=group_id,
+        cidr=cidr,
+        status=status,
+    )
+    return [
+        dict(row)
+        for row in connection.execute(SELECT_GROUP_FINDINGS.format(where=where), parameters)
+    ]
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,256 @@
+""" Panoptes - AWS - Incremental
+
+Incremental analysis. Every security group is fingerprinted from its rules
+and attachment, the state of each run is stored, and the next run only
+evaluates groups whose fingerprint changed, reporting the delta of new,
+resolved and changed findings against the stored baseline.
+
+The user whitelist is compared as a digest, while the safe IPs collected
+from the account change with every instance launched or terminated, so
+they are stored as is and only groups with sources overlapping the
+addresses that changed are evaluated again.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import panoptes
+
+
+STATE_VERSION = 3
+FINDING_SECTIONS = {
+    'UnusedGroup': 'UnusedGroups',
+    'UnsafeGroup': 'UnsafeGroups',
+    'RedundantGroup': 'RedundantGroups',
+}
+
+
+def generate_target_key(account_id: str, region: str) -> str:
+    """
+    Generates the key of an account and region inside the state
+    """
+    return f"{account_id}:{region}"
+
+
+def generate_group_key(account_id: str, region: str, group_id: str) -> str:
+    """
+    Generates the key of a security group inside the state
+    """
+    return f"{account_id}:{region}:{group_id}"
+
+
+def get_target_key(group_key: str) -> str:
+    """
+    Returns the account and region key of a security group key
+    """
+    return group_key.rsplit(':', 1)[0]
+
+
+def fingerprint_security_group(
+        security_group: "panoptes.aws.records.SecurityGroup",
+        attached_groups: "panoptes.aws.records.AttachedGroups",
+        prefix_lists: dict = None) -> str:
+    """
+    Hashes everything the analysis of a security group depends on, including
+    the CIDRs of its prefix lists, except the whitelist, which is compared
+    once per account and region
+    """
+    is_attached = attached_groups is None or (
+        security_group.GroupName in attached_groups.GroupNames or
+        security_group.GroupId in attached_groups.GroupIds
+    )
+    prefix_list_cidrs = sorted(
+        (prefix_list_id, (prefix_lists or {}).get(prefix_list_id))
+        for ingress_rule in security_group.IpPermissions
+        for prefix_list_id in ingress_rule.PrefixListIds
+    )
+    return hashlib.blake2b(
+        repr((tuple(security_group), is_attached, prefix_list_cidrs)).encode(),
+        digest_size=16,
+    ).hexdigest()
+
+
+def get_unchanged_findings(
+        baseline: dict,
+        target_key: str,
+        whitelist_digest: str,
+        group_key: str,
+        fingerprint: str) -> tuple:
+    """
+    Returns the baseline (unused, unsafe, redundant) entries of a security
+    group if neither its fingerprint nor the user whitelist of its account
+    and region changed, and None otherwise
+    """
+    if baseline['WhitelistDigests'].get(target_key) != whitelist_digest:
+        return None
+    group = baseline['Groups'].get(group_key)
+    if group is None or group['Fingerprint'] != fingerprint:
+        return None
+    return group['UnusedGroup'], group['UnsafeGroup'], group['RedundantGroup']
+
+
+def create_empty_incremental() -> dict:
+    """
+    Generates the Incremental section of an analysis, holding the data
+    each account and region adds to the next state
+    """
+    return {'WhitelistDigests': {}, 'SafeIps': {}, 'Fingerprints': {}}
+
+
+def get_changed_safe_ips(baseline: dict, target_key: str, safe_ips: list) -> "panoptes.generic.whitelist.WhitelistIndex":
+    """
+    Returns an index of the addresses whitelisted by the safe IPs of only
+    one of the baseline and the current analysis, or None when the account
+    and region is not in the baseline
+    """
+    previous_safe_ips = baseline['SafeIps'].get(target_key)
+    if previous_safe_ips is None:
+        return None
+    return panoptes.generic.whitelist.WhitelistIndex(previous_safe_ips).symmetric_difference(
+        panoptes.generic.whitelist.WhitelistIndex(safe_ips)
+    )
+
+
+def create_empty_state() -> dict:
+    """
+    Generates the state used when there is no previous analysis
+    """
+    return {
+        'Version': STATE_VERSION,
+        'Metadata': None,
+        'WhitelistDigests': {},
+        'SafeIps': {},
+        'Groups': {},
+    }
+
+
+def load_state(state_path: str) -> dict:
+    """
+    Reads the state stored by the previous incremental analysis, returning
+    an empty state when there is none
+    """
+    if not os.path.exists(state_path):
+        return create_empty_state()
+
+    with gzip.open(state_path, 'rt', encoding='utf-8') as state_file:
+        state = json.load(state_file)
+    if state.get('Version') != STATE_VERSION:
+        return create_empty_state()
+    return state
+
+
+def save_state(state: dict, state_path: str):
+    """
+    Stores the state as gzip compressed JSON
+    """
+    directory = os.path.dirname(state_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    temporary_path = f"{state_path}.{os.getpid()}.tmp"
+    with gzip.open(temporary_path, 'wt', encoding='utf-8') as state_file:
+        json.dump(state, state_file, separators=(',', ':'))
+    os.replace(temporary_path, state_path)
+
+
+def build_state(analysis: dict, baseline: dict) -> dict:
+    """
+    Removes the incremental data from the analysis and builds the state of
+    this run from it. Accounts and regions not analyzed in this run keep
+    their baseline state
+    """
+    incremental = analysis.pop('Incremental', create_empty_incremental())
+    analyzed_targets = incremental['WhitelistDigests']
+
+    state = create_empty_state()
+    state['Metadata'] = {
+        'StartedAt': analysis['Metadata']['StartedAt'],
+        'FinishedAt': analysis['Metadata']['FinishedAt'],
+    }
+    state['WhitelistDigests'] = {
+        target_key: digest
+        for target_key, digest in baseline['WhitelistDigests'].items()
+        if target_key not in analyzed_targets
+    }
+    state['WhitelistDigests'].update(analyzed_targets)
+    state['SafeIps'] = {
+        target_key: safe_ips
+        for target_key, safe_ips in baseline['SafeIps'].items()
+        if target_key not in analyzed_targets
+    }
+    state['SafeIps'].update(incremental['SafeIps'])
+    state['Groups'] = {
+        group_key: group
+        for group_key, group in baseline['Groups'].items()
+        if get_target_key(group_key) not in analyzed_targets
+    }
+
+    for group_key, fingerprint in incremental['Fingerprints'].items():
+        state['Groups'][group_key] = {
+            'Fingerprint': fingerprint,
+            'UnusedGroup': None,
+            'UnsafeGroup': None,
+            'RedundantGroup': None,
+        }
+    for finding, section in FINDING_SECTIONS.items():
+        for entry in analysis['SecurityGroups'][section]:
+            group_key = generate_group_key(
+                entry['AccountId'], entry['Region'], entry['GroupId']
+            )
+            state['Groups'][group_key][finding] = entry
+    return state
+
+
+def generate_delta(baseline: dict, state: dict) -> dict:
+    """
+    Compares the findings of the groups that changed between the baseline
+    and the current state, considering only accounts and regions analyzed
+    in both of them
+    """
+    delta = {
+        'Baseline': baseline['Metadata'],
+        'NewFindings': [],
+        'ResolvedFindings': [],
+        'ChangedFindings': [],
+    }
+
+    changed_targets = {
+        target_key
+        for target_key, digest in state['WhitelistDigests'].items()
+        if baseline['WhitelistDigests'].get(target_key) != digest or
+        baseline['SafeIps'].get(target_key) != state['SafeIps'].get(target_key)
+    }
+    changed_groups = set()
+    for group_key, group in state['Groups'].items():
+        previous_group = baseline['Groups'].get(group_key)
+        if (
+                previous_group is None or
+                previous_group['Fingerprint'] != group['Fingerprint'] or
+                get_target_key(group_key) in changed_targets
+        ):
+            changed_groups.add(group_key)
+    for group_key in baseline['Groups']:
+        if group_key not in state['Groups'] and get_target_key(group_key) in state['WhitelistDigests']:
+            changed_groups.add(group_key)
+
+    empty_group = dict.fromkeys(FINDING_SECTIONS)
+    for group_key in sorted(changed_groups):
+        previous_group = baseline['Groups'].get(group_key, empty_group)
+        current_group = state['Groups'].get(group_key, empty_group)
+        for finding in FINDING_SECTIONS:
+            previous_entry = previous_group[finding]
+            current_entry = current_group[finding]
+            if previous_entry == current_entry:
+                continue
+            if previous_entry is None:
+                delta['NewFindings'].append(dict(current_entry, Finding=finding))
+            elif current_entry is None:
+                delta['ResolvedFindings'].append(dict(previous_entry, Finding=finding))
+            else:
+                delta['ChangedFindings'].append(dict(current_entry, Finding=finding))
+    return delta
+
+
+if __name__ == "__main__":
+    pass
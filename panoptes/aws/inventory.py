@@ -0,0 +1,118 @@
+""" Panoptes - AWS - Inventory
+
+Shared resource inventory of a session. Every EC2 describe sweep is fetched
+once per analysis, kept as compact records and consumed by both the
+attached and the whitelist stages, and every managed prefix list is
+resolved once.
+"""
+
+import threading
+import typing
+import panoptes
+
+
+if typing.TYPE_CHECKING:
+    import boto3
+
+
+ENI_PAGE_SIZE = 1000
+
+
+class Inventory:
+    """
+    Lazily fetches and memoizes the EC2 resources of a session. Concurrent
+    consumers of the same resource wait for a single sweep. The scope
+    filters ENIs to the analyzed VPCs
+    """
+
+    def __init__(self, session: "boto3.session.Session", scope: "panoptes.aws.scope.Scope" = None):
+        self.session = session
+        self.scope = scope
+        self._lock = threading.Lock()
+        self._resource_locks = {}
+        self._resources = {}
+
+    def instances(self) -> list:
+        """
+        List EC2 instances that are not terminated as
+        panoptes.aws.records.Instance
+        """
+        return self._get(
+            'instances', 'describe_instances', 'Reservations',
+            lambda reservation: [
+                panoptes.aws.records.normalize_instance(instance)
+                for instance in reservation['Instances']
+            ],
+            Filters=panoptes.aws.scope.generate_instance_filters(),
+        )
+
+    def network_interfaces(self) -> list:
+        """
+        List Elastic Network Interfaces as panoptes.aws.records.NetworkInterface
+        """
+        return self._get(
+            'network_interfaces', 'describe_network_interfaces', 'NetworkInterfaces',
+            lambda network_interface: [
+                panoptes.aws.records.normalize_network_interface(network_interface)
+            ],
+            page_size=ENI_PAGE_SIZE,
+            Filters=panoptes.aws.scope.generate_network_interface_filters(self.scope),
+        )
+
+    def vpcs(self) -> list:
+        """
+        List VPCs as panoptes.aws.records.Vpc
+        """
+        return self._get(
+            'vpcs', 'describe_vpcs', 'Vpcs',
+            lambda vpc: [panoptes.aws.records.normalize_vpc(vpc)],
+        )
+
+    def subnets(self) -> list:
+        """
+        List Subnets as panoptes.aws.records.Subnet
+        """
+        return self._get(
+            'subnets', 'describe_subnets', 'Subnets',
+            lambda subnet: [panoptes.aws.records.normalize_subnet(subnet)],
+        )
+
+    def addresses(self) -> list:
+        """
+        List Elastic IPs as panoptes.aws.records.Address
+        """
+        return self._get(
+            'addresses', 'describe_addresses', 'Addresses',
+            lambda address: [panoptes.aws.records.normalize_address(address)],
+        )
+
+    def prefix_list_entries(self, prefix_list_id: str) -> list:
+        """
+        List the CIDRs of a managed prefix list, fetched once per prefix list
+        """
+        return self._get(
+            f"prefix-list:{prefix_list_id}", 'get_managed_prefix_list_entries', 'Entries',
+            lambda entry: [entry['Cidr']],
+            PrefixListId=prefix_list_id,
+        )
+
+    def _get(self, name: str, operation: str, result_key: str, normalize, **kwargs) -> list:
+        with self._lock:
+            resource_lock = self._resource_locks.setdefault(name, threading.Lock())
+
+        with resource_lock:
+            if name not in self._resources:
+                ec2 = panoptes.aws.authentication.get_client(self.session, 'ec2')
+                with panoptes.aws.tracing.span(operation):
+                    self._resources[name] = [
+                        record
+                        for item in panoptes.aws.pagination.paginate(
+                            ec2, operation, result_key, **kwargs
+                        )
+                        for record in normalize(item)
+                    ]
+            return self._resources[name]
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,254 @@
+""" Panoptes - AWS - Matrix
+
+Exposure matrix of sensitive ports. The unsafe ingress rules of every
+analyzed group, which are already the sources not covered by the
+whitelist, are loaded into a columnar table, and a catalog of sensitive
+ports is checked against all of them at once, producing a group x port
+matrix with the worst status exposing each port.
+
+NumPy is optional. When it is installed, rules are compared in batches of
+array operations, otherwise the same matrix is built in pure Python.
+"""
+
+import csv
+import panoptes
+
+
+DEFAULT_SENSITIVE_PORTS = [
+    ('SSH', 'tcp', 22),
+    ('RDP', 'tcp', 3389),
+    ('MySQL', 'tcp', 3306),
+    ('PostgreSQL', 'tcp', 5432),
+    ('Redis', 'tcp', 6379),
+    ('Elasticsearch', 'tcp', 9200),
+    ('MongoDB', 'tcp', 27017),
+]
+PROTOCOL_CODES = {
+    '-1': -1,
+    'tcp': 6,
+    '6': 6,
+    'udp': 17,
+    '17': 17,
+}
+OTHER_PROTOCOL_CODE = 0
+EXPOSURE_STATUSES = [None, "warning", "alert"]
+ALL_PORTS = (0, 65535)
+ROW_BATCH_SIZE = 65536
+
+
+def create_sensitive_port(name: str, ip_protocol: str, port: int) -> "panoptes.aws.records.SensitivePort":
+    """
+    Creates a SensitivePort, validating its protocol and port
+    """
+    if ip_protocol not in ('tcp', 'udp'):
+        raise ValueError(f"Protocol of {name} must be tcp or udp, not {ip_protocol!r}")
+    if not ALL_PORTS[0] <= port <= ALL_PORTS[1]:
+        raise ValueError(f"Port of {name} must be between 0 and 65535, not {port}")
+    return panoptes.aws.records.SensitivePort(Name=name, IpProtocol=ip_protocol, Port=port)
+
+
+def get_default_sensitive_ports() -> list:
+    """
+    Returns the default catalog of sensitive ports
+    """
+    return [
+        create_sensitive_port(name, ip_protocol, port)
+        for name, ip_protocol, port in DEFAULT_SENSITIVE_PORTS
+    ]
+
+
+def parse_sensitive_ports(catalog: str) -> list:
+    """
+    Parses a comma-separated catalog of "[Name=]Port[/Protocol]" entries,
+    e.g. "SSH=22,53/udp". The protocol defaults to tcp, and ports without a
+    name take the one of the default catalog or "Port/Protocol"
+    """
+    default_names = {
+        (ip_protocol, port): name
+        for name, ip_protocol, port in DEFAULT_SENSITIVE_PORTS
+    }
+    sensitive_ports = []
+    for entry in catalog.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, separator, port_protocol = entry.rpartition('=')
+        port, _, ip_protocol = port_protocol.partition('/')
+        ip_protocol = ip_protocol.strip().lower() or 'tcp'
+        try:
+            port = int(port)
+        except ValueError:
+            raise ValueError(f"Invalid sensitive port {entry!r}, expected [Name=]Port[/Protocol]") from None
+        if not separator:
+            name = default_names.get((ip_protocol, port), f"{port}/{ip_protocol}")
+        sensitive_ports.append(create_sensitive_port(name.strip(), ip_protocol, port))
+    return sensitive_ports
+
+
+def generate_rule_table(unsafe_groups: list) -> dict:
+    """
+    Loads the unsafe ports of the analysis into columns, mapping
+    GroupIndex (the position of the group in unsafe_groups), Protocol,
+    FromPort, ToPort and Status to lists with one item per unsafe port.
+    Missing ports and all traffic rules cover every port
+    """
+    columns = {
+        'GroupIndex': [],
+        'Protocol': [],
+        'FromPort': [],
+        'ToPort': [],
+        'Status': [],
+    }
+    for group_index, unsafe_group in enumerate(unsafe_groups):
+        for unsafe_port in unsafe_group['UnsafePorts']:
+            protocol = PROTOCOL_CODES.get(str(unsafe_port['IpProtocol']).lower(), OTHER_PROTOCOL_CODE)
+            from_port = unsafe_port.get('FromPort')
+            to_port = unsafe_port.get('ToPort')
+            if protocol == PROTOCOL_CODES['-1'] or from_port is None or from_port == -1:
+                from_port, to_port = ALL_PORTS
+            columns['GroupIndex'].append(group_index)
+            columns['Protocol'].append(protocol)
+            columns['FromPort'].append(from_port)
+            columns['ToPort'].append(to_port if to_port is not None else from_port)
+            columns['Status'].append(EXPOSURE_STATUSES.index(unsafe_port['Status']))
+    return columns
+
+
+def import_numpy():
+    """
+    Returns the numpy module, or None when it is not installed
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def compute_exposure(columns: dict, groups: int, sensitive_ports: list) -> list:
+    """
+    Returns, for every group, the status code exposing each sensitive
+    port: 0 when none, 1 for warning and 2 for alert
+    """
+    numpy = import_numpy()
+    if numpy is None:
+        return compute_exposure_python(columns, groups, sensitive_ports)
+    return compute_exposure_numpy(numpy, columns, groups, sensitive_ports)
+
+
+def compute_exposure_numpy(numpy, columns: dict, groups: int, sensitive_ports: list) -> list:
+    """
+    Compares every batch of rules against every sensitive port with array
+    broadcasting, keeping the highest status per group and port
+    """
+    exposure = numpy.zeros((groups, len(sensitive_ports)), dtype=numpy.int8)
+    if not sensitive_ports or not columns['Status']:
+        return exposure.tolist()
+
+    group_index = numpy.asarray(columns['GroupIndex'], dtype=numpy.int32)
+    protocol = numpy.asarray(columns['Protocol'], dtype=numpy.int16)
+    from_port = numpy.asarray(columns['FromPort'], dtype=numpy.int32)
+    to_port = numpy.asarray(columns['ToPort'], dtype=numpy.int32)
+    status = numpy.asarray(columns['Status'], dtype=numpy.int8)
+    port_protocol = numpy.asarray(
+        [PROTOCOL_CODES[sensitive_port.IpProtocol] for sensitive_port in sensitive_ports],
+        dtype=numpy.int16,
+    )
+    port = numpy.asarray([sensitive_port.Port for sensitive_port in sensitive_ports], dtype=numpy.int32)
+
+    for start in range(0, len(status), ROW_BATCH_SIZE):
+        rows = slice(start, start + ROW_BATCH_SIZE)
+        batch_protocol = protocol[rows, None]
+        exposed = (
+            ((batch_protocol == PROTOCOL_CODES['-1']) | (batch_protocol == port_protocol))
+            & (from_port[rows, None] <= port)
+            & (to_port[rows, None] >= port)
+        )
+        exposed_rows, exposed_ports = numpy.nonzero(exposed)
+        exposed_rows += start
+        numpy.maximum.at(exposure, (group_index[exposed_rows], exposed_ports), status[exposed_rows])
+    return exposure.tolist()
+
+
+def compute_exposure_python(columns: dict, groups: int, sensitive_ports: list) -> list:
+    """
+    Builds the same exposure as compute_exposure_numpy, one rule at a time
+    """
+    exposure = [[0] * len(sensitive_ports) for _ in range(groups)]
+    ports = [
+        (position, PROTOCOL_CODES[sensitive_port.IpProtocol], sensitive_port.Port)
+        for position, sensitive_port in enumerate(sensitive_ports)
+    ]
+    rows = zip(columns['GroupIndex'], columns['Protocol'], columns['FromPort'], columns['ToPort'], columns['Status'])
+    for group_index, protocol, from_port, to_port, status in rows:
+        group_exposure = exposure[group_index]
+        for position, port_protocol, port in ports:
+            if (
+                    (protocol == PROTOCOL_CODES['-1'] or protocol == port_protocol) and
+                    from_port <= port <= to_port and
+                    status > group_exposure[position]
+            ):
+                group_exposure[position] = status
+    return exposure
+
+
+def generate_exposure_matrix(analysis: dict, sensitive_ports: list = None) -> dict:
+    """
+    Generates the ExposureMatrix section of an analysis: the sensitive
+    ports and every group exposing at least one of them, with the worst
+    status of each port, or None when the port is not exposed
+    """
+    if sensitive_ports is None:
+        sensitive_ports = get_default_sensitive_ports()
+    unsafe_groups = analysis['SecurityGroups']['UnsafeGroups']
+    columns = generate_rule_table(unsafe_groups)
+    exposure = compute_exposure(columns, len(unsafe_groups), sensitive_ports)
+
+    return {
+        'Ports': [dict(sensitive_port._asdict()) for sensitive_port in sensitive_ports],
+        'Groups': [
+            {
+                'GroupName': unsafe_group['GroupName'],
+                'GroupId': unsafe_group['GroupId'],
+                'AccountId': unsafe_group['AccountId'],
+                'Region': unsafe_group['Region'],
+                'Exposure': [EXPOSURE_STATUSES[status] for status in group_exposure],
+            }
+            for unsafe_group, group_exposure in zip(unsafe_groups, exposure)
+            if any(group_exposure)
+        ],
+    }
+
+
+def generate_port_label(port: dict) -> str:
+    """
+    Formats a sensitive port of the matrix as "Name (Port/Protocol)", or
+    just "Port/Protocol" when it has no name of its own
+    """
+    port_protocol = f"{port['Port']}/{port['IpProtocol']}"
+    if port['Name'] == port_protocol:
+        return port_protocol
+    return f"{port['Name']} ({port_protocol})"
+
+
+def write_exposure_csv(exposure_matrix: dict, stream):
+    """
+    Writes the exposure matrix as CSV, one row per group and one column per
+    sensitive port
+    """
+    writer = csv.writer(stream)
+    writer.writerow(
+        ['AccountId', 'Region', 'GroupId', 'GroupName'] + [
+            generate_port_label(port) for port in exposure_matrix['Ports']
+        ]
+    )
+    for group in exposure_matrix['Groups']:
+        writer.writerow(
+            [group['AccountId'], group['Region'], group['GroupId'], group['GroupName']] + [
+                status or "" for status in group['Exposure']
+            ]
+        )
+
+
+if __name__ == "__main__":
+    pass
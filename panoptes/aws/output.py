@@ -3,6 +3,7 @@
 Functions to print specific AWS analysis output.
 """
 
+import os
 import colorama
 import jinja2
 import panoptes
@@ -17,6 +18,7 @@ TEMPLATE = """{{ HEADER }}
 
 Cloud provider  ->  {{ CLOUD_PROVIDER_NAME }}
 Authentication  ->  {{ CLOUD_PROVIDER_AUTH }}
+Regions         ->  {{ ANALYSIS_REGIONS }}
 Started at      ->  {{ ANALYSIS_START_TIME }}
 Finished at     ->  {{ ANALYSIS_END_TIME }}
 
@@ -35,36 +37,71 @@ Finished at     ->  {{ ANALYSIS_END_TIME }}
 {{ rules }}
 {% endfor %}
 {% for notification in UNSAFE_RULES_NOTIFICATIONS %}{{ notification }}
-{% endfor %}"""
+{% endfor %}
+
+
+{{ THIRD_SECTION }}
+{% for secgroup,path in EXPOSED_SECGROUPS %}{{ secgroup }}
+{{ path }}
+{% endfor %}
+{% for notification in EXPOSED_SECGROUP_NOTIFICATIONS %}{{ notification }}
+{% endfor %}
+
+
+{{ FOURTH_SECTION }}
+{% for secgroup,rules in REDUNDANT_SECGROUPS %}{{ secgroup }}
+{{ rules }}
+{% endfor %}
+{% for notification in REDUNDANT_RULES_NOTIFICATIONS %}{{ notification }}
+{% endfor %}{% if EXPOSURE_MATRIX_NOTIFICATIONS %}
+
+
+{{ EXPOSURE_MATRIX_SECTION }}
+{% for secgroup,ports in EXPOSURE_MATRIX_SECGROUPS %}{{ secgroup }}
+{{ ports }}
+{% endfor %}
+{% for notification in EXPOSURE_MATRIX_NOTIFICATIONS %}{{ notification }}
+{% endfor %}{% endif %}{% if DELTA_NOTIFICATIONS %}
 
 
-def print_human(analysis):
+{{ DELTA_SECTION }}
+{% for notification in DELTA_NOTIFICATIONS %}{{ notification }}
+{% endfor %}{% endif %}"""
+HUMAN_OUTPUT_TEMPLATE = jinja2.Template(TEMPLATE)
+
+
+def print_human(analysis: dict) -> str:
     """
     Converts the AWS analysis dictionary into human readable output
     """
-    def generate_ingress_message(protocol, range, cidr_ip, color):
-        return (
-            colorama.Style.RESET_ALL
-            + colorama.Style.BRIGHT
-            + color
-            + "    "
-            + protocol + "   " + range + "   " + cidr_ip
-            + colorama.Style.RESET_ALL
-        )
+    return "".join(generate_human(analysis))
 
-    def generate_security_group_message(security_group):
-        return (
-            colorama.Style.RESET_ALL
-            + colorama.Style.BRIGHT
-            + colorama.Fore.MAGENTA + security_group['GroupId']
-            + "   "
-            + colorama.Fore.WHITE + security_group['GroupName']
-            + colorama.Style.RESET_ALL
-        )
 
-    human_output_template = jinja2.Template(TEMPLATE)
+def write_human(analysis: dict, stream):
+    """
+    Writes the human readable output into stream while it is rendered, so
+    pagers start showing it right away. Rendering stops if the reader
+    closes the stream
+    """
+    try:
+        for chunk in generate_human(analysis):
+            stream.write(chunk)
+        stream.write("\n")
+        stream.flush()
+    except BrokenPipeError:
+        # Keeps Python from failing again when flushing the closed pipe at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), stream.fileno())
+
+
+def generate_human(analysis: dict):
+    """
+    Renders the human readable output chunk by chunk. Security groups and
+    their rules are formatted only when the template reaches them
+    """
     unused_groups_list = analysis['SecurityGroups']['UnusedGroups']
     unsafe_groups_list = analysis['SecurityGroups']['UnsafeGroups']
+    exposed_groups_list = analysis['SecurityGroups'].get('ExposedGroups', [])
+    redundant_groups_list = analysis['SecurityGroups'].get('RedundantGroups', [])
 
     colorama.init()
     HEADER = panoptes.generic.output.generate_header_message(
@@ -74,14 +111,20 @@ def print_human(analysis):
     FIRST_SECTION = panoptes.generic.output.generate_section_message(
         "01. UNUSED SECURITY GROUPS"
     )
+    UNUSED_SECGROUPS = map(generate_security_group_message, unused_groups_list)
     UNUSED_SECGROUP_NOTIFICATIONS = []
     if unused_groups_list:
-        UNUSED_SECGROUPS = list(map(generate_security_group_message, unused_groups_list))
         UNUSED_SECGROUP_NOTIFICATIONS.append(
             panoptes.generic.output.generate_warning_message(
                 f"{len(unused_groups_list)} security groups found not being used"
             )
         )
+    elif analysis['Metadata'].get('UnusedGroupsSkipped'):
+        UNUSED_SECGROUP_NOTIFICATIONS.append(
+            panoptes.generic.output.generate_info_message(
+                "Unused security groups analysis skipped, attached groups were not collected"
+            )
+        )
     else:
         UNUSED_SECGROUP_NOTIFICATIONS.append(
             panoptes.generic.output.generate_info_message(
@@ -92,51 +135,19 @@ def print_human(analysis):
     SECOND_SECTION = panoptes.generic.output.generate_section_message(
         "02. SECURITY GROUPS WITH UNSAFE INGRESS RULES"
     )
+    UNSAFE_SECGROUPS = (
+        (generate_security_group_message(unsafe_group), generate_rules_message(unsafe_group))
+        for unsafe_group in unsafe_groups_list
+    )
     UNSAFE_RULES_NOTIFICATIONS = []
     if unsafe_groups_list:
-        alert_rules = 0
-        warning_rules = 0
-        UNSAFE_SECGROUPS = []
-        for unsafe_group in unsafe_groups_list:
-            secgroup = generate_security_group_message(unsafe_group)
-            rules = ""
-
-            for ingress in unsafe_group['UnsafePorts']:
-                # Prettifying "protocol"
-                protocol = ingress['IpProtocol'].upper()
-                if protocol == ALL_TRAFFIC_PROTOCOL:
-                    protocol = "All"
-
-                # Prettifying "range"
-                if any(k in ingress for k in ['FromPort', 'ToPort']):
-                    if ingress['FromPort'] == ingress["ToPort"]:
-                        range = (
-                            f"{ingress['FromPort']}"
-                        )
-                    else:
-                        range = (
-                            f"{ingress['FromPort']}-{ingress['ToPort']}"
-                        )
-                else:
-                    range = "All"
-
-                if ingress['Status'] == "warning":
-                    color = COLOR_WARNING
-                    warning_rules += 1
-                elif ingress['Status'] == "alert":
-                    color = COLOR_ALERT
-                    alert_rules += 1
-
-                rules += (
-                    generate_ingress_message(
-                        protocol=protocol,
-                        cidr_ip=ingress['CidrIp'],
-                        range=range,
-                        color=color,
-                    )+'\n'
-                )
-            UNSAFE_SECGROUPS.append((secgroup, rules))
-    
+        statuses = [
+            ingress['Status']
+            for unsafe_group in unsafe_groups_list
+            for ingress in unsafe_group['UnsafePorts']
+        ]
+        warning_rules = statuses.count("warning")
+        alert_rules = statuses.count("alert")
         if warning_rules:
             UNSAFE_RULES_NOTIFICATIONS.append(
                 panoptes.generic.output.generate_warning_message(
@@ -156,6 +167,106 @@ def print_human(analysis):
             )
         )
 
+    THIRD_SECTION = panoptes.generic.output.generate_section_message(
+        "03. SECURITY GROUPS EXPOSED THROUGH REFERENCES"
+    )
+    EXPOSED_SECGROUPS = (
+        (generate_security_group_message(exposed_group), generate_path_message(exposed_group))
+        for exposed_group in exposed_groups_list
+    )
+    EXPOSED_SECGROUP_NOTIFICATIONS = []
+    if exposed_groups_list:
+        EXPOSED_SECGROUP_NOTIFICATIONS.append(
+            panoptes.generic.output.generate_alert_message(
+                f"{len(exposed_groups_list)} security groups found reachable from internet-facing groups"
+            )
+        )
+    else:
+        EXPOSED_SECGROUP_NOTIFICATIONS.append(
+            panoptes.generic.output.generate_info_message(
+                "No security groups are exposed through references"
+            )
+        )
+
+    FOURTH_SECTION = panoptes.generic.output.generate_section_message(
+        "04. SECURITY GROUPS WITH REDUNDANT INGRESS RULES"
+    )
+    REDUNDANT_SECGROUPS = (
+        (generate_security_group_message(redundant_group), generate_redundant_rules_message(redundant_group))
+        for redundant_group in redundant_groups_list
+    )
+    REDUNDANT_RULES_NOTIFICATIONS = []
+    if redundant_groups_list:
+        redundant_rules = sum(len(redundant_group['RedundantRules']) for redundant_group in redundant_groups_list)
+        REDUNDANT_RULES_NOTIFICATIONS.append(
+            panoptes.generic.output.generate_warning_message(
+                f"{redundant_rules} rules found already covered by other rules of their groups"
+            )
+        )
+    else:
+        REDUNDANT_RULES_NOTIFICATIONS.append(
+            panoptes.generic.output.generate_info_message(
+                "No redundant rules found"
+            )
+        )
+
+    delta_section_number = 5
+    EXPOSURE_MATRIX_SECGROUPS = []
+    EXPOSURE_MATRIX_NOTIFICATIONS = []
+    if 'ExposureMatrix' in analysis:
+        delta_section_number += 1
+        exposure_matrix = analysis['ExposureMatrix']
+        EXPOSURE_MATRIX_SECGROUPS = (
+            (generate_security_group_message(group), generate_exposed_ports_message(exposure_matrix['Ports'], group))
+            for group in exposure_matrix['Groups']
+        )
+        if exposure_matrix['Groups']:
+            EXPOSURE_MATRIX_NOTIFICATIONS.append(
+                panoptes.generic.output.generate_alert_message(
+                    f"{len(exposure_matrix['Groups'])} security groups found exposing sensitive ports"
+                )
+            )
+        else:
+            EXPOSURE_MATRIX_NOTIFICATIONS.append(
+                panoptes.generic.output.generate_info_message(
+                    "No sensitive ports are exposed"
+                )
+            )
+    EXPOSURE_MATRIX_SECTION = panoptes.generic.output.generate_section_message(
+        "05. SECURITY GROUPS EXPOSING SENSITIVE PORTS"
+    )
+
+    DELTA_SECTION = panoptes.generic.output.generate_section_message(
+        f"{delta_section_number:02d}. CHANGES SINCE THE PREVIOUS ANALYSIS"
+    )
+    DELTA_NOTIFICATIONS = []
+    if 'Delta' in analysis:
+        delta = analysis['Delta']
+        if delta['NewFindings']:
+            DELTA_NOTIFICATIONS.append(
+                panoptes.generic.output.generate_warning_message(
+                    f"{len(delta['NewFindings'])} new findings"
+                )
+            )
+        if delta['ChangedFindings']:
+            DELTA_NOTIFICATIONS.append(
+                panoptes.generic.output.generate_warning_message(
+                    f"{len(delta['ChangedFindings'])} changed findings"
+                )
+            )
+        if delta['ResolvedFindings']:
+            DELTA_NOTIFICATIONS.append(
+                panoptes.generic.output.generate_info_message(
+                    f"{len(delta['ResolvedFindings'])} resolved findings"
+                )
+            )
+        if not DELTA_NOTIFICATIONS:
+            DELTA_NOTIFICATIONS.append(
+                panoptes.generic.output.generate_info_message(
+                    "No findings changed"
+                )
+            )
+
     start_time = panoptes.generic.helpers.generate_human_time(
         panoptes.generic.helpers.convert_string_datetime(analysis["Metadata"]["StartedAt"])
     )
@@ -171,14 +282,197 @@ def print_human(analysis):
         "SECOND_SECTION": SECOND_SECTION,
         "UNSAFE_SECGROUPS": UNSAFE_SECGROUPS,
         "UNSAFE_RULES_NOTIFICATIONS": UNSAFE_RULES_NOTIFICATIONS,
+        "THIRD_SECTION": THIRD_SECTION,
+        "EXPOSED_SECGROUPS": EXPOSED_SECGROUPS,
+        "EXPOSED_SECGROUP_NOTIFICATIONS": EXPOSED_SECGROUP_NOTIFICATIONS,
+        "FOURTH_SECTION": FOURTH_SECTION,
+        "REDUNDANT_SECGROUPS": REDUNDANT_SECGROUPS,
+        "REDUNDANT_RULES_NOTIFICATIONS": REDUNDANT_RULES_NOTIFICATIONS,
+        "EXPOSURE_MATRIX_SECTION": EXPOSURE_MATRIX_SECTION,
+        "EXPOSURE_MATRIX_SECGROUPS": EXPOSURE_MATRIX_SECGROUPS,
+        "EXPOSURE_MATRIX_NOTIFICATIONS": EXPOSURE_MATRIX_NOTIFICATIONS,
+        "DELTA_SECTION": DELTA_SECTION,
+        "DELTA_NOTIFICATIONS": DELTA_NOTIFICATIONS,
         "CLOUD_PROVIDER_NAME": analysis["Metadata"]["CloudProvider"]["Name"].upper(),
         "CLOUD_PROVIDER_AUTH": analysis["Metadata"]["CloudProvider"]["Auth"],
+        "ANALYSIS_REGIONS": ", ".join(analysis["Metadata"].get("Regions", [])),
         "ANALYSIS_START_TIME": start_time,
         "ANALYSIS_END_TIME": end_time,
     }
 
-    human_output = human_output_template.render(**template_variables)
-    return human_output
+    return HUMAN_OUTPUT_TEMPLATE.generate(**template_variables)
+
+
+def generate_security_group_message(security_group: dict) -> str:
+    """
+    Formats the line identifying a security group
+    """
+    return (
+        colorama.Style.RESET_ALL
+        + colorama.Style.BRIGHT
+        + colorama.Fore.MAGENTA + security_group['GroupId']
+        + "   "
+        + colorama.Fore.WHITE + security_group['GroupName']
+        + "   "
+        + colorama.Fore.CYAN + security_group.get('Region', '')
+        + colorama.Style.RESET_ALL
+    )
+
+
+def generate_rules_message(unsafe_group: dict) -> str:
+    """
+    Formats the unsafe ingress rules of a security group, one per line
+    """
+    return "".join(
+        generate_ingress_message(ingress) + "\n"
+        for ingress in unsafe_group['UnsafePorts']
+    )
+
+
+def generate_redundant_rules_message(redundant_group: dict) -> str:
+    """
+    Formats the redundant ingress rules of a security group and the rules
+    covering them, one per line
+    """
+    return "".join(
+        generate_redundant_rule_message(redundant_rule) + "\n"
+        for redundant_rule in redundant_group['RedundantRules']
+    )
+
+
+def generate_redundant_rule_message(redundant_rule: dict) -> str:
+    """
+    Formats a redundant ingress rule and the rule covering it
+    """
+    return (
+        colorama.Style.RESET_ALL
+        + colorama.Style.BRIGHT
+        + COLOR_WARNING
+        + "    "
+        + generate_rule_description(redundant_rule)
+        + "   covered by   "
+        + generate_rule_description(redundant_rule['CoveredBy'])
+        + colorama.Style.RESET_ALL
+    )
+
+
+def generate_exposed_ports_message(ports: list, group: dict) -> str:
+    """
+    Formats the sensitive ports exposed by a security group, colored by
+    their status
+    """
+    return "".join(
+        colorama.Style.RESET_ALL
+        + colorama.Style.BRIGHT
+        + (COLOR_ALERT if status == "alert" else COLOR_WARNING)
+        + "    "
+        + panoptes.aws.matrix.generate_port_label(port)
+        + colorama.Style.RESET_ALL
+        + "\n"
+        for port, status in zip(ports, group['Exposure'])
+        if status is not None
+    )
+
+
+def generate_path_message(exposed_group: dict) -> str:
+    """
+    Formats the references from an internet-facing group to an exposed
+    group
+    """
+    return (
+        colorama.Style.RESET_ALL
+        + colorama.Style.BRIGHT
+        + COLOR_ALERT
+        + "    "
+        + " -> ".join(exposed_group['Path'])
+        + colorama.Style.RESET_ALL
+    )
+
+
+def get_ingress_source(ingress: dict) -> str:
+    """
+    Returns the IPv4 CIDR, IPv6 CIDR or prefix list of an unsafe ingress
+    rule
+    """
+    return ingress.get('CidrIp') or ingress.get('CidrIpv6') or ingress['PrefixListId']
+
+
+def generate_ingress_message(ingress: dict) -> str:
+    """
+    Formats an unsafe ingress rule, colored by its status
+    """
+    color = COLOR_ALERT if ingress['Status'] == "alert" else COLOR_WARNING
+    return (
+        colorama.Style.RESET_ALL
+        + colorama.Style.BRIGHT
+        + color
+        + "    "
+        + generate_rule_description(ingress)
+        + colorama.Style.RESET_ALL
+    )
+
+
+def generate_rule_description(ingress: dict) -> str:
+    """
+    Formats the protocol, ports and source of an ingress rule
+    """
+    # Prettifying "protocol"
+    protocol = ingress['IpProtocol'].upper()
+    if protocol == ALL_TRAFFIC_PROTOCOL:
+        protocol = "All"
+
+    # Prettifying "range"
+    if 'FromPort' in ingress or 'ToPort' in ingress:
+        if ingress.get('FromPort') == ingress.get('ToPort'):
+            port_range = f"{ingress['FromPort']}"
+        else:
+            port_range = f"{ingress.get('FromPort')}-{ingress.get('ToPort')}"
+    else:
+        port_range = "All"
+
+    return protocol + "   " + port_range + "   " + get_ingress_source(ingress)
+
+
+def write_history(findings: list, stream):
+    """
+    Writes the findings of the analysis history, one line with the run and
+    security group of each finding followed by its rule or path
+    """
+    for finding in findings:
+        stream.write(finding['StartedAt'] + "   " + generate_history_message(finding) + "\n")
+        if finding['Type'] == 'UnsafeIngress':
+            stream.write(generate_ingress_message(finding) + "\n")
+        elif finding['Type'] == 'RedundantRule':
+            stream.write(generate_redundant_rule_message(finding) + "\n")
+        elif finding['Type'] == 'ExposedGroup':
+            stream.write(generate_path_message(finding) + "\n")
+
+
+def write_group_history(groups: list, stream):
+    """
+    Writes the per security group summary of the analysis history, with
+    the first and last runs finding each group
+    """
+    for group in groups:
+        stream.write(
+            generate_history_message(group) + "\n"
+            + f"    First seen {group['FirstSeenAt']}   Last seen {group['LastSeenAt']}   Runs {group['Runs']}\n"
+        )
+
+
+def generate_history_message(finding: dict) -> str:
+    """
+    Formats the type, account and security group of a finding of the
+    analysis history
+    """
+    return (
+        colorama.Style.RESET_ALL
+        + finding['Type']
+        + "   "
+        + finding['AccountId']
+        + "   "
+        + generate_security_group_message(finding)
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,95 @@
+""" Panoptes - AWS - Pagination
+
+Single pagination layer used by every AWS describe/list call. Records are
+yielded page by page, so no collector needs to hold a whole account's raw
+responses in memory.
+"""
+
+import queue
+import threading
+import panoptes
+
+
+PAGE_QUEUE_TIMEOUT = 0.1
+
+
+def paginate(client, operation: str, result_key: str, page_size: int = None, prefetch: bool = False, **kwargs):
+    """
+    Yields every record stored under result_key from all pages of the
+    operation. With prefetch enabled, the next page is requested in the
+    background while the current one is being consumed
+    """
+    pages = iter_pages(client, operation, page_size=page_size, **kwargs)
+    if prefetch:
+        pages = prefetch_pages(pages)
+    for page in pages:
+        yield from page.get(result_key, [])
+
+
+def iter_pages(client, operation: str, page_size: int = None, **kwargs):
+    """
+    Yields the raw pages from the operation, using botocore paginators when
+    the service model provides one and following NextToken otherwise
+    """
+    if client.can_paginate(operation):
+        if page_size is not None:
+            kwargs['PaginationConfig'] = {'PageSize': page_size}
+        for page in client.get_paginator(operation).paginate(**kwargs):
+            panoptes.aws.tracing.count('Pages')
+            yield page
+        return
+
+    api_call = getattr(client, operation)
+    while True:
+        page = api_call(**kwargs)
+        panoptes.aws.tracing.count('Pages')
+        yield page
+        next_token = page.get('NextToken')
+        if next_token is None:
+            return
+        kwargs['NextToken'] = next_token
+
+
+def prefetch_pages(pages, depth: int = 1):
+    """
+    Consumes the pages generator from a background thread, keeping at most
+    depth pages ready ahead of the caller
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+    finished = object()
+
+    def produce():
+        try:
+            for page in pages:
+                if not put(page):
+                    return
+            put(finished)
+        except Exception as e:
+            put(e)
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=PAGE_QUEUE_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    producer = threading.Thread(target=panoptes.aws.tracing.bind(produce), daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is finished:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+
+if __name__ == "__main__":
+    pass
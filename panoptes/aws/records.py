@@ -0,0 +1,257 @@
+""" Panoptes - AWS - Records
+
+Compact records holding only the fields Panoptes uses from each AWS
+resource, instead of the full Boto3 response dictionaries, and the typed
+findings produced by the analysis.
+"""
+
+import collections
+
+
+AttachedGroups = collections.namedtuple(
+    'AttachedGroups', ['GroupIds', 'GroupNames']
+)
+SecurityGroup = collections.namedtuple(
+    'SecurityGroup', ['GroupId', 'GroupName', 'Description', 'VpcId', 'IpPermissions']
+)
+IngressRule = collections.namedtuple(
+    'IngressRule', [
+        'IpProtocol',
+        'FromPort',
+        'ToPort',
+        'CidrIps',
+        'CidrIpv6s',
+        'PrefixListIds',
+        'SourceGroupIds',
+    ]
+)
+Snapshot = collections.namedtuple(
+    'Snapshot', [
+        'AccountId',
+        'Region',
+        'Auth',
+        'StartedAt',
+        'FinishedAt',
+        'SecurityGroups',
+        'AttachedGroups',
+        'SafeIps',
+        'CollectionErrors',
+        'PrefixLists',
+    ]
+)
+Instance = collections.namedtuple(
+    'Instance', ['GroupIds', 'IpAddresses']
+)
+NetworkInterface = collections.namedtuple(
+    'NetworkInterface', ['GroupIds']
+)
+Vpc = collections.namedtuple(
+    'Vpc', ['VpcId', 'CidrBlock', 'Ipv6CidrBlocks']
+)
+Subnet = collections.namedtuple(
+    'Subnet', ['SubnetId', 'CidrBlock', 'Ipv6CidrBlocks']
+)
+Address = collections.namedtuple(
+    'Address', ['PublicIp', 'PrivateIpAddress']
+)
+CollectionError = collections.namedtuple(
+    'CollectionError', ['Collector', 'Message']
+)
+
+UnusedGroupFinding = collections.namedtuple(
+    'UnusedGroupFinding', [
+        'GroupName',
+        'GroupId',
+        'Description',
+        'VpcId',
+        'AccountId',
+        'Region',
+    ]
+)
+UnsafeIngressFinding = collections.namedtuple(
+    'UnsafeIngressFinding', [
+        'GroupName',
+        'GroupId',
+        'Description',
+        'AccountId',
+        'Region',
+        'IpProtocol',
+        'FromPort',
+        'ToPort',
+        'CidrIp',
+        'CidrIpv6',
+        'PrefixListId',
+        'Status',
+    ]
+)
+RedundantRuleFinding = collections.namedtuple(
+    'RedundantRuleFinding', [
+        'GroupName',
+        'GroupId',
+        'Description',
+        'AccountId',
+        'Region',
+        'IpProtocol',
+        'FromPort',
+        'ToPort',
+        'CidrIp',
+        'CidrIpv6',
+        'CoveredBy',
+    ]
+)
+ExposedGroupFinding = collections.namedtuple(
+    'ExposedGroupFinding', [
+        'GroupName',
+        'GroupId',
+        'Description',
+        'AccountId',
+        'Region',
+        'Path',
+    ]
+)
+SensitivePort = collections.namedtuple(
+    'SensitivePort', ['Name', 'IpProtocol', 'Port']
+)
+TargetSummary = collections.namedtuple(
+    'TargetSummary', ['AccountId', 'Region', 'Auth', 'StartedAt', 'FinishedAt', 'CollectionErrors']
+)
+TargetError = collections.namedtuple(
+    'TargetError', ['Target', 'Region', 'Message']
+)
+
+
+def generate_collection_error(collector, error: Exception) -> CollectionError:
+    """
+    Records the failure of a collector function
+    """
+    return CollectionError(Collector=collector.__name__, Message=str(error))
+
+
+def normalize_security_group(security_group: dict) -> SecurityGroup:
+    """
+    Keeps only the fields used by the analysis from a security group
+    """
+    return SecurityGroup(
+        GroupId=security_group['GroupId'],
+        GroupName=security_group['GroupName'],
+        Description=security_group['Description'],
+        VpcId=security_group.get('VpcId'),
+        IpPermissions=tuple(
+            normalize_ingress_rule(ingress_entry)
+            for ingress_entry in security_group['IpPermissions']
+        ),
+    )
+
+
+def normalize_ingress_rule(ingress_entry: dict) -> IngressRule:
+    """
+    Keeps the protocol, port range and every source from an ingress
+    permission: IPv4 and IPv6 CIDRs, prefix lists and referenced security
+    groups
+    """
+    return IngressRule(
+        IpProtocol=ingress_entry['IpProtocol'],
+        FromPort=ingress_entry.get('FromPort'),
+        ToPort=ingress_entry.get('ToPort'),
+        CidrIps=tuple(
+            allowed_ip['CidrIp']
+            for allowed_ip in ingress_entry.get('IpRanges', [])
+        ),
+        CidrIpv6s=tuple(
+            allowed_ip['CidrIpv6']
+            for allowed_ip in ingress_entry.get('Ipv6Ranges', [])
+        ),
+        PrefixListIds=tuple(
+            prefix_list['PrefixListId']
+            for prefix_list in ingress_entry.get('PrefixListIds', [])
+        ),
+        SourceGroupIds=tuple(
+            group_pair['GroupId']
+            for group_pair in ingress_entry.get('UserIdGroupPairs', [])
+            if 'GroupId' in group_pair
+        ),
+    )
+
+
+def normalize_instance(instance: dict) -> Instance:
+    """
+    Keeps the attached security groups and every public and private IP from
+    an EC2 instance
+    """
+    ip_addresses = []
+    for instance_net in instance.get('NetworkInterfaces', []):
+        if 'Association' in instance_net:
+            ip_addresses.append(instance_net['Association']['PublicIp'])
+        if 'PrivateIpAddress' in instance_net:
+            ip_addresses.append(instance_net['PrivateIpAddress'])
+        for priv_ip in instance_net.get('PrivateIpAddresses', []):
+            if 'Association' in priv_ip:
+                ip_addresses.append(priv_ip['Association']['PublicIp'])
+            if 'PrivateIpAddress' in priv_ip:
+                ip_addresses.append(priv_ip['PrivateIpAddress'])
+    return Instance(
+        GroupIds=tuple(
+            security_group['GroupId']
+            for security_group in instance['SecurityGroups']
+        ),
+        IpAddresses=tuple(ip_addresses),
+    )
+
+
+def normalize_network_interface(network_interface: dict) -> NetworkInterface:
+    """
+    Keeps the attached security groups from an Elastic Network Interface
+    """
+    return NetworkInterface(
+        GroupIds=tuple(
+            security_group['GroupId']
+            for security_group in network_interface['Groups']
+        ),
+    )
+
+
+def normalize_vpc(vpc: dict) -> Vpc:
+    """
+    Keeps the ID, CIDR range and associated IPv6 CIDR ranges from a VPC
+    """
+    return Vpc(
+        VpcId=vpc['VpcId'],
+        CidrBlock=vpc['CidrBlock'],
+        Ipv6CidrBlocks=get_associated_ipv6_cidr_blocks(vpc),
+    )
+
+
+def normalize_subnet(subnet: dict) -> Subnet:
+    """
+    Keeps the ID, CIDR range and associated IPv6 CIDR ranges from a Subnet
+    """
+    return Subnet(
+        SubnetId=subnet.get('SubnetId'),
+        CidrBlock=subnet['CidrBlock'],
+        Ipv6CidrBlocks=get_associated_ipv6_cidr_blocks(subnet),
+    )
+
+
+def get_associated_ipv6_cidr_blocks(resource: dict) -> tuple:
+    """
+    Keeps the IPv6 CIDR ranges currently associated with a VPC or Subnet
+    """
+    return tuple(
+        association['Ipv6CidrBlock']
+        for association in resource.get('Ipv6CidrBlockAssociationSet', ())
+        if association.get('Ipv6CidrBlockState', {}).get('State') == 'associated'
+    )
+
+
+def normalize_address(address: dict) -> Address:
+    """
+    Keeps the public and private IPs from an Elastic IP
+    """
+    return Address(
+        PublicIp=address['PublicIp'],
+        PrivateIpAddress=address.get('PrivateIpAddress'),
+    )
+
+
+if __name__ == "__main__":
+    pass
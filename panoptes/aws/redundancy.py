@@ -0,0 +1,157 @@
+""" Panoptes - AWS - Redundancy
+
+Redundant ingress rules. A rule is redundant when another rule of the same
+security group already allows all of its traffic: the same protocol, or all
+traffic, a port range containing its ports and a CIDR containing its CIDR.
+Such rules change nothing but still count against the rules quota.
+
+Every IPv4 and IPv6 CIDR source of a group, with the address interval the
+analysis already computed for it, becomes an (address family, protocol,
+port interval, address interval) entry. Entries are sorted by address
+family and interval and swept once, so the check is O(n log n) per group
+instead of comparing every pair of rules. A CIDR only covers CIDRs of its
+own family: ::/0 never makes an IPv4 rule redundant.
+"""
+
+import bisect
+import functools
+
+
+ALL_TRAFFIC_PROTOCOL = "-1"
+PROTOCOL_NAMES = {
+    '1': 'icmp',
+    '6': 'tcp',
+    '17': 'udp',
+    '58': 'icmpv6',
+}
+ICMP_PROTOCOLS = {'icmp', 'icmpv6'}
+ICMP_CODES = 256
+ALL_PORTS = (0, 65535)
+TRAFFIC_CACHE_SIZE = 1024
+
+
+@functools.lru_cache(maxsize=TRAFFIC_CACHE_SIZE)
+def get_rule_traffic(ip_protocol: str, from_port: int, to_port: int) -> tuple:
+    """
+    Returns the (protocol, port start, port end) allowed by a rule. Groups
+    repeat the same few protocols and ports, so they are cached
+    """
+    protocol = normalize_protocol(ip_protocol)
+    if protocol == ALL_TRAFFIC_PROTOCOL:
+        return (protocol,) + ALL_PORTS
+    return (protocol,) + get_port_interval(protocol, from_port, to_port)
+
+
+def normalize_protocol(ip_protocol: str) -> str:
+    """
+    Converts protocol numbers into the names AWS uses for them
+    """
+    ip_protocol = str(ip_protocol).lower()
+    return PROTOCOL_NAMES.get(ip_protocol, ip_protocol)
+
+
+def get_port_interval(protocol: str, from_port: int, to_port: int) -> tuple:
+    """
+    Returns the ports of a rule as an inclusive interval. ICMP types and
+    codes are packed as type * 256 + code, so a whole type is an interval
+    too, and -1 or missing ports mean all of them
+    """
+    if from_port is None or from_port == -1:
+        return ALL_PORTS
+    if protocol in ICMP_PROTOCOLS:
+        if to_port is None or to_port == -1:
+            return from_port * ICMP_CODES, from_port * ICMP_CODES + ICMP_CODES - 1
+        return from_port * ICMP_CODES + to_port, from_port * ICMP_CODES + to_port
+    return from_port, to_port if to_port is not None else from_port
+
+
+def generate_rule_entries(cidr_sources: list) -> list:
+    """
+    Generates an (address family, address start, -address end, protocol
+    order, port start, -port end, position, protocol, ingress rule, source
+    field, source) entry for every (ingress rule, source field, source,
+    address interval) CIDR source, where the source field (CidrIp or
+    CidrIpv6) is the address family. Sorting them groups each family and
+    puts every CIDR before the CIDRs it contains and, within the same CIDR
+    and protocol, wider port ranges first. All traffic rules come first
+    """
+    entries = []
+    for position, (ingress_rule, source_field, source, (start, end)) in enumerate(cidr_sources):
+        protocol, port_start, port_end = get_rule_traffic(
+            ingress_rule.IpProtocol, ingress_rule.FromPort, ingress_rule.ToPort
+        )
+        entries.append((
+            source_field, start, -end, protocol != ALL_TRAFFIC_PROTOCOL, port_start, -port_end,
+            position, protocol, ingress_rule, source_field, source,
+        ))
+    entries.sort()
+    return entries
+
+
+def iter_redundant_rules(cidr_sources: list):
+    """
+    Receives the (ingress rule, source field, source, address interval)
+    CIDR sources of a security group and yields (ingress rule, source
+    field, source, covering ingress rule, covering source field, covering
+    source) for every one fully covered by another of the same address
+    family. Of identical sources, all but the first are redundant.
+
+    CIDRs of a family are either nested or disjoint, so while sweeping the
+    sorted entries the CIDRs containing the current one form a stack,
+    emptied whenever the family changes. Each CIDR keeps, per protocol, the
+    port starts seen so far and the running maximum of their port ends: a
+    port range is covered under that CIDR when the widest range starting
+    at or before it also ends after it
+    """
+    # Without any CIDR containing or equal to another, nothing can be covered
+    intervals = sorted((cidr_source[1],) + tuple(cidr_source[3]) for cidr_source in cidr_sources)
+    if all(
+            previous[0] != current[0] or previous[2] < current[1]
+            for previous, current in zip(intervals, intervals[1:])):
+        return
+
+    entries = generate_rule_entries(cidr_sources)
+
+    # Every item is [address family, address end, address start, {protocol: (port starts, running maximum ends)}]
+    enclosing_cidrs = []
+    for entry in entries:
+        family, start, negative_end, _, port_start, negative_port_end, _, protocol = entry[:8]
+        while enclosing_cidrs and (enclosing_cidrs[-1][0] != family or enclosing_cidrs[-1][1] < start):
+            enclosing_cidrs.pop()
+        if not enclosing_cidrs or enclosing_cidrs[-1][1] != -negative_end or enclosing_cidrs[-1][2] != start:
+            enclosing_cidrs.append([family, -negative_end, start, {}])
+
+        protocols = enclosing_cidrs[-1][3]
+        if protocols or len(enclosing_cidrs) > 1:
+            covering_entry = find_covering_entry(enclosing_cidrs, protocol, port_start, -negative_port_end)
+            if covering_entry is not None:
+                yield entry[8:] + covering_entry[8:]
+
+        port_starts, maximum_ends = protocols.setdefault(protocol, ([], []))
+        port_starts.append(port_start)
+        if not maximum_ends or -negative_port_end > maximum_ends[-1][0]:
+            maximum_ends.append((-negative_port_end, entry))
+        else:
+            maximum_ends.append(maximum_ends[-1])
+
+
+def find_covering_entry(enclosing_cidrs: list, protocol: str, port_start: int, port_end: int) -> tuple:
+    """
+    Returns an entry of the closest enclosing CIDR allowing the protocol and
+    port interval, or None
+    """
+    for _, _, _, protocols in reversed(enclosing_cidrs):
+        all_traffic = protocols.get(ALL_TRAFFIC_PROTOCOL)
+        if all_traffic is not None:
+            return all_traffic[1][0][1]
+        if protocol == ALL_TRAFFIC_PROTOCOL or protocol not in protocols:
+            continue
+        port_starts, maximum_ends = protocols[protocol]
+        position = bisect.bisect_right(port_starts, port_start)
+        if position and maximum_ends[position - 1][0] >= port_end:
+            return maximum_ends[position - 1][1]
+    return None
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,131 @@
+""" Panoptes - AWS - Scope
+
+Collection scope of an analysis. Restricting the analysis to some VPCs,
+security groups or tags is pushed to the EC2 API as server-side Filters,
+so targeted runs only transfer the resources they analyze.
+"""
+
+import collections
+import hashlib
+
+
+ACTIVE_INSTANCE_STATES = [
+    'pending',
+    'running',
+    'shutting-down',
+    'stopping',
+    'stopped',
+]
+ANY_FILTER_VALUE = "*"
+UNSAFE_ONLY_FILTER_NAMES = [
+    'ip-permission.cidr',
+    'ip-permission.ipv6-cidr',
+    'ip-permission.prefix-list-id',
+]
+
+Scope = collections.namedtuple(
+    'Scope', ['VpcIds', 'GroupIds', 'Tags', 'UnsafeOnly']
+)
+
+
+def create_scope(vpc_ids: list = None, group_ids: list = None, tags: list = None, unsafe_only: bool = False) -> Scope:
+    """
+    Creates a Scope. tags are "Key=Value" or "Key" strings, the latter
+    matching any value of the tag
+    """
+    return Scope(
+        VpcIds=tuple(vpc_ids or ()),
+        GroupIds=tuple(group_ids or ()),
+        Tags=tuple(parse_tag(tag) for tag in tags or ()),
+        UnsafeOnly=unsafe_only,
+    )
+
+
+def parse_tag(tag: str) -> tuple:
+    """
+    Splits a "Key=Value" tag into (Key, Value), returning (Key, None) when
+    there is no value
+    """
+    key, separator, value = tag.partition('=')
+    return key, value if separator else None
+
+
+def is_scoped(scope: Scope) -> bool:
+    """
+    Checks if the scope restricts which security groups are analyzed
+    """
+    return scope is not None and any(scope)
+
+
+def get_scope_digest(scope: Scope) -> str:
+    """
+    Returns a short hash of the scope, used to keep the cached snapshots of
+    different scopes apart
+    """
+    return hashlib.blake2b(repr(tuple(scope)).encode(), digest_size=4).hexdigest()
+
+
+def generate_security_group_filter_sets(scope: Scope) -> list:
+    """
+    Generates the Filters of every describe_security_groups query of the
+    scope. EC2 can not match any of several filter names, so the unsafe only
+    mode runs one query for IPv4 CIDR, one for IPv6 CIDR and one for prefix
+    list ingress rules, and groups matching more than one of them are
+    returned more than once
+    """
+    filters = generate_security_group_filters(scope)
+    if scope is None or not scope.UnsafeOnly:
+        return [filters]
+    return [
+        filters + [{'Name': filter_name, 'Values': [ANY_FILTER_VALUE]}]
+        for filter_name in UNSAFE_ONLY_FILTER_NAMES
+    ]
+
+
+def generate_security_group_filters(scope: Scope) -> list:
+    """
+    Generates the describe_security_groups Filters of the VPCs, groups and
+    tags of the scope. Different filters must all match, and any value of a
+    filter matches it, so every tag key gets its own filter, and tags
+    without a value match any value of their key with a wildcard
+    """
+    if scope is None:
+        return []
+
+    filters = []
+    if scope.VpcIds:
+        filters.append({'Name': 'vpc-id', 'Values': list(scope.VpcIds)})
+    if scope.GroupIds:
+        filters.append({'Name': 'group-id', 'Values': list(scope.GroupIds)})
+
+    tag_values = {}
+    for key, value in scope.Tags:
+        tag_values.setdefault(key, []).append(ANY_FILTER_VALUE if value is None else value)
+    for key, values in tag_values.items():
+        if ANY_FILTER_VALUE in values:
+            values = [ANY_FILTER_VALUE]
+        filters.append({'Name': f"tag:{key}", 'Values': values})
+    return filters
+
+
+def generate_network_interface_filters(scope: Scope) -> list:
+    """
+    Generates the describe_network_interfaces Filters of the scope. An ENI
+    can only use security groups from its own VPC, so ENIs from other VPCs
+    are not needed
+    """
+    if scope is None or not scope.VpcIds:
+        return []
+    return [{'Name': 'vpc-id', 'Values': list(scope.VpcIds)}]
+
+
+def generate_instance_filters() -> list:
+    """
+    Generates the describe_instances Filters. Terminated instances neither
+    use security groups nor own IPs anymore
+    """
+    return [{'Name': 'instance-state-name', 'Values': ACTIVE_INSTANCE_STATES}]
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,291 @@
+""" Panoptes - AWS - Snapshot
+
+Collects the raw inventory used by the analysis (security groups, attached
+groups and safe IPs) into a Snapshot, which can be stored as compressed
+JSON, cached per account and region, and analyzed again fully offline.
+"""
+
+import gzip
+import json
+import os
+import time
+import typing
+import panoptes
+
+
+if typing.TYPE_CHECKING:
+    import boto3
+
+
+SNAPSHOT_VERSION = 2
+SNAPSHOT_EXTENSION = ".json.gz"
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+    'panoptes',
+)
+
+
+def collect_snapshot(
+        session: "boto3.session.Session",
+        fast: bool = False,
+        scope: "panoptes.aws.scope.Scope" = None) -> "panoptes.aws.records.Snapshot":
+    """
+    Collects everything the analysis needs from the session. Security groups
+    are kept as a lazy iterator, so they can be analyzed while the next
+    page is still being fetched.
+
+    The scope is applied server-side. In its unsafe only mode, groups
+    without CIDR or prefix list ingress rules are not fetched and the
+    attached groups are not collected, leaving AttachedGroups as None.
+
+    Prefix lists are resolved as the security groups referencing them are
+    fetched, so PrefixLists is complete once SecurityGroups is consumed
+    """
+    started_at = panoptes.generic.helpers.get_current_time()
+    with panoptes.aws.tracing.span('get_session_info'):
+        session_arn = panoptes.aws.authentication.get_session_info(session)
+
+    inventory = panoptes.aws.inventory.Inventory(session, scope=scope)
+    collection_errors = []
+    with panoptes.aws.tracing.span('list_all_safe_ips'):
+        safe_ips = panoptes.aws.whitelist.list_all_safe_ips(
+            session, inventory=inventory, errors=collection_errors
+        )
+    attached_groups = None
+    if scope is None or not scope.UnsafeOnly:
+        with panoptes.aws.tracing.span('list_all_attached_secgroups'):
+            attached_groups = panoptes.aws.attached.list_all_attached_secgroups(
+                session, inventory=inventory, fast=fast, errors=collection_errors
+            )
+    prefix_lists = {}
+    security_groups = panoptes.aws.tracing.trace_iterator(
+        'describe_security_groups',
+        resolve_prefix_lists(
+            iter_security_groups(session, scope),
+            inventory=inventory,
+            prefix_lists=prefix_lists,
+            errors=collection_errors,
+        ),
+    )
+
+    return panoptes.aws.records.Snapshot(
+        AccountId=panoptes.aws.authentication.get_account_id(session_arn),
+        Region=session.region_name,
+        Auth=session_arn,
+        StartedAt=started_at,
+        FinishedAt=panoptes.generic.helpers.get_current_time(),
+        SecurityGroups=security_groups,
+        AttachedGroups=attached_groups,
+        SafeIps=safe_ips,
+        CollectionErrors=collection_errors,
+        PrefixLists=prefix_lists,
+    )
+
+
+def iter_security_groups(session: "boto3.session.Session", scope: "panoptes.aws.scope.Scope" = None):
+    """
+    Yields every security group of the scope once, as
+    panoptes.aws.records.SecurityGroup
+    """
+    ec2 = panoptes.aws.authentication.get_client(session, 'ec2')
+    seen_group_ids = set()
+    for filters in panoptes.aws.scope.generate_security_group_filter_sets(scope):
+        for security_group in panoptes.aws.pagination.paginate(
+                ec2, 'describe_security_groups', 'SecurityGroups',
+                prefetch=True,
+                Filters=filters):
+            if security_group['GroupId'] in seen_group_ids:
+                continue
+            seen_group_ids.add(security_group['GroupId'])
+            yield panoptes.aws.records.normalize_security_group(security_group)
+
+
+def resolve_prefix_lists(
+        security_groups,
+        inventory: "panoptes.aws.inventory.Inventory",
+        prefix_lists: dict,
+        errors: list):
+    """
+    Yields the security groups after storing in prefix_lists the CIDRs of
+    every prefix list their rules reference. Prefix lists that can not be
+    read are stored as None and recorded in errors
+    """
+    for security_group in security_groups:
+        for ingress_rule in security_group.IpPermissions:
+            for prefix_list_id in ingress_rule.PrefixListIds:
+                if prefix_list_id in prefix_lists:
+                    continue
+                try:
+                    prefix_lists[prefix_list_id] = tuple(
+                        inventory.prefix_list_entries(prefix_list_id)
+                    )
+                except Exception as e:
+                    prefix_lists[prefix_list_id] = None
+                    errors.append(panoptes.aws.records.generate_collection_error(
+                        inventory.prefix_list_entries, e
+                    ))
+        yield security_group
+
+
+def collect_cached_snapshot(
+        session: "boto3.session.Session",
+        fast: bool = False,
+        cache_ttl: int = 0,
+        cache_dir: str = None,
+        scope: "panoptes.aws.scope.Scope" = None) -> "panoptes.aws.records.Snapshot":
+    """
+    Returns the cached snapshot of the session's account and region when it
+    is younger than cache_ttl seconds, collecting and caching a new one
+    otherwise. Snapshots with collection errors are not cached, and cached
+    snapshots of an older version are collected again
+    """
+    account_id = panoptes.aws.authentication.get_account_id(
+        panoptes.aws.authentication.get_session_info(session)
+    )
+    cache_path = get_cache_path(
+        account_id=account_id,
+        region=session.region_name,
+        fast=fast,
+        cache_dir=cache_dir,
+        scope=scope,
+    )
+    if is_cache_fresh(cache_path, cache_ttl):
+        try:
+            with panoptes.aws.tracing.span('load_snapshot'):
+                return load_snapshot(cache_path)
+        except panoptes.aws.exceptions.PanoptesAWSSnapshotError:
+            pass
+
+    snapshot = collect_snapshot(session, fast=fast, scope=scope)
+    snapshot = snapshot._replace(SecurityGroups=list(snapshot.SecurityGroups))
+    if not snapshot.CollectionErrors:
+        save_snapshot(snapshot, cache_path)
+    return snapshot
+
+
+def get_cache_path(
+        account_id: str,
+        region: str,
+        fast: bool = False,
+        cache_dir: str = None,
+        scope: "panoptes.aws.scope.Scope" = None) -> str:
+    """
+    Generates the cache file path of an account and region
+    """
+    mode = "-fast" if fast else ""
+    if panoptes.aws.scope.is_scoped(scope):
+        mode += f"-{panoptes.aws.scope.get_scope_digest(scope)}"
+    return os.path.join(
+        cache_dir or DEFAULT_CACHE_DIR,
+        f"{account_id}-{region}{mode}{SNAPSHOT_EXTENSION}",
+    )
+
+
+def is_cache_fresh(cache_path: str, cache_ttl: int) -> bool:
+    """
+    Checks if the cache file exists and is younger than cache_ttl seconds
+    """
+    try:
+        return time.time() - os.path.getmtime(cache_path) < cache_ttl
+    except OSError:
+        return False
+
+
+def save_snapshot(snapshot: "panoptes.aws.records.Snapshot", snapshot_path: str):
+    """
+    Stores the snapshot as gzip compressed JSON. Records are written as
+    arrays instead of objects to keep the file compact
+    """
+    directory = os.path.dirname(snapshot_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    content = {
+        'Version': SNAPSHOT_VERSION,
+        'AccountId': snapshot.AccountId,
+        'Region': snapshot.Region,
+        'Auth': snapshot.Auth,
+        'StartedAt': snapshot.StartedAt,
+        'FinishedAt': snapshot.FinishedAt,
+        'SecurityGroups': list(snapshot.SecurityGroups),
+        'AttachedGroups': None if snapshot.AttachedGroups is None else {
+            'GroupIds': sorted(snapshot.AttachedGroups.GroupIds),
+            'GroupNames': sorted(snapshot.AttachedGroups.GroupNames),
+        },
+        'SafeIps': list(snapshot.SafeIps),
+        'CollectionErrors': list(snapshot.CollectionErrors),
+        'PrefixLists': dict(snapshot.PrefixLists),
+    }
+    temporary_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    with gzip.open(temporary_path, 'wt', encoding='utf-8') as snapshot_file:
+        json.dump(content, snapshot_file, separators=(',', ':'))
+    os.replace(temporary_path, snapshot_path)
+
+
+def load_snapshot(snapshot_path: str) -> "panoptes.aws.records.Snapshot":
+    """
+    Reads a snapshot stored by save_snapshot
+    """
+    with gzip.open(snapshot_path, 'rt', encoding='utf-8') as snapshot_file:
+        content = json.load(snapshot_file)
+
+    if content.get('Version') != SNAPSHOT_VERSION:
+        raise panoptes.aws.exceptions.PanoptesAWSSnapshotError(
+            f"Panoptes can not read the snapshot {snapshot_path}: "
+            f"unsupported version {content.get('Version')}."
+        )
+
+    return panoptes.aws.records.Snapshot(
+        AccountId=content['AccountId'],
+        Region=content['Region'],
+        Auth=content['Auth'],
+        StartedAt=content['StartedAt'],
+        FinishedAt=content['FinishedAt'],
+        SecurityGroups=[
+            load_security_group(security_group)
+            for security_group in content['SecurityGroups']
+        ],
+        AttachedGroups=None if content['AttachedGroups'] is None else panoptes.aws.records.AttachedGroups(
+            GroupIds=set(content['AttachedGroups']['GroupIds']),
+            GroupNames=set(content['AttachedGroups']['GroupNames']),
+        ),
+        SafeIps=content['SafeIps'],
+        CollectionErrors=[
+            panoptes.aws.records.CollectionError(*collection_error)
+            for collection_error in content['CollectionErrors']
+        ],
+        PrefixLists={
+            prefix_list_id: None if cidrs is None else tuple(cidrs)
+            for prefix_list_id, cidrs in content['PrefixLists'].items()
+        },
+    )
+
+
+def load_security_group(security_group: list) -> "panoptes.aws.records.SecurityGroup":
+    """
+    Rebuilds a SecurityGroup record from its stored array
+    """
+    group_id, group_name, description, vpc_id, ip_permissions = security_group
+    return panoptes.aws.records.SecurityGroup(
+        GroupId=group_id,
+        GroupName=group_name,
+        Description=description,
+        VpcId=vpc_id,
+        IpPermissions=tuple(
+            panoptes.aws.records.IngressRule(
+                IpProtocol=ip_protocol,
+                FromPort=from_port,
+                ToPort=to_port,
+                CidrIps=tuple(cidr_ips),
+                CidrIpv6s=tuple(cidr_ipv6s),
+                PrefixListIds=tuple(prefix_list_ids),
+                SourceGroupIds=tuple(source_group_ids),
+            )
+            for ip_protocol, from_port, to_port, cidr_ips, cidr_ipv6s, prefix_list_ids, source_group_ids
+            in ip_permissions
+        ),
+    )
+
+
+if __name__ == "__main__":
+    pass
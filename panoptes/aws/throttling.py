@@ -0,0 +1,200 @@
+""" Panoptes - AWS - Throttling
+
+Client-side rate control shared by every collector. Each service of a
+session gets a token bucket that every HTTP attempt has to pass through.
+Its rate is halved on throttling responses and grows back additively on
+successes (AIMD), so collectors converge to the highest rate AWS accepts.
+
+Retries are decided here instead of by botocore, and every retry is drawn
+from a budget shared by the whole run. Throttled accounts back off instead
+of multiplying their retries, and the budget is slowly refilled by
+successful calls.
+"""
+
+import functools
+import random
+import threading
+import time
+import botocore.exceptions
+
+
+INITIAL_REQUEST_RATE = 20.0
+MIN_REQUEST_RATE = 1.0
+MAX_REQUEST_RATE = 100.0
+REQUEST_RATE_INCREASE = 1.0
+REQUEST_RATE_DECREASE_FACTOR = 0.5
+THROTTLING_COOLDOWN = 1.0
+
+MAX_ATTEMPTS = 8
+RETRY_BUDGET_CAPACITY = 500
+RETRY_BUDGET_REFILL = 0.1
+BASE_BACKOFF = 0.2
+MAX_BACKOFF = 20.0
+
+THROTTLING_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'TransactionInProgressException',
+    'SlowDown',
+    'BandwidthLimitExceeded',
+    'EC2ThrottledException',
+    'PriorRequestNotComplete',
+}
+THROTTLING_STATUS_CODES = {429}
+TRANSIENT_STATUS_CODES = {500, 502, 503, 504}
+TRANSIENT_EXCEPTIONS = (
+    botocore.exceptions.ConnectionError,
+    botocore.exceptions.HTTPClientError,
+)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket holding at most one second of requests, whose
+    rate adapts to the throttling responses of the service
+    """
+
+    def __init__(self, rate: float = INITIAL_REQUEST_RATE):
+        self.rate = rate
+        self._tokens = rate
+        self._updated_at = time.monotonic()
+        self._throttled_at = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a request can be sent
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.rate,
+                    self._tokens + (now - self._updated_at) * self.rate,
+                )
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        """
+        Grows the rate by about REQUEST_RATE_INCREASE requests per second,
+        every second
+        """
+        with self._lock:
+            self.rate = min(MAX_REQUEST_RATE, self.rate + REQUEST_RATE_INCREASE / self.rate)
+
+    def on_throttling(self):
+        """
+        Cuts the rate, at most once per THROTTLING_COOLDOWN seconds, since
+        the requests already in flight are throttled by the same burst
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._throttled_at is not None and now - self._throttled_at < THROTTLING_COOLDOWN:
+                return
+            self._throttled_at = now
+            self.rate = max(MIN_REQUEST_RATE, self.rate * REQUEST_RATE_DECREASE_FACTOR)
+            self._tokens = min(self._tokens, 0)
+
+
+class RetryBudget:
+    """
+    Thread-safe number of retries left, refilled by successful requests
+    """
+
+    def __init__(self, capacity: float = RETRY_BUDGET_CAPACITY):
+        self.capacity = capacity
+        self._tokens = capacity
+        self._lock = threading.Lock()
+
+    def consume(self) -> bool:
+        """
+        Takes one retry from the budget, returning False when it is empty
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def refill(self):
+        """
+        Gives back a fraction of a retry after a successful request
+        """
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + RETRY_BUDGET_REFILL)
+
+
+_RETRY_BUDGET = RetryBudget()
+
+
+def register_client(client, retry_budget: RetryBudget = None) -> TokenBucket:
+    """
+    Makes every request of the client wait for its own token bucket and
+    lets this module decide its retries. The client must be created with
+    botocore retries disabled
+    """
+    bucket = TokenBucket()
+    client.meta.events.register(
+        'before-send',
+        functools.partial(wait_for_token, bucket),
+    )
+    client.meta.events.register(
+        'needs-retry',
+        functools.partial(check_retry, bucket, retry_budget or _RETRY_BUDGET),
+    )
+    return bucket
+
+
+def wait_for_token(bucket: TokenBucket, **kwargs):
+    """
+    before-send handler delaying the request until the bucket allows it
+    """
+    bucket.acquire()
+
+
+def check_retry(bucket: TokenBucket, retry_budget: RetryBudget, response=None,
+                attempts: int = 1, caught_exception=None, **kwargs):
+    """
+    needs-retry handler. Adapts the bucket to the response and returns the
+    seconds to wait before retrying, or None when the request must not be
+    retried
+    """
+    if caught_exception is not None:
+        if not isinstance(caught_exception, TRANSIENT_EXCEPTIONS):
+            return None
+    else:
+        http_response, parsed_response = response
+        error_code = parsed_response.get('Error', {}).get('Code')
+        if error_code in THROTTLING_ERROR_CODES or http_response.status_code in THROTTLING_STATUS_CODES:
+            bucket.on_throttling()
+        elif http_response.status_code not in TRANSIENT_STATUS_CODES:
+            if http_response.status_code < 400:
+                bucket.on_success()
+                retry_budget.refill()
+            return None
+
+    if attempts >= MAX_ATTEMPTS or not retry_budget.consume():
+        return None
+    return get_backoff_delay(attempts)
+
+
+def get_backoff_delay(attempts: int) -> float:
+    """
+    Exponential backoff with full jitter
+    """
+    return random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempts))
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,266 @@
+""" Panoptes - AWS - Tracing
+
+Lightweight timing instrumentation. Every analysis of an account and region
+is a trace, made of spans for its stages and collector functions. Spans
+follow the work across worker threads and count the API calls, HTTP
+requests, pages and response bytes made while they are active, including
+the ones of their child spans.
+
+Traces are reported as Metadata.Timings and can be converted into the
+Chrome trace event format, readable by chrome://tracing and Perfetto.
+"""
+
+import contextlib
+import functools
+import threading
+import time
+
+
+COUNTERS = ['Calls', 'Requests', 'Pages', 'Bytes']
+
+_CURRENT = threading.local()
+
+
+class Trace:
+    """
+    Finished spans of a single analysis
+    """
+
+    def __init__(self):
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def generate_timings(self, **attributes) -> list:
+        """
+        Generates a dictionary for every span, ordered by start time, with
+        the attributes (e.g. AccountId and Region) added to all of them
+        """
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span.started_at)
+        return [
+            dict(
+                {'Name': span.name, 'Path': span.path},
+                **attributes,
+                Thread=span.thread,
+                Start=round(span.started_at, 6),
+                Duration=round(span.duration, 6),
+                Calls=span.counters['Calls'],
+                Retries=span.counters['Requests'] - span.counters['Calls'],
+                Pages=span.counters['Pages'],
+                Bytes=span.counters['Bytes'],
+            )
+            for span in spans
+        ]
+
+
+class Span:
+    """
+    A timed piece of work inside a trace
+    """
+
+    def __init__(self, name: str, trace: Trace, parent=None):
+        self.name = name
+        self.trace = trace
+        self.parent = parent
+        self.path = f"{parent.path}/{name}" if parent is not None else name
+        self.thread = threading.current_thread().name
+        self.started_at = time.time()
+        self.duration = None
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._start = time.perf_counter()
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+        with self.trace.lock:
+            self.trace.spans.append(self)
+
+
+def get_current_span() -> Span:
+    """
+    Returns the span active in the current thread, or None
+    """
+    return getattr(_CURRENT, 'span', None)
+
+
+@contextlib.contextmanager
+def use_span(span: Span):
+    """
+    Makes span the active one in the current thread
+    """
+    previous_span = get_current_span()
+    _CURRENT.span = span
+    try:
+        yield span
+    finally:
+        _CURRENT.span = previous_span
+
+
+@contextlib.contextmanager
+def start_trace(name: str):
+    """
+    Starts a new trace whose root span covers the block
+    """
+    root_span = Span(name, Trace())
+    with use_span(root_span):
+        try:
+            yield root_span.trace
+        finally:
+            root_span.finish()
+
+
+@contextlib.contextmanager
+def span(name: str):
+    """
+    Times the block as a child of the active span. Does nothing outside of
+    a trace
+    """
+    parent = get_current_span()
+    if parent is None:
+        yield None
+        return
+
+    current_span = Span(name, parent.trace, parent)
+    with use_span(current_span):
+        try:
+            yield current_span
+        finally:
+            current_span.finish()
+
+
+def traced(function):
+    """
+    Wraps function to run, possibly in another thread, inside its own span
+    under the span active when it was wrapped
+    """
+    parent = get_current_span()
+
+    @functools.wraps(function)
+    def run_traced(*args, **kwargs):
+        with use_span(parent), span(function.__name__):
+            return function(*args, **kwargs)
+    return run_traced
+
+
+def bind(function):
+    """
+    Wraps function to run, possibly in another thread, under the span
+    active when it was wrapped
+    """
+    parent = get_current_span()
+
+    @functools.wraps(function)
+    def run_bound(*args, **kwargs):
+        with use_span(parent):
+            return function(*args, **kwargs)
+    return run_bound
+
+
+def trace_iterator(name: str, iterable):
+    """
+    Times a lazy iterator as a span under the active one, from now until it
+    is exhausted. Work done while fetching each item counts for the span
+    """
+    parent = get_current_span()
+    if parent is None:
+        return iter(iterable)
+    return iterate_traced(Span(name, parent.trace, parent), iter(iterable))
+
+
+def iterate_traced(current_span: Span, iterator):
+    try:
+        while True:
+            with use_span(current_span):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        current_span.finish()
+
+
+def count(counter: str, value: int = 1):
+    """
+    Adds value to a counter of the active span and of its parents
+    """
+    current_span = get_current_span()
+    if current_span is None:
+        return
+    with current_span.trace.lock:
+        while current_span is not None:
+            current_span.counters[counter] += value
+            current_span = current_span.parent
+
+
+def register_client(client):
+    """
+    Counts the API calls, HTTP requests and response bytes of the client
+    in the active span
+    """
+    client.meta.events.register('before-call', count_call)
+    client.meta.events.register('before-send', count_request)
+    client.meta.events.register('after-call', count_bytes)
+
+
+def count_call(**kwargs):
+    count('Calls')
+
+
+def count_request(**kwargs):
+    count('Requests')
+
+
+def count_bytes(http_response=None, **kwargs):
+    content = getattr(http_response, 'content', None)
+    if content:
+        count('Bytes', len(content))
+
+
+def generate_chrome_trace(timings: list) -> dict:
+    """
+    Converts Metadata.Timings into the Chrome trace event format, with one
+    process per account and region and one track per thread
+    """
+    if not timings:
+        return {'traceEvents': [], 'displayTimeUnit': 'ms'}
+
+    started_at = min(timing['Start'] for timing in timings)
+    process_ids = {}
+    thread_ids = {}
+    events = []
+    for timing in timings:
+        process = " ".join(
+            filter(None, [timing.get('AccountId'), timing.get('Region')])
+        ) or "panoptes"
+        if process not in process_ids:
+            process_ids[process] = len(process_ids) + 1
+            events.append({
+                'name': 'process_name', 'ph': 'M', 'pid': process_ids[process],
+                'args': {'name': process},
+            })
+        thread = (process, timing['Thread'])
+        if thread not in thread_ids:
+            thread_ids[thread] = len(thread_ids) + 1
+            events.append({
+                'name': 'thread_name', 'ph': 'M',
+                'pid': process_ids[process], 'tid': thread_ids[thread],
+                'args': {'name': timing['Thread']},
+            })
+        events.append({
+            'name': timing['Name'],
+            'cat': timing['Path'].split('/')[0],
+            'ph': 'X',
+            'ts': round((timing['Start'] - started_at) * 1000000),
+            'dur': round(timing['Duration'] * 1000000),
+            'pid': process_ids[process],
+            'tid': thread_ids[thread],
+            'args': {
+                counter: timing[counter]
+                for counter in ['Path', 'Calls', 'Retries', 'Pages', 'Bytes']
+            },
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+if __name__ == "__main__":
+    pass
@@ -5,98 +5,102 @@ and known resources
 """
 
 import concurrent.futures
-import boto3
+import typing
 import panoptes
 
 
-def list_all_safe_ips(session: boto3.session.Session) -> list:
+if typing.TYPE_CHECKING:
+    import boto3
+
+
+def list_all_safe_ips(
+        session: "boto3.session.Session",
+        inventory: "panoptes.aws.inventory.Inventory" = None,
+        errors: list = None) -> list:
     """
-    Function responsible for aggregating all methods and removing duplicates
+    Function responsible for aggregating all methods and removing duplicates.
+    When an errors list is received, sources that fail are recorded in it
+    as panoptes.aws.records.CollectionError instead of raising
     """
     all_safe_ips = []
-    boto_clients = panoptes.aws.authentication.get_boto_clients(session)
+    if inventory is None:
+        inventory = panoptes.aws.inventory.Inventory(session)
     resources_to_whitelist = [
-        (get_vpc_ranges, boto_clients['ec2']),
-        (get_subnet_ranges, boto_clients['ec2']),
-        (get_vpc_instance_ips, boto_clients['ec2']),
-        (get_elastic_ips, boto_clients['ec2']),
+        (get_vpc_ranges, inventory),
+        (get_subnet_ranges, inventory),
+        (get_vpc_instance_ips, inventory),
+        (get_elastic_ips, inventory),
     ]
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        running_workers = []
-        for whitelist_function in resources_to_whitelist:
-            running_workers.append(executor.submit(*whitelist_function))
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=panoptes.aws.authentication.MAX_POOL_CONNECTIONS
+    ) as executor:
+        running_workers = {}
+        for whitelist_function, source in resources_to_whitelist:
+            running_workers[executor.submit(
+                panoptes.aws.tracing.traced(whitelist_function), source
+            )] = whitelist_function
 
         for future in concurrent.futures.as_completed(running_workers):
-            all_safe_ips += future.result()
+            try:
+                all_safe_ips += future.result()
+            except Exception as e:
+                if errors is None:
+                    raise
+                errors.append(
+                    panoptes.aws.records.generate_collection_error(running_workers[future], e)
+                )
     return all_safe_ips
 
 
-def get_vpc_ranges(ec2) -> list:
+def get_vpc_ranges(inventory) -> list:
     """
-    List VPCs CIDR ranges in the account
+    List VPCs IPv4 and IPv6 CIDR ranges in the account
     """
-    boto_vpcs = ec2.describe_vpcs()
     vpc_ranges = [
-        vpc['CidrBlock'] for vpc in boto_vpcs['Vpcs']
+        cidr_block
+        for vpc in inventory.vpcs()
+        for cidr_block in (vpc.CidrBlock,) + vpc.Ipv6CidrBlocks
     ]
     return vpc_ranges
 
 
-def get_subnet_ranges(ec2) -> list:
+def get_subnet_ranges(inventory) -> list:
     """
-    List Subnets CIDR ranges in the account
+    List Subnets IPv4 and IPv6 CIDR ranges in the account
     """
-    boto_subnets = ec2.describe_subnets()
     subnet_ranges = [
-        subnet['CidrBlock'] for subnet in boto_subnets['Subnets']
+        cidr_block
+        for subnet in inventory.subnets()
+        for cidr_block in (subnet.CidrBlock,) + subnet.Ipv6CidrBlocks
     ]
     return subnet_ranges
 
 
-def get_vpc_instance_ips(ec2) -> list:
+def get_vpc_instance_ips(inventory) -> list:
     """
     List Public and Private IPs from EC2 instances inside a VPC in the
     account
     """
-    boto_instances = ec2.describe_instances()
-    vpc_instances_ips = []
-    for instance_obj in boto_instances['Reservations']:
-        for instance in instance_obj['Instances']:
-            for instance_net in instance['NetworkInterfaces']:
-                if 'Association' in instance_net:
-                    vpc_instances_ips.append(
-                        instance_net['Association']['PublicIp'] + '/32'
-                    )
-                if 'PrivateIpAddress' in instance_net:
-                    vpc_instances_ips.append(
-                        instance_net['PrivateIpAddress'] + '/32'
-                    )
-                if 'PrivateIpAddresses' in instance_net:
-                    for priv_ip in instance_net['PrivateIpAddresses']:
-                        if 'Association' in priv_ip:
-                            vpc_instances_ips.append(
-                                priv_ip['Association']['PublicIp'] + '/32'
-                            )
-                        if 'PrivateIpAddress' in priv_ip:
-                            vpc_instances_ips.append(
-                                priv_ip['PrivateIpAddress'] + '/32'
-                            )
+    vpc_instances_ips = [
+        ip_address + '/32'
+        for instance in inventory.instances()
+        for ip_address in instance.IpAddresses
+    ]
     return vpc_instances_ips
 
 
-def get_elastic_ips(ec2) -> list:
+def get_elastic_ips(inventory) -> list:
     """
     List all Elastic IPs reserved in the account
     """
-    boto_elastic_ips = ec2.describe_addresses()
     elastic_ips = []
-    for elastic_ip in boto_elastic_ips['Addresses']:
-        if 'PrivateIpAddress' in elastic_ip:
+    for elastic_ip in inventory.addresses():
+        if elastic_ip.PrivateIpAddress:
             elastic_ips.append(
-                elastic_ip['PrivateIpAddress'] + '/32'
+                elastic_ip.PrivateIpAddress + '/32'
             )
         elastic_ips.append(
-            elastic_ip['PublicIp'] + '/32'
+            elastic_ip.PublicIp + '/32'
         )
     return elastic_ips
 
@@ -1,9 +1,24 @@
 """ Panoptes - CLI
-Responsible for organizing the CLI created by Click
+Responsible for organizing the CLI created by Click. Modules are imported on
+first access.
 """
 
-from panoptes.cli import aws
-from panoptes.cli import gcp
+import importlib
+
+
+SUBMODULES = [
+    'aws',
+    'gcp',
+]
+
+
+def __getattr__(name: str):
+    """
+    Imports the submodule on its first access
+    """
+    if name in SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
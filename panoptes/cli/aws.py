@@ -2,6 +2,9 @@
 Responsible for organizing commands from Panoptes AWS CLI
 """
 
+import json
+import os
+import sys
 import click
 import panoptes
 
@@ -9,8 +12,23 @@ import panoptes
 AWS_AVAILABLE_OUTPUT_OPTIONS = [
     'human',
     'json',
+    'ndjson',
     'yml',
 ]
+HISTORY_AVAILABLE_OUTPUT_OPTIONS = [
+    'human',
+    'json',
+]
+HISTORY_FINDING_TYPES = [
+    'UnusedGroup',
+    'UnsafeIngress',
+    'RedundantRule',
+    'ExposedGroup',
+]
+HISTORY_STATUSES = [
+    'alert',
+    'warning',
+]
 
 
 @click.command(
@@ -20,21 +38,32 @@ AWS_AVAILABLE_OUTPUT_OPTIONS = [
 @click.option(
     '-r', '--region',
     'region',
-    required=True,
-    help='AWS Region to list the security groups',
+    help='(Required) AWS Region to list the security groups. Accepts a comma-separated list or "all"',
     metavar='<region_id>',
 )
 @click.option(
     '-p', '--profile',
     'profile',
-    help='AWS CLI configured profile which will be used',
+    help='AWS CLI configured profile which will be used. Accepts a comma-separated list',
     metavar='<profile_name>',
 )
+@click.option(
+    '--accounts',
+    'accounts',
+    help='Comma-separated AWS account IDs to analyze by assuming --role-name in each of them',
+    metavar='<account_id>',
+)
+@click.option(
+    '--role-name',
+    'role_name',
+    help='IAM role assumed in every account from --accounts',
+    metavar='<role_name>',
+)
 @click.option(
     '-o', '--output',
     'output',
     default='human',
-    help='Which kind of output you want the analysis',
+    help='Which kind of output you want the analysis. ndjson streams one finding per line',
     type=click.Choice(AWS_AVAILABLE_OUTPUT_OPTIONS),
 )
 @click.option(
@@ -43,35 +72,476 @@ AWS_AVAILABLE_OUTPUT_OPTIONS = [
     help='Path to whitelist with declared safe IPs and CIDR',
     metavar='<path>',
 )
-def aws_analyze_command(region, profile, output, whitelist_path):
+@click.option(
+    '--max-workers',
+    'max_workers',
+    default=panoptes.aws.analysis.DEFAULT_MAX_WORKERS,
+    show_default=True,
+    help='Maximum number of accounts/regions analyzed at the same time',
+    type=click.IntRange(min=1),
+)
+@click.option(
+    '--vpc-id',
+    'vpc_ids',
+    help='Comma-separated VPC IDs the analysis is restricted to',
+    metavar='<vpc_id>',
+)
+@click.option(
+    '--group-id',
+    'group_ids',
+    help='Comma-separated security group IDs the analysis is restricted to',
+    metavar='<group_id>',
+)
+@click.option(
+    '--tag',
+    'tags',
+    multiple=True,
+    help='Analyze only security groups with this tag, as Key=Value or just Key. Can be repeated',
+    metavar='<key=value>',
+)
+@click.option(
+    '--unsafe-only',
+    'unsafe_only',
+    is_flag=True,
+    help='Fetch only security groups with CIDR ingress rules and skip the unused groups analysis',
+)
+@click.option(
+    '--fast',
+    'fast',
+    is_flag=True,
+    help='Find unused groups only from Elastic Network Interfaces, skipping the per-service APIs',
+)
+@click.option(
+    '--cache-ttl',
+    'cache_ttl',
+    default=0,
+    show_default=True,
+    help='Seconds the collected inventory of each account and region is cached and reused. 0 disables the cache',
+    type=click.IntRange(min=0),
+)
+@click.option(
+    '--cache-dir',
+    'cache_dir',
+    default=panoptes.aws.snapshot.DEFAULT_CACHE_DIR,
+    show_default=True,
+    help='Directory where the inventory snapshots are cached',
+    metavar='<path>',
+)
+@click.option(
+    '--from-snapshot',
+    'snapshot_paths',
+    multiple=True,
+    help='Analyze a cached inventory snapshot offline instead of calling AWS. Can be repeated',
+    metavar='<file>',
+)
+@click.option(
+    '--state-file',
+    'state_path',
+    help='Enable the incremental analysis, comparing against and then storing the state in this file',
+    metavar='<path>',
+)
+@click.option(
+    '--delta-only',
+    'delta_only',
+    is_flag=True,
+    help='Print only the delta from the previous incremental analysis',
+)
+@click.option(
+    '--trace-file',
+    'trace_path',
+    help='Write the timings of every account/region, collector and stage to this file in the Chrome trace format',
+    metavar='<path>',
+)
+@click.option(
+    '--exposure-matrix',
+    'exposure_matrix',
+    is_flag=True,
+    help='Add the matrix of security groups exposing sensitive ports to the output',
+)
+@click.option(
+    '--exposure-csv',
+    'exposure_csv_path',
+    help='Write the matrix of security groups exposing sensitive ports to this CSV file',
+    metavar='<path>',
+)
+@click.option(
+    '--sensitive-ports',
+    'sensitive_ports',
+    help='Comma-separated sensitive ports of the exposure matrix, as [Name=]Port[/Protocol]',
+    metavar='<ports>',
+)
+@click.option(
+    '--history-db',
+    'history_path',
+    help='Record the Metadata and findings of this run in this SQLite analysis history',
+    metavar='<path>',
+)
+def aws_analyze_command(region, profile, accounts, role_name, output, whitelist_path,
+                        max_workers, vpc_ids, group_ids, tags, unsafe_only, fast,
+                        cache_ttl, cache_dir, snapshot_paths, state_path, delta_only,
+                        trace_path, exposure_matrix, exposure_csv_path, sensitive_ports,
+                        history_path):
     """
     This function is called when the user types
     "panoptes aws analyze"
     """
     aws_output_options = {
-        "human": panoptes.aws.output.print_human,
-        "json": panoptes.generic.output.print_json,
-        "yml": panoptes.generic.output.print_yml,
+        "human": lambda analysis: panoptes.aws.output.write_human(
+            analysis=analysis,
+            stream=sys.stdout,
+        ),
+        "json": lambda analysis: print(panoptes.generic.output.print_json(analysis=analysis)),
+        "yml": lambda analysis: panoptes.generic.output.write_yml_documents(
+            documents=panoptes.aws.analysis.split_analysis_documents(analysis),
+            stream=sys.stdout,
+        ),
     }
 
     if whitelist_path:
-        whitelist = panoptes.generic.helpers.parse_whitelist_file(
-            whitelist_path=whitelist_path
-        )
+        whitelist = load_whitelist(whitelist_path)
     else:
         whitelist = []
 
-    session = panoptes.aws.authentication.create_session(
-        region=region,
-        profile=profile,
+    if delta_only and not state_path:
+        raise click.UsageError('Option "--delta-only" requires "--state-file".')
+    if delta_only and output == 'human':
+        raise click.UsageError('Option "--delta-only" requires a json or yml "--output".')
+    if not snapshot_paths and not split_option_list(region):
+        raise click.UsageError('Option "--region" requires at least one region code or "all".')
+    if accounts and not role_name:
+        raise click.UsageError('Option "--accounts" requires "--role-name".')
+    if accounts and len(split_option_list(profile)) > 1:
+        raise click.UsageError('Option "--accounts" accepts a single "--profile", used as source credentials.')
+    if output == 'ndjson' and state_path:
+        raise click.UsageError('Option "--state-file" can not be used with the ndjson "--output".')
+    if output == 'ndjson' and trace_path:
+        raise click.UsageError('Option "--trace-file" can not be used with the ndjson "--output".')
+    if snapshot_paths and trace_path:
+        raise click.UsageError('Option "--trace-file" can not be used with "--from-snapshot".')
+    if output == 'ndjson' and (exposure_matrix or exposure_csv_path):
+        raise click.UsageError('Options "--exposure-matrix" and "--exposure-csv" can not be used with the ndjson "--output".')
+    if output == 'ndjson' and history_path:
+        raise click.UsageError('Option "--history-db" can not be used with the ndjson "--output".')
+    if sensitive_ports:
+        try:
+            sensitive_ports = panoptes.aws.matrix.parse_sensitive_ports(sensitive_ports)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='"--sensitive-ports"')
+    scope = panoptes.aws.scope.create_scope(
+        vpc_ids=split_option_list(vpc_ids),
+        group_ids=split_option_list(group_ids),
+        tags=tags,
+        unsafe_only=unsafe_only,
     )
+    if panoptes.aws.scope.is_scoped(scope) and state_path:
+        raise click.UsageError('Options "--vpc-id", "--group-id", "--tag" and "--unsafe-only" can not be used with "--state-file".')
+    if panoptes.aws.scope.is_scoped(scope) and snapshot_paths:
+        raise click.UsageError('Options "--vpc-id", "--group-id", "--tag" and "--unsafe-only" can not be used with "--from-snapshot".')
+    baseline = panoptes.aws.incremental.load_state(state_path) if state_path else None
+
+    if snapshot_paths and output == 'ndjson':
+        stream_analysis(panoptes.aws.analysis.iter_snapshots_findings(
+            snapshots=(
+                panoptes.aws.snapshot.load_snapshot(snapshot_path)
+                for snapshot_path in snapshot_paths
+            ),
+            whitelist=whitelist,
+        ))
+        return
 
-    if session:
-        analysis = panoptes.aws.analysis.analyze_security_groups(
-            session=session,
+    if snapshot_paths:
+        analysis = panoptes.aws.analysis.analyze_snapshots(
+            snapshots=[
+                panoptes.aws.snapshot.load_snapshot(snapshot_path)
+                for snapshot_path in snapshot_paths
+            ],
             whitelist=whitelist,
+            baseline=baseline,
         )
-        print(aws_output_options.get(output)(analysis=analysis))
+        add_exposure_matrix(analysis, sensitive_ports, exposure_matrix, exposure_csv_path)
+        print_analysis(analysis, aws_output_options.get(output), state_path, baseline, delta_only)
+        if history_path:
+            record_history(analysis, history_path)
+        return
+
+    if not region:
+        raise click.UsageError('Missing option "-r" / "--region".')
+
+    targets = panoptes.aws.authentication.list_analysis_targets(
+        regions=split_option_list(region),
+        profiles=split_option_list(profile),
+        accounts=split_option_list(accounts),
+        role_name=role_name,
+    )
+
+    if targets and output == 'ndjson':
+        stream_analysis(panoptes.aws.analysis.iter_targets_findings(
+            targets=targets,
+            whitelist=whitelist,
+            max_workers=max_workers,
+            fast=fast,
+            cache_ttl=cache_ttl,
+            cache_dir=cache_dir,
+            scope=scope,
+        ))
+        return
+
+    if targets:
+        analysis = panoptes.aws.analysis.analyze_targets(
+            targets=targets,
+            whitelist=whitelist,
+            max_workers=max_workers,
+            fast=fast,
+            cache_ttl=cache_ttl,
+            cache_dir=cache_dir,
+            baseline=baseline,
+            scope=scope,
+        )
+        add_exposure_matrix(analysis, sensitive_ports, exposure_matrix, exposure_csv_path)
+        with panoptes.aws.tracing.start_trace('print_analysis') as trace:
+            print_analysis(analysis, aws_output_options.get(output), state_path, baseline, delta_only)
+        if trace_path:
+            write_trace_file(analysis['Metadata']['Timings'] + trace.generate_timings(), trace_path)
+        if history_path:
+            record_history(analysis, history_path)
+
+        for collection_error in analysis['Metadata']['CollectionErrors']:
+            print_collection_error(collection_error)
+        for error in analysis['Metadata']['Errors']:
+            print_target_error(error)
+        if analysis['Metadata']['Errors']:
+            raise SystemExit(1)
+
+
+def load_whitelist(whitelist_path: str) -> "panoptes.generic.whitelist.WhitelistIndex":
+    """
+    Reads and compiles the whitelist file, reporting invalid entries as a
+    CLI error instead of a traceback
+    """
+    whitelist = panoptes.generic.helpers.parse_whitelist_file(
+        whitelist_path=whitelist_path
+    )
+    try:
+        return panoptes.generic.whitelist.WhitelistIndex(whitelist, source=whitelist_path)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='"--whitelist"')
+
+
+def print_analysis(analysis: dict, print_function, state_path: str, baseline: dict, delta_only: bool):
+    """
+    Prints the analysis. In incremental mode, the delta against the
+    baseline is added to it and the new state is stored
+    """
+    if state_path:
+        state = panoptes.aws.incremental.build_state(analysis, baseline)
+        analysis['Delta'] = panoptes.aws.incremental.generate_delta(baseline, state)
+        panoptes.aws.incremental.save_state(state, state_path)
+        if delta_only:
+            analysis = {
+                'Metadata': analysis['Metadata'],
+                'Delta': analysis['Delta'],
+            }
+    print_function(analysis=analysis)
+
+
+def add_exposure_matrix(analysis: dict, sensitive_ports: list, exposure_matrix: bool, exposure_csv_path: str):
+    """
+    Generates the exposure matrix of sensitive ports when requested, adding
+    it to the analysis and/or writing it as CSV
+    """
+    if not exposure_matrix and not exposure_csv_path:
+        return
+    matrix = panoptes.aws.matrix.generate_exposure_matrix(analysis, sensitive_ports)
+    if exposure_matrix:
+        analysis['ExposureMatrix'] = matrix
+    if exposure_csv_path:
+        with open(exposure_csv_path, 'w', newline='') as csv_file:
+            panoptes.aws.matrix.write_exposure_csv(matrix, csv_file)
+
+
+def record_history(analysis: dict, history_path: str):
+    """
+    Records the analysis as a new run of the analysis history
+    """
+    connection = open_history(history_path)
+    try:
+        panoptes.aws.history.record_analysis(connection, analysis)
+    finally:
+        connection.close()
+
+
+def open_history(history_path: str):
+    """
+    Opens the analysis history, reporting a database of another schema
+    version as a CLI error
+    """
+    try:
+        return panoptes.aws.history.open_history(history_path)
+    except panoptes.aws.exceptions.PanoptesAWSHistoryError as e:
+        raise click.ClickException(str(e))
+
+
+def write_trace_file(timings: list, trace_path: str):
+    """
+    Writes the timings as a Chrome trace, to be opened in chrome://tracing
+    or Perfetto
+    """
+    with open(trace_path, 'w') as trace_file:
+        json.dump(panoptes.aws.tracing.generate_chrome_trace(timings), trace_file)
+
+
+def stream_analysis(findings):
+    """
+    Prints every finding as a JSON line as soon as it is produced
+    """
+    errors = 0
+    for record in panoptes.aws.analysis.generate_finding_records(findings):
+        print(panoptes.generic.output.print_ndjson(record), flush=True)
+        if record['Type'] == 'Target':
+            for collection_error in record['CollectionErrors']:
+                print_collection_error(collection_error)
+        if record['Type'] == 'Error':
+            print_target_error(record)
+            errors += 1
+    if errors:
+        raise SystemExit(1)
+
+
+def print_target_error(error: dict):
+    """
+    Reports a failed account/region analysis on stderr
+    """
+    click.echo(
+        f"Analysis failed for {error['Target']} in {error['Region']}: "
+        f"{error['Message']}",
+        err=True,
+    )
+
+
+def print_collection_error(collection_error: dict):
+    """
+    Warns on stderr about a collector that failed, whose resources are
+    missing from the analysis
+    """
+    click.echo(
+        f"Collector {collection_error['Collector']} failed for "
+        f"{collection_error['AccountId']} in {collection_error['Region']}: "
+        f"{collection_error['Message']}",
+        err=True,
+    )
+
+
+@click.command(
+    'history',
+    help="Query the analysis history recorded with --history-db"
+)
+@click.option(
+    '--history-db',
+    'history_path',
+    required=True,
+    help='SQLite analysis history recorded by "panoptesctl aws analyze --history-db"',
+    metavar='<path>',
+)
+@click.option(
+    '--type',
+    'finding_type',
+    help='Show only findings of this type',
+    type=click.Choice(HISTORY_FINDING_TYPES),
+)
+@click.option(
+    '--account-id',
+    'account_id',
+    help='Show only findings of this AWS account',
+    metavar='<account_id>',
+)
+@click.option(
+    '-r', '--region',
+    'region',
+    help='Show only findings of this AWS region',
+    metavar='<region_id>',
+)
+@click.option(
+    '--group-id',
+    'group_id',
+    help='Show only findings of this security group',
+    metavar='<group_id>',
+)
+@click.option(
+    '--cidr',
+    'cidr',
+    help='Show only rules from this IPv4 CIDR, IPv6 CIDR or prefix list',
+    metavar='<cidr>',
+)
+@click.option(
+    '--status',
+    'status',
+    help='Show only unsafe rules with this status',
+    type=click.Choice(HISTORY_STATUSES),
+)
+@click.option(
+    '--since',
+    'since',
+    help='Show only runs started in this period (30m, 12h, 7d, 2w) or after this ISO 8601 date',
+    metavar='<time>',
+)
+@click.option(
+    '--by-group',
+    'by_group',
+    is_flag=True,
+    help='Summarize the findings per security group with the first and last runs finding it',
+)
+@click.option(
+    '-o', '--output',
+    'output',
+    default='human',
+    help='Which kind of output you want the history',
+    type=click.Choice(HISTORY_AVAILABLE_OUTPUT_OPTIONS),
+)
+def aws_history_command(history_path, finding_type, account_id, region, group_id, cidr,
+                        status, since, by_group, output):
+    """
+    This function is called when the user types
+    "panoptesctl history"
+    """
+    if not os.path.exists(history_path):
+        raise click.BadParameter(f"{history_path} does not exist", param_hint='"--history-db"')
+    if since:
+        try:
+            since = panoptes.aws.history.parse_since(since)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='"--since"')
+
+    query = panoptes.aws.history.query_group_findings if by_group else panoptes.aws.history.query_findings
+    connection = open_history(history_path)
+    try:
+        results = query(
+            connection,
+            finding_type=finding_type,
+            account_id=account_id,
+            region=region,
+            group_id=group_id,
+            cidr=cidr,
+            status=status,
+            since=since,
+        )
+    finally:
+        connection.close()
+
+    if output == 'json':
+        print(panoptes.generic.output.print_json(results))
+    elif by_group:
+        panoptes.aws.output.write_group_history(results, sys.stdout)
+    else:
+        panoptes.aws.output.write_history(results, sys.stdout)
+
+
+def split_option_list(option: str) -> list:
+    """
+    Splits a comma-separated CLI option into a list of values
+    """
+    if not option:
+        return []
+    return [value.strip() for value in option.split(',') if value.strip()]
 
 
 if __name__ == "__main__":
@@ -1,9 +1,25 @@
 """ Panoptes - Generic
-Responsible for generic helper functions
+Responsible for generic helper functions. Modules are imported on first
+access.
 """
 
-from panoptes.generic import helpers
-from panoptes.generic import output
+import importlib
+
+
+SUBMODULES = [
+    'helpers',
+    'output',
+    'whitelist',
+]
+
+
+def __getattr__(name: str):
+    """
+    Imports the submodule on its first access
+    """
+    if name in SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
@@ -4,7 +4,7 @@ Just a collection of generic functions to help cloud provider analysis
 """
 
 import datetime
-import dateutil
+
 
 def get_current_time() -> str:
     """
@@ -24,6 +24,7 @@ def convert_string_datetime(timestr: str) -> datetime.datetime:
     """
     Converts any string into a datetime object
     """
+    import dateutil.parser
     return dateutil.parser.parse(timestr)
 
 
@@ -3,8 +3,6 @@ Responsible for generic outputs used through Panoptes module
 """
 
 import json
-import colorama
-import yaml
 
 
 def print_json(analysis: dict):
@@ -18,21 +16,60 @@ def print_json(analysis: dict):
     )
 
 
+def print_ndjson(record: dict):
+    """
+    Converts a single record into one compact JSON line, used to stream
+    records as newline-delimited JSON
+    """
+    return json.dumps(
+        record,
+        separators=(',', ':'),
+    )
+
+
 def print_yml(analysis: dict):
     """
     Converts the any analysis dictionary into YML output
     """
+    import yaml
     return yaml.dump(
         analysis,
+        Dumper=get_yaml_dumper(),
         allow_unicode=True,
         default_flow_style=False,
     )
 
 
+def write_yml_documents(documents, stream):
+    """
+    Writes every dictionary from documents into stream as a separate YML
+    document, serializing one document at a time
+    """
+    import yaml
+    yaml.dump_all(
+        documents,
+        stream,
+        Dumper=get_yaml_dumper(),
+        allow_unicode=True,
+        default_flow_style=False,
+        explicit_start=True,
+    )
+
+
+def get_yaml_dumper():
+    """
+    Returns the libyaml C dumper when PyYAML was built with it, and the
+    pure Python one otherwise
+    """
+    import yaml
+    return getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+
 def generate_alert_message(content: str):
     """
     Receives the ALERT message content and colorizes it
     """
+    import colorama
     return (
         colorama.Style.RESET_ALL
         + colorama.Fore.LIGHTRED_EX
@@ -45,6 +82,7 @@ def generate_info_message(content: str):
     """
     Receives the INFO message content and colorizes it
     """
+    import colorama
     return (
         colorama.Style.RESET_ALL
         + colorama.Fore.LIGHTCYAN_EX
@@ -57,6 +95,7 @@ def generate_warning_message(content: str):
     """
     Receives the WARNING message content and colorizes it
     """
+    import colorama
     return (
         colorama.Style.RESET_ALL
         + colorama.Fore.YELLOW
@@ -69,6 +108,7 @@ def generate_section_message(content: str):
     """
     Receives the SECTION message content and colorizes it
     """
+    import colorama
     return (
         colorama.Style.RESET_ALL
         + colorama.Style.BRIGHT
@@ -79,6 +119,7 @@ def generate_section_message(content: str):
 
 
 def generate_header_message(content: str, special_char: str = "=", special_len: int = 61):
+    import colorama
     horizontal = special_len * special_char
     return(
         colorama.Style.RESET_ALL
@@ -0,0 +1,226 @@
+""" Panoptes - Generic - Whitelist
+
+Compiled whitelist index. Every IP/CIDR is stored as an interval of a
+single integer address space: IPv6 addresses are their 128-bit value and
+IPv4 addresses are placed right above them, at 2 ** 128 + address, so the
+two families never overlap and ::ffff:0:0/96 stays an IPv6 range.
+Overlapping and adjacent entries are collapsed, and containment lookups
+are answered with a binary search instead of a linear scan.
+"""
+
+import bisect
+import functools
+import hashlib
+import ipaddress
+
+
+WHITELIST_COMMENT_CHAR = "#"
+IPV4_OFFSET = 2 ** 128
+IPV4_SPACE = (IPV4_OFFSET, IPV4_OFFSET + 2 ** 32 - 1)
+IPV6_SPACE = (0, 2 ** 128 - 1)
+CIDR_CACHE_SIZE = 4096
+
+
+class WhitelistIndex:
+    """
+    Sorted, non-overlapping integer address intervals, answering "is this
+    CIDR fully covered by the whitelist" in logarithmic time
+    """
+
+    def __init__(self, entries=(), source: str = None):
+        self._starts = []
+        self._ends = []
+        self.update(entries, source)
+
+    def update(self, entries, source: str = None):
+        """
+        Loads IPs/CIDRs into the index, merging them with the current ones.
+        Raises ValueError naming the first invalid entry, and its line when
+        the entries are the lines of the whitelist file named by source
+        """
+        intervals = []
+        for line_number, entry in enumerate(entries, start=1):
+            entry = entry.strip()
+            if not entry or entry.startswith(WHITELIST_COMMENT_CHAR):
+                continue
+            try:
+                intervals.append(cidr_to_interval(entry))
+            except ValueError:
+                message = f"{entry!r} is not an IP or CIDR"
+                if source is not None:
+                    message = f"{source}, line {line_number}: {message}"
+                raise ValueError(message) from None
+        return self.update_intervals(intervals)
+
+    def update_intervals(self, intervals: list):
+        """
+        Loads address intervals into the index, merging them with
+        the current ones
+        """
+        if intervals:
+            intervals = list(intervals) + list(zip(self._starts, self._ends))
+            self._starts, self._ends = merge_intervals(intervals)
+        return self
+
+    def copy(self):
+        """
+        Returns an independent index with the same entries
+        """
+        index = WhitelistIndex()
+        index._starts = list(self._starts)
+        index._ends = list(self._ends)
+        return index
+
+    def digest(self) -> str:
+        """
+        Returns a hash of the merged intervals, equal for any two indexes
+        covering the same addresses
+        """
+        content = hashlib.blake2b(digest_size=16)
+        for start, end in zip(self._starts, self._ends):
+            content.update(f"{start}-{end};".encode())
+        return content.hexdigest()
+
+    def covers(self, cidr: str) -> bool:
+        """
+        Checks if every address of the IP/CIDR is inside the whitelist
+        """
+        return self.covers_interval(*cidr_to_interval(cidr))
+
+    def covers_interval(self, start: int, end: int) -> bool:
+        """
+        Checks if every address of the interval is inside the
+        whitelist
+        """
+        position = bisect.bisect_right(self._starts, start) - 1
+        return position >= 0 and self._ends[position] >= end
+
+    def overlaps_interval(self, start: int, end: int) -> bool:
+        """
+        Checks if any address of the interval is inside the
+        whitelist
+        """
+        position = bisect.bisect_right(self._starts, end) - 1
+        return position >= 0 and self._ends[position] >= start
+
+    def symmetric_difference(self, other: "WhitelistIndex") -> "WhitelistIndex":
+        """
+        Returns a new index of the addresses inside exactly one of the two
+        indexes
+        """
+        own = (self._starts, self._ends)
+        others = (other._starts, other._ends)
+        return WhitelistIndex().update_intervals(
+            subtract_intervals(own, others) + subtract_intervals(others, own)
+        )
+
+    def __contains__(self, cidr: str) -> bool:
+        return self.covers(cidr)
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+
+@functools.lru_cache(maxsize=CIDR_CACHE_SIZE)
+def cidr_to_interval(cidr: str) -> tuple:
+    """
+    Converts an IPv4 or IPv6 IP/CIDR into its (first, last) addresses in
+    the address space of the index. Rules of large accounts repeat the same
+    CIDRs, so conversions are cached
+    """
+    interval = ipv4_cidr_to_interval(cidr)
+    if interval is None:
+        interval = network_to_interval(ipaddress.ip_network(cidr, strict=False))
+    return interval
+
+
+def ipv4_cidr_to_interval(cidr: str) -> tuple:
+    """
+    Parses the common case of a well-formed IPv4 IP/CIDR without the
+    ipaddress module, returning None for anything else
+    """
+    if not cidr.isascii():
+        return None
+    address, separator, prefix = cidr.partition('/')
+    octets = address.split('.')
+    if len(octets) != 4 or (separator and not (prefix.isdigit() and int(prefix) <= 32)):
+        return None
+    value = 0
+    for octet in octets:
+        if not octet.isdigit() or len(octet) > 3 or (len(octet) > 1 and octet[0] == '0'):
+            return None
+        octet = int(octet)
+        if octet > 255:
+            return None
+        value = value << 8 | octet
+    host_bits = 32 - int(prefix) if separator else 0
+    start = IPV4_OFFSET + (value >> host_bits << host_bits)
+    return start, start + (1 << host_bits) - 1
+
+
+def network_to_interval(network) -> tuple:
+    """
+    Converts an ipaddress network into its (first, last) addresses in the
+    address space of the index
+    """
+    offset = IPV4_OFFSET if network.version == 4 else 0
+    return (
+        int(network.network_address) + offset,
+        int(network.broadcast_address) + offset,
+    )
+
+
+def is_anywhere(intervals: list) -> bool:
+    """
+    Checks if the intervals cover the whole IPv4 or IPv6 address space
+    """
+    starts, ends = merge_intervals(intervals)
+    return any(
+        start <= space_start and end >= space_end
+        for start, end in zip(starts, ends)
+        for space_start, space_end in (IPV4_SPACE, IPV6_SPACE)
+    )
+
+
+def merge_intervals(intervals: list) -> tuple:
+    """
+    Sorts and collapses overlapping or adjacent intervals, returning the
+    starts and ends as two parallel lists
+    """
+    starts = []
+    ends = []
+    for start, end in sorted(intervals):
+        if ends and start <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+def subtract_intervals(intervals: tuple, removed: tuple) -> list:
+    """
+    Receives two (starts, ends) lists of sorted, non-overlapping intervals,
+    as returned by merge_intervals, and returns the parts of the first ones
+    outside the removed ones
+    """
+    removed_starts, removed_ends = removed
+    remaining = []
+    position = 0
+    for start, end in zip(*intervals):
+        while position < len(removed_starts) and removed_ends[position] < start:
+            position += 1
+        current = start
+        overlapping = position
+        while overlapping < len(removed_starts) and removed_starts[overlapping] <= end:
+            if removed_starts[overlapping] > current:
+                remaining.append((current, removed_starts[overlapping] - 1))
+            current = max(current, removed_ends[overlapping] + 1)
+            overlapping += 1
+        if current <= end:
+            remaining.append((current, end))
+    return remaining
+
+
+if __name__ == "__main__":
+    pass
@@ -1,6 +1,5 @@
 #!/usr/bin/env python
 import click
-import pkg_resources
 import panoptes.cli.aws
 import panoptes.cli.gcp
 
@@ -38,12 +37,18 @@ def gcp_group():
     help='Show Panoptes version'
 )
 def version_command():
-    print(pkg_resources.get_distribution("panoptes").version)
+    try:
+        import importlib.metadata
+        print(importlib.metadata.version("panoptes"))
+    except ImportError:
+        import pkg_resources
+        print(pkg_resources.get_distribution("panoptes").version)
 
 
 """
 Adding commands to Click Groups
 """
+main.add_command(panoptes.cli.aws.aws_history_command)
 aws_group.add_command(panoptes.cli.aws.aws_analyze_command)
 gcp_group.add_command(panoptes.cli.gcp.gcp_analyze_command)
 
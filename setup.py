@@ -19,8 +19,11 @@ setup(
             'panoptesctl = panoptes.panoptesctl:main',
         ],
     },
+    extras_require={
+        'numpy': ['numpy>=1.17'],
+    },
     install_requires=[
-        'boto3==1.9.28',
+        'boto3==1.17.0',
         'click==7.0',
         'colorama==0.4.0',
         'PyYAML==3.13',
@@ -32,7 +35,7 @@ setup(
     long_description=long_description,
     name='panoptes',
     packages=find_packages(),
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     url='https://github.com/tioxy/panoptes',
     version='0.4.0',
 )
@@ -0,0 +1,59 @@
+import pytest
+import panoptes
+
+
+def create_ingress_rule(ip_protocol='tcp', from_port=22, to_port=22, cidr_ips=(), cidr_ipv6s=(),
+                        prefix_list_ids=(), source_group_ids=()):
+    return panoptes.aws.records.IngressRule(
+        IpProtocol=ip_protocol,
+        FromPort=from_port,
+        ToPort=to_port,
+        CidrIps=list(cidr_ips),
+        CidrIpv6s=list(cidr_ipv6s),
+        PrefixListIds=list(prefix_list_ids),
+        SourceGroupIds=list(source_group_ids),
+    )
+
+
+def create_security_group(group_id, ingress_rules=()):
+    return panoptes.aws.records.SecurityGroup(
+        GroupId=group_id,
+        GroupName=f"{group_id}-name",
+        Description=f"{group_id} description",
+        VpcId='vpc-1',
+        IpPermissions=list(ingress_rules),
+    )
+
+
+def create_snapshot(security_groups, attached_group_ids=None, safe_ips=(), prefix_lists=None):
+    if attached_group_ids is None:
+        attached_group_ids = [security_group.GroupId for security_group in security_groups]
+    return panoptes.aws.records.Snapshot(
+        AccountId='123456789012',
+        Region='us-east-1',
+        Auth='arn:aws:iam::123456789012:user/test',
+        StartedAt='2018-01-01T12:40:00',
+        FinishedAt='2018-01-01T12:40:10',
+        SecurityGroups=list(security_groups),
+        AttachedGroups=panoptes.aws.records.AttachedGroups(
+            GroupIds=set(attached_group_ids), GroupNames=set(),
+        ),
+        SafeIps=list(safe_ips),
+        CollectionErrors=[],
+        PrefixLists=prefix_lists or {},
+    )
+
+
+@pytest.fixture
+def ingress_rule():
+    return create_ingress_rule
+
+
+@pytest.fixture
+def security_group():
+    return create_security_group
+
+
+@pytest.fixture
+def snapshot():
+    return create_snapshot
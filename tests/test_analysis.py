@@ -0,0 +1,48 @@
+import panoptes
+
+
+def get_unsafe_sources(analysis):
+    return [
+        (unsafe_group['GroupId'], unsafe_port.get('CidrIp') or unsafe_port.get('CidrIpv6') or unsafe_port['PrefixListId'], unsafe_port['Status'])
+        for unsafe_group in analysis['SecurityGroups']['UnsafeGroups']
+        for unsafe_port in unsafe_group['UnsafePorts']
+    ]
+
+
+def test_ipv6_whitelist_does_not_whitelist_ipv4_sources(snapshot, security_group, ingress_rule):
+    groups = [security_group('sg-a', [ingress_rule(cidr_ips=['10.0.0.0/8'], cidr_ipv6s=['2001:db8::/32'])])]
+    analysis = panoptes.aws.analysis.analyze_snapshots([snapshot(groups)], whitelist=['::/0'])
+    assert get_unsafe_sources(analysis) == [('sg-a', '10.0.0.0/8', 'warning')]
+
+
+def test_prefix_lists_are_evaluated_from_their_entries(snapshot, security_group, ingress_rule):
+    groups = [security_group('sg-a', [ingress_rule(prefix_list_ids=['pl-office', 'pl-open', 'pl-missing'])])]
+    prefix_lists = {
+        'pl-office': ['10.0.0.0/16'],
+        'pl-open': ['0.0.0.0/1', '128.0.0.0/1'],
+    }
+    analysis = panoptes.aws.analysis.analyze_snapshots(
+        [snapshot(groups, prefix_lists=prefix_lists)], whitelist=['10.0.0.0/8'],
+    )
+    assert get_unsafe_sources(analysis) == [('sg-a', 'pl-open', 'alert'), ('sg-a', 'pl-missing', 'warning')]
+
+
+def test_exposure_of_the_last_group_is_kept_apart(snapshot, security_group, ingress_rule):
+    groups = [
+        security_group('sg-a', [ingress_rule(cidr_ips=['0.0.0.0/0'])]),
+        security_group('sg-b', [ingress_rule(source_group_ids=['sg-a'])]),
+    ]
+    analysis = panoptes.aws.analysis.analyze_snapshots([snapshot(groups, attached_group_ids=['sg-a'])])
+    assert [group['GroupId'] for group in analysis['SecurityGroups']['UnusedGroups']] == ['sg-b']
+    assert [group['GroupId'] for group in analysis['SecurityGroups']['UnsafeGroups']] == ['sg-a']
+    assert [
+        (group['GroupId'], group['Path']) for group in analysis['SecurityGroups']['ExposedGroups']
+    ] == [('sg-b', ['sg-a', 'sg-b'])]
+
+
+def test_vpc_ipv6_ranges_are_safe_like_their_ipv4_ranges(snapshot, security_group, ingress_rule):
+    groups = [security_group('sg-a', [ingress_rule(cidr_ips=['10.0.0.0/16'], cidr_ipv6s=['2600:1f18:1::/56'])])]
+    analysis = panoptes.aws.analysis.analyze_snapshots(
+        [snapshot(groups, safe_ips=['10.0.0.0/16', '2600:1f18:1::/56'])],
+    )
+    assert get_unsafe_sources(analysis) == []
@@ -0,0 +1,39 @@
+import boto3
+import botocore.exceptions
+import botocore.stub
+import pytest
+import panoptes
+
+
+def create_elasticache_client():
+    return boto3.session.Session(
+        aws_access_key_id='testing',
+        aws_secret_access_key='testing',
+        region_name='us-east-1',
+    ).client('elasticache')
+
+
+def test_elasticache_names_ignore_accounts_without_ec2_classic():
+    client = create_elasticache_client()
+    with botocore.stub.Stubber(client) as stubber:
+        stubber.add_client_error('describe_cache_security_groups', service_error_code='InvalidParameterValue')
+        assert panoptes.aws.attached.list_elasticache_attached_secgroup_names(client) == set()
+
+
+def test_elasticache_names_raise_other_errors():
+    client = create_elasticache_client()
+    with botocore.stub.Stubber(client) as stubber:
+        stubber.add_client_error('describe_cache_security_groups', service_error_code='AccessDenied')
+        with pytest.raises(botocore.exceptions.ClientError):
+            panoptes.aws.attached.list_elasticache_attached_secgroup_names(client)
+
+
+def test_elasticache_names_are_collected():
+    client = create_elasticache_client()
+    with botocore.stub.Stubber(client) as stubber:
+        stubber.add_response('describe_cache_security_groups', {
+            'CacheSecurityGroups': [
+                {'CacheSecurityGroupName': 'cache', 'EC2SecurityGroups': [{'EC2SecurityGroupName': 'classic'}]},
+            ],
+        })
+        assert panoptes.aws.attached.list_elasticache_attached_secgroup_names(client) == {'classic'}
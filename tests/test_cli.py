@@ -0,0 +1,22 @@
+import click.testing
+import pytest
+import panoptes
+
+
+@pytest.mark.parametrize('region_options', [[], ['--region', ','], ['--region', ' ']])
+def test_analyze_requires_a_region(region_options):
+    result = click.testing.CliRunner().invoke(
+        panoptes.panoptesctl.main, ['aws', 'analyze', '--profile', 'default'] + region_options,
+    )
+    assert result.exit_code == 2
+    assert 'Option "--region" requires at least one region code' in result.output
+
+
+def test_analyze_reports_the_invalid_whitelist_line(tmp_path):
+    whitelist_path = tmp_path / 'whitelist.txt'
+    whitelist_path.write_text("10.0.0.0/8\n# office\nmy-office\n")
+    result = click.testing.CliRunner().invoke(
+        panoptes.panoptesctl.main, ['aws', 'analyze', '--region', 'us-east-1', '--whitelist', str(whitelist_path)],
+    )
+    assert result.exit_code == 2
+    assert f"{whitelist_path}, line 3: 'my-office' is not an IP or CIDR" in result.output
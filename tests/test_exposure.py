@@ -0,0 +1,47 @@
+import panoptes
+
+
+def create_graph(security_group, ingress_rule, references, internet_facing):
+    graph = panoptes.aws.exposure.ExposureGraph()
+    for group_id, source_group_ids in references.items():
+        graph.add_security_group(
+            security_group(group_id, [ingress_rule(source_group_ids=source_group_ids)]),
+            group_id in internet_facing,
+        )
+    return graph
+
+
+def test_exposed_groups_follow_references_transitively(security_group, ingress_rule):
+    graph = create_graph(security_group, ingress_rule, {
+        'sg-web': [],
+        'sg-app': ['sg-web'],
+        'sg-db': ['sg-app'],
+        'sg-admin': [],
+    }, internet_facing={'sg-web'})
+    assert {group_id: path for group_id, _, _, path in graph.iter_exposed_groups()} == {
+        'sg-app': ('sg-web', 'sg-app'),
+        'sg-db': ('sg-web', 'sg-app', 'sg-db'),
+    }
+
+
+def test_exposed_groups_use_shortest_paths_and_survive_cycles(security_group, ingress_rule):
+    graph = create_graph(security_group, ingress_rule, {
+        'sg-web': ['sg-db'],
+        'sg-app': ['sg-web', 'sg-db', 'sg-app'],
+        'sg-db': ['sg-app'],
+        'sg-lb': [],
+        'sg-cache': ['sg-lb', 'sg-db'],
+    }, internet_facing={'sg-web', 'sg-lb'})
+    assert {group_id: path for group_id, _, _, path in graph.iter_exposed_groups()} == {
+        'sg-app': ('sg-web', 'sg-app'),
+        'sg-db': ('sg-web', 'sg-app', 'sg-db'),
+        'sg-cache': ('sg-lb', 'sg-cache'),
+    }
+
+
+def test_nothing_is_exposed_without_internet_facing_groups(security_group, ingress_rule):
+    graph = create_graph(security_group, ingress_rule, {
+        'sg-app': ['sg-db'],
+        'sg-db': ['sg-app'],
+    }, internet_facing=set())
+    assert list(graph.iter_exposed_groups()) == []
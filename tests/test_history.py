@@ -0,0 +1,95 @@
+import datetime
+import sqlite3
+import pytest
+import panoptes
+
+
+def analyze(snapshot, security_group, ingress_rule, started_at='2018-01-01T12:40:00'):
+    groups = [
+        security_group('sg-a', [
+            ingress_rule(cidr_ips=['0.0.0.0/0', '10.0.0.0/8'], cidr_ipv6s=['::/0']),
+            ingress_rule(from_port=20, to_port=30, cidr_ips=['0.0.0.0/0']),
+        ]),
+        security_group('sg-b', [ingress_rule(prefix_list_ids=['pl-1'])]),
+    ]
+    analysis = panoptes.aws.analysis.analyze_snapshots([snapshot(groups, attached_group_ids=['sg-a'])])
+    analysis['Metadata']['StartedAt'] = started_at
+    return analysis
+
+
+@pytest.fixture
+def history(tmp_path):
+    connection = panoptes.aws.history.open_history(str(tmp_path / 'history' / 'panoptes.db'))
+    yield connection
+    connection.close()
+
+
+def test_findings_are_stored_one_row_per_rule(history, snapshot, security_group, ingress_rule):
+    panoptes.aws.history.record_analysis(history, analyze(snapshot, security_group, ingress_rule))
+    rows = history.execute(
+        "SELECT type, group_id, from_port, to_port, cidr, status FROM findings ORDER BY rowid"
+    ).fetchall()
+    assert [tuple(row) for row in rows] == [
+        ('UnusedGroup', 'sg-b', None, None, None, None),
+        ('UnsafeIngress', 'sg-a', 22, 22, '0.0.0.0/0', 'alert'),
+        ('UnsafeIngress', 'sg-a', 22, 22, '10.0.0.0/8', 'warning'),
+        ('UnsafeIngress', 'sg-a', 22, 22, '::/0', 'alert'),
+        ('UnsafeIngress', 'sg-a', 20, 30, '0.0.0.0/0', 'alert'),
+        ('UnsafeIngress', 'sg-b', 22, 22, 'pl-1', 'warning'),
+        ('RedundantRule', 'sg-a', 22, 22, '0.0.0.0/0', None),
+        ('RedundantRule', 'sg-a', 22, 22, '10.0.0.0/8', None),
+    ]
+
+
+def test_query_findings_filters(history, snapshot, security_group, ingress_rule):
+    panoptes.aws.history.record_analysis(history, analyze(snapshot, security_group, ingress_rule))
+    findings = panoptes.aws.history.query_findings(history, finding_type='UnsafeIngress', cidr='0.0.0.0/0')
+    assert [(finding['GroupId'], finding['FromPort'], finding['RunId']) for finding in findings] == [
+        ('sg-a', 22, 1), ('sg-a', 20, 1),
+    ]
+    assert findings[0]['Type'] == 'UnsafeIngress'
+    assert 'UnsafePorts' not in findings[0]
+    assert len(panoptes.aws.history.query_findings(history, status='warning', group_id='sg-b')) == 1
+    assert panoptes.aws.history.query_findings(history, region='eu-west-1') == []
+
+
+def test_query_group_findings_tracks_first_and_last_runs(history, snapshot, security_group, ingress_rule):
+    for started_at in ('2018-01-01T12:40:00', '2018-01-02T12:40:00', '2018-01-03T12:40:00'):
+        panoptes.aws.history.record_analysis(history, analyze(snapshot, security_group, ingress_rule, started_at))
+    assert panoptes.aws.history.query_group_findings(history, finding_type='UnsafeIngress', group_id='sg-a') == [{
+        'Type': 'UnsafeIngress',
+        'AccountId': '123456789012',
+        'Region': 'us-east-1',
+        'GroupId': 'sg-a',
+        'GroupName': 'sg-a-name',
+        'FirstSeenAt': '2018-01-01T12:40:00',
+        'LastSeenAt': '2018-01-03T12:40:00',
+        'Runs': 3,
+    }]
+    group_findings = panoptes.aws.history.query_group_findings(history, since='2018-01-02T00:00:00')
+    assert {group['FirstSeenAt'] for group in group_findings} == {'2018-01-02T12:40:00'}
+    assert {group['Runs'] for group in group_findings} == {2}
+
+
+def test_parse_since():
+    now = datetime.datetime(2018, 1, 10, 12, 0)
+    assert panoptes.aws.history.parse_since('7d', now) == '2018-01-03T12:00:00'
+    assert panoptes.aws.history.parse_since(' 90M ', now) == '2018-01-10T10:30:00'
+    assert panoptes.aws.history.parse_since('2w', now) == '2017-12-27T12:00:00'
+    assert panoptes.aws.history.parse_since('2018-01-02') == '2018-01-02T00:00:00'
+    assert panoptes.aws.history.parse_since('2018-01-02T03:04:05') == '2018-01-02T03:04:05'
+
+
+@pytest.mark.parametrize('since', ['7 days', '-1d', 'yesterday'])
+def test_parse_since_rejects_invalid_times(since):
+    with pytest.raises(ValueError):
+        panoptes.aws.history.parse_since(since)
+
+
+def test_open_history_rejects_other_schema_versions(tmp_path):
+    history_path = str(tmp_path / 'panoptes.db')
+    connection = sqlite3.connect(history_path)
+    connection.execute("PRAGMA user_version = 99")
+    connection.close()
+    with pytest.raises(panoptes.aws.exceptions.PanoptesAWSHistoryError):
+        panoptes.aws.history.open_history(history_path)
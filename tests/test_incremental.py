@@ -0,0 +1,77 @@
+import panoptes
+
+
+def run_incremental(snapshot, baseline):
+    analysis = panoptes.aws.analysis.analyze_snapshots([snapshot], baseline=baseline)
+    state = panoptes.aws.incremental.build_state(analysis, baseline)
+    analysis['Delta'] = panoptes.aws.incremental.generate_delta(baseline, state)
+    return analysis, state
+
+
+def count_evaluations(monkeypatch):
+    evaluated = []
+    iter_security_group_findings = panoptes.aws.analysis.iter_security_group_findings
+
+    def counting_iter_security_group_findings(security_group, **kwargs):
+        evaluated.append(security_group.GroupId)
+        return iter_security_group_findings(security_group=security_group, **kwargs)
+
+    monkeypatch.setattr(panoptes.aws.analysis, 'iter_security_group_findings', counting_iter_security_group_findings)
+    return evaluated
+
+
+def test_unchanged_groups_reuse_findings(monkeypatch, snapshot, security_group, ingress_rule):
+    groups = [
+        security_group('sg-a', [ingress_rule(cidr_ips=['10.0.0.5/32'])]),
+        security_group('sg-b', [ingress_rule(cidr_ips=['192.168.0.0/24'])]),
+    ]
+    first, state = run_incremental(snapshot(groups, safe_ips=['10.0.0.5']), panoptes.aws.incremental.create_empty_state())
+    evaluated = count_evaluations(monkeypatch)
+    second, _ = run_incremental(snapshot(groups, safe_ips=['10.0.0.5']), state)
+
+    assert evaluated == []
+    assert second['SecurityGroups'] == first['SecurityGroups']
+    assert second['Delta']['NewFindings'] == []
+
+
+def test_safe_ip_changes_only_evaluate_overlapping_groups(monkeypatch, snapshot, security_group, ingress_rule):
+    groups = [
+        security_group('sg-a', [ingress_rule(cidr_ips=['10.0.0.5/32'])]),
+        security_group('sg-b', [ingress_rule(cidr_ips=['192.168.0.0/24'])]),
+    ]
+    _, state = run_incremental(snapshot(groups, safe_ips=['10.0.0.5', '10.0.0.6']), panoptes.aws.incremental.create_empty_state())
+
+    evaluated = count_evaluations(monkeypatch)
+    _, state = run_incremental(snapshot(groups, safe_ips=['10.0.0.5', '10.0.0.6', '172.16.0.1']), state)
+    assert evaluated == []
+
+    analysis, _ = run_incremental(snapshot(groups, safe_ips=['10.0.0.6', '172.16.0.1']), state)
+    assert evaluated == ['sg-a']
+    assert [finding['GroupId'] for finding in analysis['Delta']['NewFindings']] == ['sg-a']
+
+
+def test_user_whitelist_change_evaluates_every_group(monkeypatch, snapshot, security_group, ingress_rule):
+    groups = [
+        security_group('sg-a', [ingress_rule(cidr_ips=['10.0.0.5/32'])]),
+        security_group('sg-b', [ingress_rule(cidr_ips=['192.168.0.0/24'])]),
+    ]
+    baseline = panoptes.aws.incremental.create_empty_state()
+    analysis = panoptes.aws.analysis.analyze_snapshots([snapshot(groups)], baseline=baseline)
+    state = panoptes.aws.incremental.build_state(analysis, baseline)
+
+    evaluated = count_evaluations(monkeypatch)
+    panoptes.aws.analysis.analyze_snapshots([snapshot(groups)], whitelist=['192.168.0.0/16'], baseline=state)
+    assert sorted(evaluated) == ['sg-a', 'sg-b']
+
+
+def test_fingerprint_changes_with_rules(security_group, ingress_rule):
+    attached_groups = panoptes.aws.records.AttachedGroups(GroupIds={'sg-a'}, GroupNames=set())
+    fingerprint = panoptes.aws.incremental.fingerprint_security_group(
+        security_group('sg-a', [ingress_rule(cidr_ips=['10.0.0.0/8'])]), attached_groups,
+    )
+    assert fingerprint == panoptes.aws.incremental.fingerprint_security_group(
+        security_group('sg-a', [ingress_rule(cidr_ips=['10.0.0.0/8'])]), attached_groups,
+    )
+    assert fingerprint != panoptes.aws.incremental.fingerprint_security_group(
+        security_group('sg-a', [ingress_rule(cidr_ips=['10.0.0.0/16'])]), attached_groups,
+    )
@@ -0,0 +1,50 @@
+import boto3
+import botocore.stub
+import panoptes
+
+
+def create_session():
+    return boto3.session.Session(
+        aws_access_key_id='testing',
+        aws_secret_access_key='testing',
+        region_name='us-east-1',
+    )
+
+
+def create_ipv6_association(cidr_block, state='associated'):
+    return {
+        'AssociationId': f"assoc-{state}",
+        'Ipv6CidrBlock': cidr_block,
+        'Ipv6CidrBlockState': {'State': state},
+    }
+
+
+def test_vpc_and_subnet_ranges_include_associated_ipv6_blocks():
+    session = create_session()
+    ec2 = panoptes.aws.authentication.get_client(session, 'ec2')
+    inventory = panoptes.aws.inventory.Inventory(session)
+    with botocore.stub.Stubber(ec2) as stubber:
+        stubber.add_response('describe_vpcs', {
+            'Vpcs': [{
+                'VpcId': 'vpc-1',
+                'CidrBlock': '10.0.0.0/16',
+                'Ipv6CidrBlockAssociationSet': [
+                    create_ipv6_association('2600:1f18:1::/56'),
+                    create_ipv6_association('2600:1f18:2::/56', state='disassociated'),
+                ],
+            }],
+        })
+        stubber.add_response('describe_subnets', {
+            'Subnets': [
+                {
+                    'SubnetId': 'subnet-1',
+                    'CidrBlock': '10.0.1.0/24',
+                    'Ipv6CidrBlockAssociationSet': [create_ipv6_association('2600:1f18:1:1::/64')],
+                },
+                {'SubnetId': 'subnet-2', 'CidrBlock': '10.0.2.0/24'},
+            ],
+        })
+        assert panoptes.aws.whitelist.get_vpc_ranges(inventory) == ['10.0.0.0/16', '2600:1f18:1::/56']
+        assert panoptes.aws.whitelist.get_subnet_ranges(inventory) == [
+            '10.0.1.0/24', '2600:1f18:1:1::/64', '10.0.2.0/24',
+        ]
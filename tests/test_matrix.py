@@ -0,0 +1,91 @@
+import io
+import pytest
+import yaml
+import panoptes
+
+
+def analyze(snapshot, security_group, ingress_rule):
+    groups = [
+        security_group('sg-open', [
+            ingress_rule(ip_protocol='tcp', from_port=20, to_port=3400, cidr_ips=['0.0.0.0/0']),
+            ingress_rule(ip_protocol='tcp', from_port=6379, to_port=6379, cidr_ips=['10.0.0.0/8']),
+        ]),
+        security_group('sg-all', [ingress_rule(ip_protocol='-1', from_port=None, to_port=None, cidr_ips=['10.0.0.0/8'])]),
+        security_group('sg-udp', [ingress_rule(ip_protocol='udp', from_port=53, to_port=53, cidr_ips=['0.0.0.0/0'])]),
+        security_group('sg-web', [ingress_rule(from_port=443, to_port=443, cidr_ips=['0.0.0.0/0'])]),
+    ]
+    return panoptes.aws.analysis.analyze_snapshots([snapshot(groups)])
+
+
+def test_numpy_and_python_exposure_are_the_same(snapshot, security_group, ingress_rule):
+    numpy = pytest.importorskip('numpy')
+    unsafe_groups = analyze(snapshot, security_group, ingress_rule)['SecurityGroups']['UnsafeGroups']
+    columns = panoptes.aws.matrix.generate_rule_table(unsafe_groups)
+    sensitive_ports = panoptes.aws.matrix.parse_sensitive_ports("22,3389,6379,53/udp,80")
+    python_exposure = panoptes.aws.matrix.compute_exposure_python(columns, len(unsafe_groups), sensitive_ports)
+    assert panoptes.aws.matrix.compute_exposure_numpy(
+        numpy, columns, len(unsafe_groups), sensitive_ports,
+    ) == python_exposure
+    assert python_exposure == [
+        [2, 2, 1, 0, 2],
+        [2, 2, 2, 2, 2],
+        [0, 0, 0, 2, 0],
+        [0, 0, 0, 0, 0],
+    ]
+
+
+def test_exposure_matrix_keeps_exposed_groups_only(snapshot, security_group, ingress_rule):
+    matrix = panoptes.aws.matrix.generate_exposure_matrix(
+        analyze(snapshot, security_group, ingress_rule),
+        panoptes.aws.matrix.parse_sensitive_ports("22,6379"),
+    )
+    assert [(group['GroupId'], group['Exposure']) for group in matrix['Groups']] == [
+        ('sg-open', ['alert', 'warning']),
+        ('sg-all', ['alert', 'alert']),
+    ]
+
+
+def test_parse_sensitive_ports_defaults():
+    assert panoptes.aws.matrix.parse_sensitive_ports(" 22, MyApp=8080 ,53/UDP,,") == [
+        panoptes.aws.records.SensitivePort(Name='SSH', IpProtocol='tcp', Port=22),
+        panoptes.aws.records.SensitivePort(Name='MyApp', IpProtocol='tcp', Port=8080),
+        panoptes.aws.records.SensitivePort(Name='53/udp', IpProtocol='udp', Port=53),
+    ]
+
+
+@pytest.mark.parametrize('catalog', ["ssh", "SSH=22/icmp", "70000"])
+def test_parse_sensitive_ports_rejects_invalid_entries(catalog):
+    with pytest.raises(ValueError):
+        panoptes.aws.matrix.parse_sensitive_ports(catalog)
+
+
+def test_port_labels_and_csv():
+    matrix = {
+        'Ports': [
+            {'Name': 'SSH', 'IpProtocol': 'tcp', 'Port': 22},
+            {'Name': '53/udp', 'IpProtocol': 'udp', 'Port': 53},
+        ],
+        'Groups': [
+            {
+                'GroupName': 'web',
+                'GroupId': 'sg-1',
+                'AccountId': '123456789012',
+                'Region': 'us-east-1',
+                'Exposure': ['alert', None],
+            },
+        ],
+    }
+    stream = io.StringIO()
+    panoptes.aws.matrix.write_exposure_csv(matrix, stream)
+    assert stream.getvalue().splitlines() == [
+        'AccountId,Region,GroupId,GroupName,SSH (22/tcp),53/udp',
+        '123456789012,us-east-1,sg-1,web,alert,',
+    ]
+
+
+def test_exposure_matrix_yml_round_trip(snapshot, security_group, ingress_rule):
+    analysis = analyze(snapshot, security_group, ingress_rule)
+    analysis['ExposureMatrix'] = panoptes.aws.matrix.generate_exposure_matrix(analysis)
+    assert all(type(port) is dict for port in analysis['ExposureMatrix']['Ports'])
+    output = panoptes.generic.output.print_yml(analysis)
+    assert yaml.safe_load(output)['ExposureMatrix'] == analysis['ExposureMatrix']
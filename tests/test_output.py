@@ -0,0 +1,40 @@
+import json
+import os
+import subprocess
+import sys
+import panoptes
+
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JSON_OUTPUT_PROBE = """
+import sys
+from click.testing import CliRunner
+import panoptes.panoptesctl
+result = CliRunner().invoke(panoptes.panoptesctl.main, ['aws', 'analyze', '--from-snapshot', sys.argv[1], '-o', 'json'])
+assert result.exit_code == 0, result.output
+print(",".join(name for name in ('yaml', 'colorama', 'jinja2') if name in sys.modules))
+"""
+
+
+def test_json_output_does_not_import_yaml_or_colorama(tmp_path, snapshot, security_group, ingress_rule):
+    snapshot_path = str(tmp_path / 'snapshot.json.gz')
+    panoptes.aws.snapshot.save_snapshot(
+        snapshot([security_group('sg-a', [ingress_rule(cidr_ips=['0.0.0.0/0'])])]),
+        snapshot_path,
+    )
+    probe = subprocess.run(
+        [sys.executable, '-c', JSON_OUTPUT_PROBE, snapshot_path],
+        cwd=REPOSITORY_ROOT,
+        env=dict(os.environ, PYTHONPATH=REPOSITORY_ROOT),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    assert probe.stdout.strip() == ""
+
+
+def test_print_json_sorts_keys():
+    output = panoptes.generic.output.print_json({'b': 1, 'a': 2})
+    assert json.loads(output) == {'a': 2, 'b': 1}
+    assert output.index('"a"') < output.index('"b"')
@@ -0,0 +1,69 @@
+import panoptes
+
+
+def create_cidr_sources(ingress_rules):
+    return [
+        (ingress_rule, source_field, source, panoptes.generic.whitelist.cidr_to_interval(source))
+        for ingress_rule in ingress_rules
+        for source_field, sources in (('CidrIp', ingress_rule.CidrIps), ('CidrIpv6', ingress_rule.CidrIpv6s))
+        for source in sources
+    ]
+
+
+def find_redundant_rules(ingress_rules):
+    return [
+        (source, covering_source)
+        for _, _, source, _, _, covering_source in panoptes.aws.redundancy.iter_redundant_rules(
+            create_cidr_sources(ingress_rules)
+        )
+    ]
+
+
+def test_nested_cidr_and_port_range_is_redundant(ingress_rule):
+    assert find_redundant_rules([
+        ingress_rule('tcp', 0, 65535, cidr_ips=['10.0.0.0/16']),
+        ingress_rule('tcp', 22, 22, cidr_ips=['10.0.5.7/32']),
+        ingress_rule('udp', 53, 53, cidr_ips=['10.0.5.8/32']),
+        ingress_rule('tcp', 22, 22, cidr_ips=['192.168.0.0/24']),
+    ]) == [('10.0.5.7/32', '10.0.0.0/16')]
+
+
+def test_all_traffic_covers_every_protocol(ingress_rule):
+    assert find_redundant_rules([
+        ingress_rule('udp', 53, 53, cidr_ips=['10.0.0.1/32']),
+        ingress_rule('-1', None, None, cidr_ips=['10.0.0.0/8']),
+    ]) == [('10.0.0.1/32', '10.0.0.0/8')]
+
+
+def test_identical_rules_report_all_but_the_first(ingress_rule):
+    assert find_redundant_rules([
+        ingress_rule('tcp', 443, 443, cidr_ips=['10.0.0.0/8']),
+        ingress_rule('6', 443, 443, cidr_ips=['10.0.0.0/8']),
+    ]) == [('10.0.0.0/8', '10.0.0.0/8')]
+
+
+def test_port_ranges_must_be_fully_covered(ingress_rule):
+    assert find_redundant_rules([
+        ingress_rule('tcp', 80, 443, cidr_ips=['10.0.0.0/8']),
+        ingress_rule('tcp', 440, 450, cidr_ips=['10.0.0.0/16']),
+        ingress_rule('tcp', 400, 420, cidr_ips=['10.1.0.0/16']),
+    ]) == [('10.1.0.0/16', '10.0.0.0/8')]
+
+
+def test_address_families_never_cover_each_other(ingress_rule):
+    assert find_redundant_rules([
+        ingress_rule('tcp', 443, 443, cidr_ips=['0.0.0.0/0'], cidr_ipv6s=['::/0']),
+        ingress_rule('tcp', 443, 443, cidr_ipv6s=['::ffff:0:0/96']),
+    ]) == [('::ffff:0:0/96', '::/0')]
+    assert find_redundant_rules([
+        ingress_rule('tcp', 443, 443, cidr_ipv6s=['::/0']),
+        ingress_rule('tcp', 443, 443, cidr_ips=['10.0.0.0/8']),
+    ]) == []
+
+
+def test_icmp_types_cover_their_codes(ingress_rule):
+    assert find_redundant_rules([
+        ingress_rule('icmp', 3, -1, cidr_ips=['10.0.0.0/8']),
+        ingress_rule('icmp', 3, 4, cidr_ips=['10.0.0.0/16']),
+        ingress_rule('icmp', 8, 0, cidr_ips=['10.0.0.0/16']),
+    ]) == [('10.0.0.0/16', '10.0.0.0/8')]
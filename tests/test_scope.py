@@ -0,0 +1,45 @@
+import panoptes
+
+
+def test_scope_filters_restrict_vpcs_and_groups():
+    scope = panoptes.aws.scope.create_scope(vpc_ids=['vpc-1'], group_ids=['sg-a', 'sg-b'])
+    assert panoptes.aws.scope.generate_security_group_filters(scope) == [
+        {'Name': 'vpc-id', 'Values': ['vpc-1']},
+        {'Name': 'group-id', 'Values': ['sg-a', 'sg-b']},
+    ]
+
+
+def test_scope_filters_require_every_tag_key():
+    scope = panoptes.aws.scope.create_scope(tags=['Env', 'Team'])
+    assert panoptes.aws.scope.generate_security_group_filters(scope) == [
+        {'Name': 'tag:Env', 'Values': ['*']},
+        {'Name': 'tag:Team', 'Values': ['*']},
+    ]
+
+
+def test_scope_filters_match_any_value_of_a_tag_key():
+    scope = panoptes.aws.scope.create_scope(tags=['Env=prod', 'Env=stage', 'Team', 'Team=red'])
+    assert panoptes.aws.scope.generate_security_group_filters(scope) == [
+        {'Name': 'tag:Env', 'Values': ['prod', 'stage']},
+        {'Name': 'tag:Team', 'Values': ['*']},
+    ]
+
+
+def test_unsafe_only_scope_runs_one_query_per_source_kind():
+    scope = panoptes.aws.scope.create_scope(unsafe_only=True)
+    filter_sets = panoptes.aws.scope.generate_security_group_filter_sets(scope)
+    assert [filters[-1]['Name'] for filters in filter_sets] == panoptes.aws.scope.UNSAFE_ONLY_FILTER_NAMES
+    assert not panoptes.aws.scope.is_scoped(panoptes.aws.scope.create_scope())
+
+
+def test_skipped_unused_analysis_is_reported(snapshot, security_group, ingress_rule):
+    unsafe_only_snapshot = snapshot([security_group('sg-a', [ingress_rule(cidr_ips=['0.0.0.0/0'])])])._replace(
+        AttachedGroups=None,
+    )
+    analysis = panoptes.aws.analysis.analyze_snapshots([unsafe_only_snapshot])
+    assert analysis['Metadata']['UnusedGroupsSkipped']
+    assert analysis['SecurityGroups']['UnusedGroups'] == []
+
+    output = panoptes.aws.output.print_human(analysis)
+    assert "Unused security groups analysis skipped" in output
+    assert "All security groups are attached" not in output
@@ -0,0 +1,40 @@
+import collections
+import panoptes
+
+
+HttpResponse = collections.namedtuple('HttpResponse', ['status_code'])
+
+
+def check_retry(bucket, retry_budget, status_code, error_code=None, attempts=1):
+    parsed_response = {'Error': {'Code': error_code}} if error_code else {}
+    return panoptes.aws.throttling.check_retry(
+        bucket, retry_budget, response=(HttpResponse(status_code), parsed_response), attempts=attempts,
+    )
+
+
+def test_throttling_halves_the_rate_and_retries():
+    bucket = panoptes.aws.throttling.TokenBucket(rate=20.0)
+    retry_budget = panoptes.aws.throttling.RetryBudget(capacity=10)
+    assert check_retry(bucket, retry_budget, 400, 'RequestLimitExceeded') is not None
+    assert bucket.rate == 10.0
+    check_retry(bucket, retry_budget, 400, 'Throttling')
+    assert bucket.rate == 10.0
+
+
+def test_client_errors_are_not_retried():
+    bucket = panoptes.aws.throttling.TokenBucket(rate=20.0)
+    retry_budget = panoptes.aws.throttling.RetryBudget(capacity=10)
+    assert check_retry(bucket, retry_budget, 403, 'AccessDenied') is None
+    assert check_retry(bucket, retry_budget, 503, attempts=panoptes.aws.throttling.MAX_ATTEMPTS) is None
+
+
+def test_retries_stop_when_the_budget_is_empty():
+    bucket = panoptes.aws.throttling.TokenBucket()
+    retry_budget = panoptes.aws.throttling.RetryBudget(capacity=2)
+    assert check_retry(bucket, retry_budget, 503) is not None
+    assert check_retry(bucket, retry_budget, 503) is not None
+    assert check_retry(bucket, retry_budget, 503) is None
+
+    for _ in range(int(1 / panoptes.aws.throttling.RETRY_BUDGET_REFILL) + 1):
+        assert check_retry(bucket, retry_budget, 200) is None
+    assert check_retry(bucket, retry_budget, 503) is not None
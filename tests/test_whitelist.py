@@ -0,0 +1,73 @@
+import ipaddress
+import pytest
+import panoptes
+
+
+def test_whitelist_covers_merged_entries():
+    index = panoptes.generic.whitelist.WhitelistIndex(['10.0.0.0/9', '10.128.0.0/9', '# comment', ''])
+    assert index.covers('10.0.0.0/8')
+    assert not index.covers('11.0.0.0/8')
+    assert len(index) == 1
+
+
+def test_whitelist_invalid_entry_names_file_and_line():
+    with pytest.raises(ValueError, match="^whitelist.txt, line 3: 'my-office' is not"):
+        panoptes.generic.whitelist.WhitelistIndex(['10.0.0.0/8', '# office', 'my-office'], source='whitelist.txt')
+
+
+def test_whitelist_invalid_entry_without_source_has_no_line():
+    with pytest.raises(ValueError, match="^'my-office' is not an IP or CIDR$"):
+        panoptes.generic.whitelist.WhitelistIndex().update(['10.0.0.0/8', 'my-office'])
+
+
+def test_symmetric_difference_keeps_changed_addresses():
+    previous = panoptes.generic.whitelist.WhitelistIndex(['10.0.0.0/24', '10.0.2.1'])
+    current = panoptes.generic.whitelist.WhitelistIndex(['10.0.0.0/25', '10.0.2.1', '10.0.3.1'])
+    changed = previous.symmetric_difference(current)
+    assert changed.covers('10.0.0.128/25')
+    assert changed.covers('10.0.3.1')
+    assert not changed.overlaps_interval(*panoptes.generic.whitelist.cidr_to_interval('10.0.0.0/25'))
+    assert not changed.overlaps_interval(*panoptes.generic.whitelist.cidr_to_interval('10.0.2.1'))
+
+
+def test_whitelist_keeps_address_families_apart():
+    ipv6_index = panoptes.generic.whitelist.WhitelistIndex(['::/0'])
+    assert ipv6_index.covers('2001:db8::/32')
+    assert ipv6_index.covers('::ffff:10.0.0.0/104')
+    assert not ipv6_index.covers('10.0.0.0/8')
+    assert not ipv6_index.covers('0.0.0.0/0')
+
+    ipv4_index = panoptes.generic.whitelist.WhitelistIndex(['0.0.0.0/0'])
+    assert ipv4_index.covers('10.0.0.0/8')
+    assert not ipv4_index.covers('::ffff:10.0.0.0/104')
+    assert not ipv4_index.covers('::/0')
+
+
+def test_fast_ipv4_parsing_matches_ipaddress():
+    for cidr in ['10.1.2.3', '10.1.2.3/8', '0.0.0.0/0', '255.255.255.255/32']:
+        assert panoptes.generic.whitelist.ipv4_cidr_to_interval(cidr) == panoptes.generic.whitelist.network_to_interval(
+            ipaddress.ip_network(cidr, strict=False)
+        )
+    assert panoptes.generic.whitelist.ipv4_cidr_to_interval('010.0.0.1') is None
+    assert panoptes.generic.whitelist.ipv4_cidr_to_interval('10.0.0.0/33') is None
+
+
+def test_is_anywhere_needs_a_whole_family():
+    cidr_to_interval = panoptes.generic.whitelist.cidr_to_interval
+    assert panoptes.generic.whitelist.is_anywhere([cidr_to_interval('0.0.0.0/1'), cidr_to_interval('128.0.0.0/1')])
+    assert panoptes.generic.whitelist.is_anywhere([cidr_to_interval('::/0')])
+    assert not panoptes.generic.whitelist.is_anywhere([cidr_to_interval('0.0.0.0/1'), cidr_to_interval('::/1')])
+
+
+def test_merge_intervals_collapses_overlapping_and_adjacent_intervals():
+    assert panoptes.generic.whitelist.merge_intervals([(10, 20), (0, 5), (6, 8), (15, 30), (40, 50)]) == (
+        [0, 10, 40], [8, 30, 50],
+    )
+
+
+def test_subtract_intervals():
+    intervals = ([0, 100], [50, 200])
+    removed = ([10, 40, 120], [20, 110, 130])
+    assert panoptes.generic.whitelist.subtract_intervals(intervals, removed) == [
+        (0, 9), (21, 39), (111, 119), (131, 200),
+    ]